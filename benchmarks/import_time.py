@@ -0,0 +1,145 @@
+"""
+Measure how long a fresh interpreter takes to import fileflow.
+
+Every Airflow task process and every scheduler DAG parse imports fileflow, so
+anything heavy imported at module level is paid for over and over. Run this
+from the repository root to compare import times between versions: ::
+
+    python benchmarks/import_time.py --repeat 10 --output import_time.json
+
+On Python 3.7 and newer the slowest imports, as reported by
+``python -X importtime``, are included in the results.
+
+The script exits with a non-zero status if any of HEAVY_MODULES is imported
+as a side effect of importing fileflow, or if an import is slower on average
+than ``--max-seconds``.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+# The fileflow modules DAG files and task processes import.
+MODULES = ['fileflow.task_runners', 'fileflow.storage_drivers']
+
+# Modules that must only load once they're actually used.
+HEAVY_MODULES = ['pandas', 'boto', 'airflow']
+
+LOADED_MODULES_SCRIPT = """
+import sys
+import {module}
+print(','.join(m for m in {heavy_modules!r} if m in sys.modules))
+"""
+
+
+def time_import(module, repeat):
+    """
+    Time importing the module in fresh interpreters.
+
+    :param str module: The module to import.
+    :param int repeat: The number of interpreters to time.
+    :return: The wall clock time in seconds of each run, including
+        interpreter startup.
+    :rtype: list[float]
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.time()
+        subprocess.check_call([sys.executable, '-c', 'import ' + module])
+        timings.append(time.time() - start)
+
+    return timings
+
+
+def loaded_heavy_modules(module):
+    """
+    List the heavy modules loaded as a side effect of importing the module.
+
+    :param str module: The module to import.
+    :rtype: list[str]
+    """
+    output = subprocess.check_output([
+        sys.executable,
+        '-c',
+        LOADED_MODULES_SCRIPT.format(module=module, heavy_modules=HEAVY_MODULES)
+    ])
+
+    return [m for m in output.decode('utf-8').strip().split(',') if m]
+
+
+def slowest_imports(module, count=10):
+    """
+    Get the imports with the highest cumulative time from -X importtime.
+
+    :param str module: The module to import.
+    :param int count: How many imports to return.
+    :return: (cumulative microseconds, module name) pairs, slowest first.
+        Empty before Python 3.7, which doesn't support -X importtime.
+    :rtype: list[tuple]
+    """
+    if sys.version_info < (3, 7):
+        return []
+
+    process = subprocess.Popen(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+        stderr=subprocess.PIPE
+    )
+    _, stderr = process.communicate()
+
+    imports = []
+    for line in stderr.decode('utf-8').splitlines():
+        # Lines look like "import time:       123 |       4567 |   some.module"
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imports.append((int(cumulative), name.strip()))
+
+    return sorted(imports, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help='Interpreters to time per module.')
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    parser.add_argument('--max-seconds', type=float, help='Fail if any mean import time is slower than this.')
+    args = parser.parse_args()
+
+    results = {'python': sys.version.split()[0], 'modules': {}}
+    failed = False
+
+    for module in MODULES:
+        timings = time_import(module, args.repeat)
+        mean = sum(timings) / len(timings)
+        heavy = loaded_heavy_modules(module)
+
+        results['modules'][module] = {
+            'mean_seconds': mean,
+            'min_seconds': min(timings),
+            'heavy_modules_loaded': heavy,
+            'slowest_imports': [
+                {'module': name, 'cumulative_us': cumulative}
+                for cumulative, name in slowest_imports(module)
+            ],
+        }
+
+        print('{module}: mean {mean:.3f}s, min {min:.3f}s'.format(module=module, mean=mean, min=min(timings)))
+
+        if heavy:
+            print('  eagerly imports {}'.format(', '.join(heavy)))
+            failed = True
+
+        if args.max_seconds is not None and mean > args.max_seconds:
+            print('  slower than {}s'.format(args.max_seconds))
+            failed = True
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
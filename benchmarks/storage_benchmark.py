@@ -0,0 +1,311 @@
+"""
+Benchmark the storage drivers and the TaskRunner I/O helpers.
+
+Measures throughput, latency percentiles and peak resident memory for the
+storage driver operations (``read``, ``write``, ``get_read_stream``,
+``write_from_stream`` and listing) on the local file system and on S3, and
+for ``TaskRunner.write_pandas_csv`` / ``TaskRunner.read_upstream_pandas_csv``
+across payload sizes. S3 is emulated in process with moto, so the S3 numbers
+measure fileflow and boto overhead rather than the network.
+
+Run it from the repository root with the test requirements installed: ::
+
+    python benchmarks/storage_benchmark.py --output results.json
+
+Every case runs in its own child process so peak memory is measured per case.
+Results are written as JSON. Pass the JSON from an earlier run with
+``--compare`` to print how each case's throughput has changed: ::
+
+    python benchmarks/storage_benchmark.py --output new.json --compare old.json
+"""
+
+import argparse
+import base64
+import datetime
+import io
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+DAG_ID = 'benchmark_dag'
+TASK_ID = 'benchmark_task'
+EXECUTION_DATE = datetime.datetime(2016, 1, 1)
+BUCKET_NAME = 'fileflow-benchmark'
+
+DEFAULT_SIZES = [1024, 1024 * 1024, 16 * 1024 * 1024]
+DEFAULT_ROWS = [1000, 10000, 100000]
+DEFAULT_LIST_FILES = 1000
+
+
+class FakeTaskInstance(object):
+    """
+    Just enough of an airflow TaskInstance for a TaskRunner.
+    """
+
+    def __init__(self, dag_id, task_id):
+        self.dag_id = dag_id
+        self.task_id = task_id
+
+
+def make_payload(size):
+    """
+    Make an ascii payload of the given size that doesn't compress to nothing.
+    """
+    return base64.b64encode(os.urandom(size))[:size].decode('ascii')
+
+
+def make_driver(driver_name, workdir):
+    """
+    Build the named storage driver, starting a moto S3 mock for S3.
+
+    :return: The driver and the moto mock to stop afterwards (or None).
+    """
+    from fileflow.storage_drivers import FileStorageDriver, S3StorageDriver
+
+    if driver_name == 'file':
+        return FileStorageDriver(workdir), None
+
+    import boto
+    from moto import mock_s3
+
+    mock = mock_s3()
+    mock.start()
+    boto.connect_s3().create_bucket(BUCKET_NAME)
+
+    return S3StorageDriver('', '', BUCKET_NAME), mock
+
+
+def time_calls(func, iterations):
+    """
+    Call func repeatedly and collect the latency of each call.
+
+    :return: The latencies in seconds.
+    :rtype: list[float]
+    """
+    latencies = []
+    for _ in range(iterations):
+        start = time.time()
+        func()
+        latencies.append(time.time() - start)
+
+    return latencies
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = int(round(fraction * (len(ordered) - 1)))
+
+    return ordered[index]
+
+
+def summarize(latencies, bytes_per_call):
+    total = sum(latencies)
+
+    return {
+        'iterations': len(latencies),
+        'mean_seconds': total / len(latencies),
+        'p50_seconds': percentile(latencies, 0.5),
+        'p90_seconds': percentile(latencies, 0.9),
+        'p99_seconds': percentile(latencies, 0.99),
+        'bytes_per_call': bytes_per_call,
+        'megabytes_per_second': (bytes_per_call * len(latencies) / total / 1e6) if total and bytes_per_call else None,
+    }
+
+
+def run_driver_case(driver_name, operation, size, iterations, workdir):
+    """
+    Benchmark one storage driver operation.
+    """
+    driver, mock = make_driver(driver_name, workdir)
+
+    try:
+        payload = make_payload(size)
+        driver.write(DAG_ID, TASK_ID, EXECUTION_DATE, payload)
+
+        if operation == 'write':
+            latencies = time_calls(lambda: driver.write(DAG_ID, TASK_ID, EXECUTION_DATE, payload), iterations)
+        elif operation == 'write_from_stream':
+            encoded = payload.encode('ascii')
+            latencies = time_calls(lambda: driver.write_from_stream(DAG_ID, TASK_ID, EXECUTION_DATE, io.BytesIO(encoded)), iterations)
+        elif operation == 'read':
+            latencies = time_calls(lambda: driver.read(DAG_ID, TASK_ID, EXECUTION_DATE, encoding='utf-8'), iterations)
+        elif operation == 'get_read_stream':
+            latencies = time_calls(lambda: driver.get_read_stream(DAG_ID, TASK_ID, EXECUTION_DATE).read(), iterations)
+        elif operation == 'list_filenames_in_task':
+            for day in range(size):
+                driver.write(DAG_ID, TASK_ID, EXECUTION_DATE + datetime.timedelta(days=day), 'x')
+            latencies = time_calls(lambda: driver.list_filenames_in_task(DAG_ID, TASK_ID), iterations)
+        else:
+            raise ValueError('Unknown operation {}'.format(operation))
+    finally:
+        if mock is not None:
+            mock.stop()
+
+    # Listing moves file names, not payload bytes.
+    return summarize(latencies, 0 if operation == 'list_filenames_in_task' else size)
+
+
+def run_pandas_case(driver_name, operation, rows, iterations, workdir):
+    """
+    Benchmark one TaskRunner pandas helper.
+    """
+    import pandas as pd
+    from fileflow.task_runners import TaskRunner
+
+    driver, mock = make_driver(driver_name, workdir)
+
+    try:
+        runner = TaskRunner({
+            'ti': FakeTaskInstance(DAG_ID, TASK_ID),
+            'execution_date': EXECUTION_DATE,
+            'data_dependencies': {'upstream': TASK_ID},
+        })
+        runner.storage = driver
+
+        data = pd.DataFrame({
+            'id': [str(i) for i in range(rows)],
+            'category': ['category_{}'.format(i % 20) for i in range(rows)],
+            'value': [str(i * 0.5) for i in range(rows)],
+            'text': [make_payload(32) for _ in range(rows)],
+        })
+        runner.write_pandas_csv(data)
+        size = len(driver.get_read_stream(DAG_ID, TASK_ID, EXECUTION_DATE).read())
+
+        if operation == 'write_pandas_csv':
+            latencies = time_calls(lambda: runner.write_pandas_csv(data), iterations)
+        elif operation == 'read_upstream_pandas_csv':
+            latencies = time_calls(lambda: runner.read_upstream_pandas_csv('upstream'), iterations)
+        else:
+            raise ValueError('Unknown operation {}'.format(operation))
+    finally:
+        if mock is not None:
+            mock.stop()
+
+    result = summarize(latencies, size)
+    result['rows'] = rows
+
+    return result
+
+
+def run_case_in_child(connection, case_function, args):
+    """
+    Run a case and send back its results with the process's peak memory.
+    """
+    workdir = tempfile.mkdtemp(prefix='fileflow-benchmark-')
+    try:
+        result = case_function(*(args + (workdir,)))
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        result['peak_rss_bytes'] = peak if sys.platform == 'darwin' else peak * 1024
+        connection.send(result)
+    except Exception as e:
+        connection.send({'error': repr(e)})
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        connection.close()
+
+
+def run_case(case_function, *args):
+    parent_connection, child_connection = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=run_case_in_child, args=(child_connection, case_function, args))
+    process.start()
+    result = parent_connection.recv()
+    process.join()
+
+    return result
+
+
+def compare(results, baseline):
+    """
+    Print the throughput change of every case that's in both result sets.
+    """
+    for name, result in sorted(results['cases'].items()):
+        old = baseline.get('cases', {}).get(name)
+        if not old or 'error' in result or 'error' in old:
+            continue
+
+        change = (old['mean_seconds'] - result['mean_seconds']) / old['mean_seconds'] * 100
+        print('{name}: {old:.4f}s -> {new:.4f}s mean ({change:+.1f}% faster)'.format(
+            name=name,
+            old=old['mean_seconds'],
+            new=result['mean_seconds'],
+            change=change
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--drivers', default='file,s3', help='Comma separated drivers: file, s3.')
+    parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES),
+                        help='Comma separated payload sizes in bytes.')
+    parser.add_argument('--rows', default=','.join(str(r) for r in DEFAULT_ROWS),
+                        help='Comma separated DataFrame row counts.')
+    parser.add_argument('--list-files', type=int, default=DEFAULT_LIST_FILES,
+                        help='Number of files to list in the listing benchmark.')
+    parser.add_argument('--iterations', type=int, default=10, help='Calls to time per case.')
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    parser.add_argument('--compare', help='JSON results from an earlier run to compare against.')
+    args = parser.parse_args()
+
+    import fileflow
+
+    drivers = args.drivers.split(',')
+    sizes = [int(s) for s in args.sizes.split(',')]
+    rows = [int(r) for r in args.rows.split(',')]
+
+    cases = []
+    for driver_name in drivers:
+        for operation in ['write', 'write_from_stream', 'read', 'get_read_stream']:
+            for size in sizes:
+                cases.append(('{}.{}.{}'.format(driver_name, operation, size),
+                              run_driver_case, (driver_name, operation, size, args.iterations)))
+
+        cases.append(('{}.list_filenames_in_task.{}'.format(driver_name, args.list_files),
+                      run_driver_case, (driver_name, 'list_filenames_in_task', args.list_files, args.iterations)))
+
+        for operation in ['write_pandas_csv', 'read_upstream_pandas_csv']:
+            for row_count in rows:
+                cases.append(('{}.{}.{}'.format(driver_name, operation, row_count),
+                              run_pandas_case, (driver_name, operation, row_count, args.iterations)))
+
+    results = {
+        'fileflow_version': fileflow.__version__,
+        'python': sys.version.split()[0],
+        'iterations': args.iterations,
+        'cases': {},
+    }
+
+    for name, case_function, case_args in cases:
+        result = run_case(case_function, *case_args)
+        results['cases'][name] = result
+
+        if 'error' in result:
+            print('{}: failed with {}'.format(name, result['error']))
+        else:
+            print('{name}: p50 {p50:.4f}s p99 {p99:.4f}s {throughput} peak rss {rss:.1f}MB'.format(
+                name=name,
+                p50=result['p50_seconds'],
+                p99=result['p99_seconds'],
+                throughput='{:.1f}MB/s'.format(result['megabytes_per_second'])
+                if result['megabytes_per_second'] else '',
+                rss=result['peak_rss_bytes'] / 1e6
+            ))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""
+Small helpers for running I/O bound work concurrently.
+
+Storage calls spend nearly all of their time waiting on disk or the network,
+so a pool of threads is enough to overlap them without the pickling
+constraints of a process pool.
+"""
+
+import threading
+from multiprocessing.pool import ThreadPool
+
+from .instrumentation import current_operation, get_current_operation
+
+DEFAULT_WORKERS = 8
+
+# Guards build_once. Reentrant, since building one attribute can build
+# another, eg. a task runner's storage builds its operator's. Module level,
+# because a lock on the object itself would stop airflow deep copying it.
+_build_lock = threading.RLock()
+
+
+def thread_map(func, iterable, workers=DEFAULT_WORKERS):
+    """
+    Apply func to every item of iterable using a pool of threads.
+
+    Results are returned in the same order as the input. If any call raises,
+    the exception is re-raised here once the pool has been shut down. Retries
+    in the pool's threads count against the storage operation being
+    recorded on the calling thread.
+
+    :param callable func: A function taking a single item.
+    :param iterable: The items to process.
+    :param int workers: The maximum number of threads to use. A value of 1 or
+        less runs everything serially in the calling thread.
+    :return: The results of calling func on each item.
+    :rtype: list
+    """
+    items = list(iterable)
+
+    if workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    operation = get_current_operation()
+
+    def call(item):
+        with current_operation(operation):
+            return func(item)
+
+    pool = ThreadPool(min(workers, len(items)))
+    try:
+        return pool.map(call, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def chunked(items, size):
+    """
+    Split a list into consecutive chunks of at most size items.
+
+    :param list items: The items to split.
+    :param int size: The maximum chunk size.
+    :return: A list of lists.
+    :rtype: list[list]
+    """
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def build_once(obj, attribute, build):
+    """
+    Get an attribute that is built on first use, building it with build if
+    it is still None. Threads that ask at the same time all get the one that
+    is built first.
+
+    :param object obj: The object the attribute is on.
+    :param str attribute: The attribute's name.
+    :param callable build: Builds the value, with no arguments.
+    :return: The attribute's value.
+    """
+    value = getattr(obj, attribute)
+
+    if value is None:
+        with _build_lock:
+            value = getattr(obj, attribute)
+            if value is None:
+                value = build()
+                setattr(obj, attribute, value)
+
+    return value
@@ -3,8 +3,9 @@ Extend from the airflow configuration and address any missing fileflow related c
 """
 
 from airflow import configuration as airflow_configuration
+import collections
 import os
-import boto
+import threading
 
 
 def _ensure_section_exists(section_name):
@@ -42,25 +43,115 @@ if not airflow_configuration.has_option('fileflow', 'storage_type'):
 if not airflow_configuration.has_option('fileflow', 'aws_bucket_name'):
     airflow_configuration.set('fileflow', 'aws_bucket_name', 'mybeautifulbucket')
 
-# For AWS keys, check the AIRFLOW__ style environment variables first
-# Otherwise, fallback to the boto configuration
-aws_access_key_id_env_var = os.environ.get('AIRFLOW__FILEFLOW__AWS_ACCESS_KEY_ID', False)
-aws_secret_access_key_env_var = os.environ.get('AIRFLOW__FILEFLOW__AWS_SECRET_ACCESS_KEY', False)
-boto_config = boto.pyami.config.Config()
+# How finely execution dates are told apart in file names: day, hour, minute,
+# second or microsecond. DAGs that run more than daily need a finer granularity,
+# or each run overwrites the last one's output for the day.
+if not airflow_configuration.has_option('fileflow', 'execution_date_granularity'):
+    airflow_configuration.set('fileflow', 'execution_date_granularity', 'day')
 
-if not airflow_configuration.has_option('fileflow', 'aws_access_key_id'):
-    if aws_access_key_id_env_var:
-        airflow_configuration.set('fileflow', 'aws_access_key_id', aws_access_key_id_env_var)
-    else:
-        boto_aws_access_key_id_default = boto_config.get('Credentials', 'aws_access_key_id')
-        airflow_configuration.set('fileflow', 'aws_access_key_id', boto_aws_access_key_id_default)
+# The memory cap in bytes for the in-memory storage driver. 0 means no cap.
+if not airflow_configuration.has_option('fileflow', 'memory_max_bytes'):
+    airflow_configuration.set('fileflow', 'memory_max_bytes', '0')
 
-if not airflow_configuration.has_option('fileflow', 'aws_secret_access_key'):
-    if aws_secret_access_key_env_var:
-        airflow_configuration.set('fileflow', 'aws_secret_access_key', aws_secret_access_key_env_var)
-    else:
-        boto_aws_secret_access_key_default = boto_config.get('Credentials', 'aws_secret_access_key')
-        airflow_configuration.set('fileflow', 'aws_secret_access_key', boto_aws_secret_access_key_default)
+# Comma separated I/O observers to report storage operations to. Empty turns
+# instrumentation off. See fileflow.instrumentation.
+if not airflow_configuration.has_option('fileflow', 'io_observers'):
+    airflow_configuration.set('fileflow', 'io_observers', '')
+
+if not airflow_configuration.has_option('fileflow', 'statsd_host'):
+    airflow_configuration.set('fileflow', 'statsd_host', 'localhost')
+
+if not airflow_configuration.has_option('fileflow', 'statsd_port'):
+    airflow_configuration.set('fileflow', 'statsd_port', '8125')
+
+if not airflow_configuration.has_option('fileflow', 'statsd_prefix'):
+    airflow_configuration.set('fileflow', 'statsd_prefix', 'fileflow')
+
+if not airflow_configuration.has_option('fileflow', 'prometheus_textfile_dir'):
+    airflow_configuration.set('fileflow', 'prometheus_textfile_dir', '/var/lib/node_exporter/textfile_collector')
+
+# Retrying of transient S3 failures. See fileflow.retry.
+# How many times to try each request, including the first.
+if not airflow_configuration.has_option('fileflow', 's3_retry_attempts'):
+    airflow_configuration.set('fileflow', 's3_retry_attempts', '5')
+
+# The longest wait in seconds before the first retry; doubles each retry up to the max.
+if not airflow_configuration.has_option('fileflow', 's3_retry_base_delay'):
+    airflow_configuration.set('fileflow', 's3_retry_base_delay', '0.1')
+
+if not airflow_configuration.has_option('fileflow', 's3_retry_max_delay'):
+    airflow_configuration.set('fileflow', 's3_retry_max_delay', '20')
+
+# Retries allowed per request made, on top of a fixed allowance of s3_retry_budget_min.
+if not airflow_configuration.has_option('fileflow', 's3_retry_budget_ratio'):
+    airflow_configuration.set('fileflow', 's3_retry_budget_ratio', '0.2')
+
+if not airflow_configuration.has_option('fileflow', 's3_retry_budget_min'):
+    airflow_configuration.set('fileflow', 's3_retry_budget_min', '10')
+
+# The S3 key layout version new keys are written with. 1 is <dag_id>/<task_id>/<date>;
+# 2 puts a hashed shard first to spread parallel tasks across S3 prefixes.
+if not airflow_configuration.has_option('fileflow', 's3_key_layout_version'):
+    airflow_configuration.set('fileflow', 's3_key_layout_version', '1')
+
+# Comma separated layout versions to also look for existing keys in.
+if not airflow_configuration.has_option('fileflow', 's3_legacy_key_layout_versions'):
+    airflow_configuration.set('fileflow', 's3_legacy_key_layout_versions', '1')
+
+# The starting rate, in requests per second, of the adaptive S3 rate limiter
+# shared by every thread in a process. 0 turns rate limiting off. See fileflow.rate_limit.
+if not airflow_configuration.has_option('fileflow', 's3_rate_limit'):
+    airflow_configuration.set('fileflow', 's3_rate_limit', '0')
+
+if not airflow_configuration.has_option('fileflow', 's3_rate_limit_min'):
+    airflow_configuration.set('fileflow', 's3_rate_limit_min', '1')
+
+if not airflow_configuration.has_option('fileflow', 's3_rate_limit_max'):
+    airflow_configuration.set('fileflow', 's3_rate_limit_max', '3500')
+
+# The node-local directory the handoff storage type keeps copies of outputs
+# in, shared by the tasks on a worker, and how big it can get in bytes.
+if not airflow_configuration.has_option('fileflow', 'handoff_dir'):
+    airflow_configuration.set('fileflow', 'handoff_dir', '/tmp/fileflow_handoff')
+
+if not airflow_configuration.has_option('fileflow', 'handoff_max_bytes'):
+    airflow_configuration.set('fileflow', 'handoff_max_bytes', str(10 * 1024 * 1024 * 1024))
+
+# Limits on the writes of a task with async_writes turned on that are
+# waiting to upload: their total size in bytes, and how many there are.
+if not airflow_configuration.has_option('fileflow', 'async_write_max_bytes'):
+    airflow_configuration.set('fileflow', 'async_write_max_bytes', str(256 * 1024 * 1024))
+
+if not airflow_configuration.has_option('fileflow', 'async_write_max_pending'):
+    airflow_configuration.set('fileflow', 'async_write_max_pending', '64')
+
+# The AWS credential settings, which get defaults from the environment or boto.
+AWS_CREDENTIAL_KEYS = ['aws_access_key_id', 'aws_secret_access_key']
+
+
+def _ensure_aws_credentials():
+    """
+    Fill in any missing AWS credential settings.
+
+    For AWS keys, check the AIRFLOW__ style environment variables first.
+    Otherwise, fallback to the boto configuration. Loading the boto
+    configuration means importing boto and reading its config files, so this
+    only happens when the credentials are first asked for rather than every
+    time fileflow is imported.
+    """
+    for key in AWS_CREDENTIAL_KEYS:
+        if airflow_configuration.has_option('fileflow', key):
+            continue
+
+        env_var = os.environ.get('AIRFLOW__FILEFLOW__' + key.upper(), False)
+
+        if env_var:
+            airflow_configuration.set('fileflow', key, env_var)
+        else:
+            import boto
+
+            boto_config = boto.pyami.config.Config()
+            airflow_configuration.set('fileflow', key, boto_config.get('Credentials', key))
 
 
 def get(section, key, **kwargs):
@@ -72,7 +163,112 @@ def get(section, key, **kwargs):
     :param kwargs: Not expected
     :return:
     """
+    if section == 'fileflow' and key in AWS_CREDENTIAL_KEYS:
+        _ensure_aws_credentials()
+
     # traversing through the airflow configuration module (aliased here as airflow_configuration)
     # to the actual ConfigParser subclass (conf)
     # to get to it's get() method
     return airflow_configuration.conf.get(section, key, **kwargs)
+
+
+def _text(value):
+    return value
+
+
+def _split_names(value):
+    return tuple(name.strip() for name in value.split(',') if name.strip())
+
+
+# The fileflow settings parsed by get_settings, and how to parse each one.
+# The AWS credentials are left out, since looking up their defaults can mean
+# importing boto; use get for those.
+SETTINGS_PARSERS = collections.OrderedDict([
+    ('environment', _text),
+    ('storage_prefix', _text),
+    ('storage_type', _text),
+    ('aws_bucket_name', _text),
+    ('execution_date_granularity', _text),
+    ('memory_max_bytes', int),
+    ('io_observers', _split_names),
+    ('statsd_host', _text),
+    ('statsd_port', int),
+    ('statsd_prefix', _text),
+    ('prometheus_textfile_dir', _text),
+    ('s3_retry_attempts', int),
+    ('s3_retry_base_delay', float),
+    ('s3_retry_max_delay', float),
+    ('s3_retry_budget_ratio', float),
+    ('s3_retry_budget_min', int),
+    ('s3_key_layout_version', _text),
+    ('s3_legacy_key_layout_versions', _split_names),
+    ('s3_rate_limit', float),
+    ('s3_rate_limit_min', float),
+    ('s3_rate_limit_max', float),
+    ('handoff_dir', _text),
+    ('handoff_max_bytes', int),
+    ('async_write_max_bytes', int),
+    ('async_write_max_pending', int),
+])
+
+
+class FileflowSettings(collections.namedtuple('FileflowSettings', list(SETTINGS_PARSERS))):
+    """
+    The fileflow settings, parsed into python values. Immutable, so one
+    instance can be shared by every task and thread in a process.
+
+    Comma separated settings, io_observers and s3_legacy_key_layout_versions,
+    are tuples of names.
+    """
+    __slots__ = ()
+
+
+_settings = None
+_settings_lock = threading.Lock()
+
+
+def get_settings():
+    """
+    Get the fileflow settings, which are read and parsed the first time they
+    are asked for and then kept for the life of the process.
+
+    :rtype: FileflowSettings
+    """
+    global _settings
+
+    settings = _settings
+
+    if settings is None:
+        with _settings_lock:
+            if _settings is None:
+                _settings = FileflowSettings(**dict(
+                    (key, parse(get('fileflow', key))) for key, parse in SETTINGS_PARSERS.items()
+                ))
+            settings = _settings
+
+    return settings
+
+
+def set_settings(settings):
+    """
+    Use the given settings for the rest of the process instead of reading
+    the configuration, eg. in a worker process started with its parent's
+    settings.
+
+    :param FileflowSettings settings: The settings.
+    """
+    global _settings
+
+    with _settings_lock:
+        _settings = settings
+
+
+def reset_settings():
+    """
+    Forget the parsed settings, so the next :py:func:`get_settings` reads
+    the configuration again, eg. after a test changes it.
+    """
+    global _settings
+
+    with _settings_lock:
+        _settings = None
@@ -0,0 +1,389 @@
+"""
+Record what every storage operation costs.
+
+When the ``io_observers`` setting in the fileflow section of airflow.cfg lists
+any observers, each :py:class:`~fileflow.task_runners.TaskRunner` wraps its
+storage driver in an
+:py:class:`~fileflow.storage_drivers.instrumented_storage_driver.InstrumentedStorageDriver`.
+The wrapper hands an :py:class:`IOEvent` to every observer for each read,
+write, list and delete, and tells them when the task finishes. With no
+observers configured nothing is wrapped, so there's no overhead.
+
+The built in observers are:
+
+* ``log``: logs a per operation summary when the task finishes.
+* ``statsd``: sends timings and counters to StatsD over UDP, configured with
+  ``statsd_host``, ``statsd_port`` and ``statsd_prefix``.
+* ``prometheus``: writes a file for the node exporter's textfile collector
+  into ``prometheus_textfile_dir`` when the task finishes.
+
+Anything else is treated as a ``'module:attribute'`` path to an
+:py:class:`IOObserver` subclass, which is instantiated with no arguments.
+
+Storage drivers can annotate the operation in progress with
+:py:func:`note_retry` and :py:func:`note_cache_hit`. These are no-ops when
+the operation isn't being recorded. Work that
+:py:func:`~fileflow.concurrency.thread_map` hands to other threads still
+counts against the operation that started it.
+"""
+
+import contextlib
+import importlib
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+
+_local = threading.local()
+
+
+class IOEvent(object):
+    """
+    A single storage operation.
+
+    :ivar str operation: The storage driver method, eg. 'read'.
+    :ivar str dag_id: The DAG ID of the file operated on, if any.
+    :ivar str task_id: The task ID of the file operated on, if any.
+    :ivar datetime.datetime execution_date: The execution date of the file
+        operated on, if any.
+    :ivar str path: The listed path, for list operations.
+    :ivar int bytes: The bytes moved, when known.
+    :ivar float duration: The wall clock time taken in seconds.
+    :ivar int retries: How many times a request was retried.
+    :ivar bool cache_hit: Whether a cache served the operation, or None if no
+        cache was involved.
+    :ivar str error: The name of the exception raised, if the operation failed.
+    :ivar dict tags: The dag_id, task_id and execution_date of the task
+        instance that performed the operation.
+    """
+
+    def __init__(self, operation, dag_id=None, task_id=None, execution_date=None, path=None, tags=None):
+        self.operation = operation
+        self.dag_id = dag_id
+        self.task_id = task_id
+        self.execution_date = execution_date
+        self.path = path
+        self.tags = tags or {}
+        self.bytes = None
+        self.duration = None
+        self.retries = 0
+        self.cache_hit = None
+        self.error = None
+        # Guards retries, which threads working on the operation together
+        # can count at the same time.
+        self._lock = threading.Lock()
+
+    def add_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def __repr__(self):
+        return '<IOEvent {operation} {target} bytes={bytes} duration={duration:.4f}s retries={retries}>'.format(
+            operation=self.operation,
+            target=self.path or '/'.join(str(part) for part in [self.dag_id, self.task_id, self.execution_date]),
+            bytes=self.bytes,
+            duration=self.duration or 0.0,
+            retries=self.retries
+        )
+
+
+@contextlib.contextmanager
+def recorded_operation(event):
+    """
+    Time an operation and make its event the target of :py:func:`note_retry`
+    and :py:func:`note_cache_hit` on this thread while it runs.
+
+    .. code-block:: python
+
+        event = IOEvent('read', dag_id, task_id, execution_date)
+        with recorded_operation(event):
+            data = driver.read(dag_id, task_id, execution_date)
+            event.bytes = len(data)
+
+    :param IOEvent event: The event to fill in.
+    """
+    start = time.time()
+    try:
+        with current_operation(event):
+            yield event
+    except Exception as e:
+        event.error = type(e).__name__
+        raise
+    finally:
+        event.duration = time.time() - start
+
+
+def get_current_operation():
+    """
+    :return: The event of the operation being recorded on this thread, if
+        any.
+    :rtype: IOEvent | None
+    """
+    return getattr(_local, 'event', None)
+
+
+@contextlib.contextmanager
+def current_operation(event):
+    """
+    Make an event the target of :py:func:`note_retry` and
+    :py:func:`note_cache_hit` on this thread, eg. in a worker thread doing
+    part of another thread's operation.
+
+    :param IOEvent event: The event, or None to note nothing.
+    """
+    previous = getattr(_local, 'event', None)
+    _local.event = event
+    try:
+        yield event
+    finally:
+        _local.event = previous
+
+
+def note_retry():
+    """
+    Count a retry against the operation being recorded on this thread.
+    """
+    event = getattr(_local, 'event', None)
+    if event is not None:
+        event.add_retry()
+
+
+def note_cache_hit(hit):
+    """
+    Mark whether a cache served the operation being recorded on this thread.
+
+    :param bool hit: True for a hit, False for a miss.
+    """
+    event = getattr(_local, 'event', None)
+    if event is not None:
+        event.cache_hit = hit
+
+
+class IOObserver(object):
+    """
+    Base class for anything that wants to see storage operations.
+    """
+
+    def record(self, event):
+        """
+        Called after every storage operation, including failed ones.
+
+        :param IOEvent event: The operation.
+        """
+        pass
+
+    def task_finished(self, tags):
+        """
+        Called once the task's method has returned and its output is stored.
+
+        :param dict tags: The dag_id, task_id and execution_date of the task
+            instance.
+        """
+        pass
+
+
+class _OperationTotals(object):
+    """
+    Running totals for one kind of operation.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.retries = 0
+        self.cache_hits = 0
+        self.errors = 0
+
+    def add(self, event):
+        self.count += 1
+        self.bytes += event.bytes or 0
+        self.seconds += event.duration or 0.0
+        self.retries += event.retries
+        self.cache_hits += 1 if event.cache_hit else 0
+        self.errors += 1 if event.error else 0
+
+
+class _TotalsObserver(IOObserver):
+    """
+    Keeps per operation totals for the observers that report at task end.
+    """
+
+    def __init__(self):
+        self.totals = {}
+        self._lock = threading.Lock()
+
+    def record(self, event):
+        with self._lock:
+            self.totals.setdefault(event.operation, _OperationTotals()).add(event)
+
+    def pop_totals(self):
+        with self._lock:
+            totals = self.totals
+            self.totals = {}
+        return totals
+
+
+class LogSummaryObserver(_TotalsObserver):
+    """
+    Logs a one line summary per operation when the task finishes.
+    """
+
+    def task_finished(self, tags):
+        for operation, totals in sorted(self.pop_totals().items()):
+            logging.info(
+                'fileflow I/O for %s.%s %s: %s x%d, %d bytes, %.3fs, %d retries, %d cache hits, %d errors',
+                tags.get('dag_id'), tags.get('task_id'), tags.get('execution_date'), operation,
+                totals.count, totals.bytes, totals.seconds, totals.retries, totals.cache_hits, totals.errors
+            )
+
+
+class MemoryObserver(IOObserver):
+    """
+    Keeps every event in a list. Useful in tests.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.finished = []
+
+    def record(self, event):
+        self.events.append(event)
+
+    def task_finished(self, tags):
+        self.finished.append(tags)
+
+
+class StatsdObserver(IOObserver):
+    """
+    Sends a timing and counters to StatsD for every operation.
+
+    Metrics are named ``<prefix>.<dag_id>.<task_id>.<operation>.<metric>``.
+    Sending is fire and forget over UDP, so a missing StatsD server never
+    fails a task.
+    """
+
+    def __init__(self, host='localhost', port=8125, prefix='fileflow'):
+        self.address = (host, int(port))
+        self.prefix = prefix
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def record(self, event):
+        name = '.'.join(_metric_name_part(part) for part in [
+            self.prefix, event.tags.get('dag_id'), event.tags.get('task_id'), event.operation
+        ])
+
+        lines = ['{}.duration:{:.3f}|ms'.format(name, (event.duration or 0.0) * 1000)]
+        if event.bytes:
+            lines.append('{}.bytes:{}|c'.format(name, event.bytes))
+        if event.retries:
+            lines.append('{}.retries:{}|c'.format(name, event.retries))
+        if event.cache_hit is not None:
+            lines.append('{}.{}:1|c'.format(name, 'cache_hit' if event.cache_hit else 'cache_miss'))
+        if event.error:
+            lines.append('{}.errors:1|c'.format(name))
+
+        try:
+            self._socket.sendto('\n'.join(lines).encode('utf-8'), self.address)
+        except socket.error:
+            logging.debug('Could not send fileflow I/O metrics to StatsD at %s:%s', *self.address)
+
+
+class PrometheusTextfileObserver(_TotalsObserver):
+    """
+    Writes the task's totals in the Prometheus text format when the task
+    finishes, for the node exporter's textfile collector to pick up.
+
+    Each task gets its own file, ``<dag_id>__<task_id>.prom``, which is
+    replaced atomically.
+    """
+
+    METRICS = [
+        ('fileflow_io_operations_total', 'count', 'Storage operations by the last run of the task.'),
+        ('fileflow_io_bytes_total', 'bytes', 'Bytes moved by the last run of the task.'),
+        ('fileflow_io_seconds_total', 'seconds', 'Seconds spent in storage operations by the last run of the task.'),
+        ('fileflow_io_retries_total', 'retries', 'Retried storage requests in the last run of the task.'),
+        ('fileflow_io_cache_hits_total', 'cache_hits', 'Storage operations served from a cache in the last run of the task.'),
+        ('fileflow_io_errors_total', 'errors', 'Failed storage operations in the last run of the task.'),
+    ]
+
+    def __init__(self, directory):
+        super(PrometheusTextfileObserver, self).__init__()
+        self.directory = directory
+
+    def task_finished(self, tags):
+        totals = self.pop_totals()
+
+        lines = []
+        for metric, attribute, help_text in self.METRICS:
+            lines.append('# HELP {} {}'.format(metric, help_text))
+            lines.append('# TYPE {} gauge'.format(metric))
+            for operation, operation_totals in sorted(totals.items()):
+                lines.append('{metric}{{dag_id="{dag_id}",task_id="{task_id}",operation="{operation}"}} {value}'.format(
+                    metric=metric,
+                    dag_id=_label_value(tags.get('dag_id')),
+                    task_id=_label_value(tags.get('task_id')),
+                    operation=_label_value(operation),
+                    value=getattr(operation_totals, attribute)
+                ))
+
+        filename = os.path.join(self.directory, '{}__{}.prom'.format(tags.get('dag_id'), tags.get('task_id')))
+
+        # Write then rename so the collector never sees a partial file.
+        fd, temp_filename = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        # mkstemp makes the file readable only by us, and the collector may
+        # run as another user.
+        os.fchmod(fd, 0o644)
+        with os.fdopen(fd, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.rename(temp_filename, filename)
+
+
+def _label_value(value):
+    """
+    Escape a Prometheus label value, as the text format requires.
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _metric_name_part(value):
+    return ''.join(c if c.isalnum() or c in '_-' else '_' for c in str(value))
+
+
+def get_io_observers(names=None):
+    """
+    Build the configured I/O observers.
+
+    :param str names: Comma separated observer names. Defaults to the
+        ``io_observers`` setting.
+    :return: The observers, or an empty list if instrumentation is off.
+    :rtype: list[IOObserver]
+    """
+    from fileflow.configuration import get_settings
+
+    settings = get_settings()
+
+    if names is None:
+        names = settings.io_observers
+    else:
+        names = [n.strip() for n in names.split(',') if n.strip()]
+
+    observers = []
+    for name in names:
+        if name == 'log':
+            observers.append(LogSummaryObserver())
+        elif name == 'statsd':
+            observers.append(StatsdObserver(
+                host=settings.statsd_host,
+                port=settings.statsd_port,
+                prefix=settings.statsd_prefix
+            ))
+        elif name == 'prometheus':
+            observers.append(PrometheusTextfileObserver(settings.prometheus_textfile_dir))
+        else:
+            module_name, attribute = name.split(':')
+            observers.append(getattr(importlib.import_module(module_name), attribute)())
+
+    return observers
@@ -1,4 +1,5 @@
 from dive_operator import DiveOperator
 from dive_python_operator import DivePythonOperator
+from dive_storage_sensor import DiveStorageSensor
 
-__all__ = ['DiveOperator', 'DivePythonOperator']
+__all__ = ['DiveOperator', 'DivePythonOperator', 'DiveStorageSensor']
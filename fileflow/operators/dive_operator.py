@@ -8,6 +8,7 @@
 
 from airflow.operators import BaseOperator
 
+from fileflow.concurrency import build_once
 from fileflow.storage_drivers import get_storage_driver
 
 
@@ -38,9 +39,8 @@ class DiveOperator(BaseOperator):
         is not deep-copyable which causes errors with airflow clear and airflow backfill which both try to deep copy
         a target DAG and all its operators, so we only want this property when we actually use it.
         """
-        if self._storage is None:
-            self._storage = get_storage_driver()
-        return self._storage
+        # The task runner's threads can ask for it at the same time.
+        return build_once(self, '_storage', get_storage_driver)
 
     @storage.setter
     def storage(self, value):
@@ -6,26 +6,136 @@
 .. moduleauthor:: Miriam Sexton <miriam@industrydive.com>
 """
 
+import json
+import logging
+
 from airflow.operators import PythonOperator
 
 from .dive_operator import DiveOperator
+from fileflow import profiling
 
 
 class DivePythonOperator(DiveOperator, PythonOperator):
     """
     Python operator that can send along data dependencies to its callable.
     Generates the callable by initializing its python object and calling its method.
+
+    The task runner shares the operator's storage driver, which is only built
+    when the runner first uses it. Set the operator's ``storage`` to have the
+    runner use a particular driver.
+
+    Pass ``async_writes=True`` to have the task runner's writes upload in
+    the background while the python method carries on; see
+    :py:class:`~fileflow.storage_drivers.write_behind_storage_driver.WriteBehindStorageDriver`.
+    The task still only succeeds once every write is stored.
+
+    Pass ``profile=True`` to time the phases of the task and save a report
+    alongside its output; see :py:mod:`fileflow.profiling`.
     """
 
-    def __init__(self, python_object, python_method="run", *args, **kwargs):
+    def __init__(self, python_object, python_method="run", profile=False, profile_cprofile=False,
+                 profile_tracemalloc=False, async_writes=False, *args, **kwargs):
+        """
+        :param bool profile: Time the phases of the task and store a report
+            as the task's ``profile`` named output.
+        :param bool profile_cprofile: Also run the python method under cProfile.
+            Implies profile.
+        :param bool profile_tracemalloc: Also trace the python method's memory
+            allocations (Python 3.4+). Implies profile.
+        :param bool async_writes: Upload the task runner's writes in the
+            background, waiting for them all when the python method returns.
+        """
         self.python_object = python_object
         self.python_method = python_method
+        self.async_writes = async_writes
         kwargs['python_callable'] = None
 
+        self.profile = profile or profile_cprofile or profile_tracemalloc
+        self.profile_cprofile = profile_cprofile
+        self.profile_tracemalloc = profile_tracemalloc
+
+        # The instantiated python_object; set up by pre_execute
+        self.task_runner = None
+        # The running TaskProfiler, if profiling
+        self.profiler = None
+
         super(DivePythonOperator, self).__init__(*args, **kwargs)
 
     def pre_execute(self, context):
+        if self.profile:
+            self.profiler = profiling.TaskProfiler(
+                cprofile=self.profile_cprofile,
+                tracemalloc=self.profile_tracemalloc
+            )
+            self.profiler.start()
+
         context.update(self.op_kwargs)
         context.update({"data_dependencies": self.data_dependencies})
-        instantiated_object = self.python_object(context)
-        self.python_callable = getattr(instantiated_object, self.python_method)
+        # Hand over the operator's driver rather than have the runner build a
+        # second one, with its own connection and bucket lookup. One set on
+        # the operator is handed over as is, so the runner knows it wasn't
+        # built from the settings.
+        if self._storage is not None:
+            context.update({"storage": self._storage})
+        else:
+            context.update({"storage_factory": lambda: self.storage})
+        context.update({"async_writes": self.async_writes})
+
+        try:
+            with profiling.phase('instantiate'):
+                self.task_runner = self.python_object(context)
+            self.python_callable = getattr(self.task_runner, self.python_method)
+        except Exception:
+            # execute won't run, so nothing else will stop the profiler.
+            if self.profiler is not None:
+                self.profiler.stop()
+                self.profiler = None
+            raise
+
+    def execute(self, context):
+        try:
+            with profiling.phase('run'):
+                if self.profiler is not None:
+                    result = self.profiler.profile_call(super(DivePythonOperator, self).execute, context)
+                else:
+                    result = super(DivePythonOperator, self).execute(context)
+
+            # Don't let the task succeed until its output is safely stored.
+            with profiling.phase('finish'):
+                self.task_runner.finish()
+        finally:
+            if self.profiler is not None:
+                self._save_profile()
+
+        return result
+
+    def _save_profile(self):
+        """
+        Stop the profiler, log its summary and store its report.
+
+        Failing to store the report is logged rather than raised, so it never
+        fails a task or hides the task's own error.
+        """
+        profiler = self.profiler
+        self.profiler = None
+        profiler.stop()
+
+        task_instance = self.task_runner.task_instance
+        report = profiler.report({
+            'dag_id': task_instance.dag_id,
+            'task_id': task_instance.task_id,
+            'execution_date': self.task_runner.date,
+        })
+
+        logging.info('Profile of %s.%s:\n%s', task_instance.dag_id, task_instance.task_id, profiler.summary())
+
+        try:
+            self.task_runner.write_file(
+                json.dumps(report, default=str, sort_keys=True),
+                content_type='application/json',
+                name=profiling.PROFILE_OUTPUT_NAME
+            )
+            # The report is written after the task's writes were flushed.
+            self.task_runner.flush()
+        except Exception:
+            logging.exception('Could not store the profile of %s.%s', task_instance.dag_id, task_instance.task_id)
@@ -0,0 +1,121 @@
+"""
+.. module:: operators.dive_storage_sensor
+    :synopsis: DiveStorageSensor, which waits for upstream outputs to be stored
+"""
+
+import logging
+import time
+
+from airflow.exceptions import AirflowSensorTimeout, AirflowSkipException
+
+from .dive_operator import DiveOperator
+
+
+class DiveStorageSensor(DiveOperator):
+    """
+    Wait until the outputs of the tasks in ``data_dependencies`` exist in
+    storage.
+
+    Unlike an ExternalTaskSensor, which polls the Airflow metadata database
+    for task states, this asks the storage driver whether the outputs have
+    been written, so waiting on other DAGs costs the scheduler nothing. All
+    the outstanding outputs are checked in one batch with
+    :py:meth:`~fileflow.storage_drivers.storage_driver.StorageDriver.exists_many`,
+    which only needs metadata requests, and outputs that have turned up
+    aren't checked again. The wait between checks doubles (by default) each
+    time, up to ``max_poke_interval``, so long waits cost few requests.
+
+    .. code-block:: python
+
+        wait_for_sales = DiveStorageSensor(
+            task_id='wait_for_sales',
+            external_dag_id='sales_import',
+            data_dependencies={'sales': 'clean_sales', 'regions': 'load_regions'},
+            dag=dag
+        )
+    """
+
+    ui_color = '#e6f1f2'
+
+    def __init__(self, external_dag_id=None, execution_delta=None, poke_interval=30, max_poke_interval=30 * 60,
+                 backoff=2, timeout=60 * 60 * 24 * 7, soft_fail=False, *args, **kwargs):
+        """
+        :param str external_dag_id: The DAG the upstream tasks are in.
+            Defaults to this sensor's DAG.
+        :param datetime.timedelta execution_delta: How far before this task
+            instance's execution date the upstream execution date is, for
+            DAGs on different schedules.
+        :param float poke_interval: Seconds to wait after the first check.
+        :param float max_poke_interval: The longest wait between checks.
+        :param float backoff: What the wait is multiplied by after each check.
+        :param float timeout: Seconds to wait in all before giving up.
+        :param bool soft_fail: Skip the task, rather than failing it, on
+            timeout.
+        """
+        self.external_dag_id = external_dag_id
+        self.execution_delta = execution_delta
+        self.poke_interval = poke_interval
+        self.max_poke_interval = max_poke_interval
+        self.backoff = backoff
+        self.timeout = timeout
+        self.soft_fail = soft_fail
+
+        # The (dag_id, task_id, execution_date) outputs still missing; set
+        # up by the first poke of each execute.
+        self._pending = None
+
+        super(DiveStorageSensor, self).__init__(*args, **kwargs)
+
+    def get_task_instances(self, context):
+        """
+        The upstream task instances whose outputs the sensor waits for.
+
+        :param dict context: The Airflow context.
+        :return: (dag_id, task_id, execution_date) tuples.
+        :rtype: list[tuple]
+        """
+        dag_id = self.external_dag_id or self.dag_id
+        execution_date = context['execution_date']
+
+        if self.execution_delta is not None:
+            execution_date -= self.execution_delta
+
+        return [(dag_id, task_id, execution_date) for task_id in sorted(set(self.data_dependencies.values()))]
+
+    def poke(self, context):
+        """
+        Check whether the outputs still missing have been stored.
+
+        :return: True once every output exists.
+        :rtype: bool
+        """
+        if self._pending is None:
+            self._pending = self.get_task_instances(context)
+
+        found = self.storage.exists_many(self._pending)
+        self._pending = [task_instance for task_instance, exists in zip(self._pending, found) if not exists]
+
+        if self._pending:
+            logging.info('Waiting for %s', ', '.join(self.storage.get_filename(*task_instance)
+                                                     for task_instance in self._pending))
+
+        return not self._pending
+
+    def execute(self, context):
+        self._pending = None
+        started = time.time()
+        interval = self.poke_interval
+
+        while not self.poke(context):
+            remaining = self.timeout - (time.time() - started)
+
+            if remaining <= 0:
+                message = 'Timed out waiting for {} upstream outputs.'.format(len(self._pending))
+                if self.soft_fail:
+                    raise AirflowSkipException(message)
+                raise AirflowSensorTimeout(message)
+
+            time.sleep(min(interval, remaining))
+            interval = min(interval * self.backoff, self.max_poke_interval)
+
+        logging.info('Success criteria met. Exiting.')
@@ -0,0 +1,231 @@
+"""
+Time the phases of a fileflow task.
+
+Profiling is opt-in per task with ``DivePythonOperator(..., profile=True)``.
+While a :py:class:`TaskProfiler` is running, every :py:func:`phase` block in
+fileflow adds to its timings: instantiating the TaskRunner, the task's
+method, storage reads and writes, CSV parsing, null cleaning,
+serialization and the final flush. Phases nest, and each phase reports both
+its total time and its own time excluding nested phases, so the ``run``
+phase's own time is the time spent in user code.
+
+When no profiler is running, :py:func:`phase` does nothing.
+
+The task's method can also be run under :py:mod:`cProfile` and, on Python
+3.4 and newer, :py:mod:`tracemalloc`. The report is logged and saved as a
+JSON named output of the task, ``PROFILE_OUTPUT_NAME``, so slow runs can be
+looked at later.
+"""
+
+import contextlib
+import logging
+import threading
+import time
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+# The named output a task's profile report is stored as.
+PROFILE_OUTPUT_NAME = 'profile'
+
+# How many entries of the cProfile and tracemalloc statistics to keep.
+TOP_ENTRIES = 25
+
+_active = None
+
+
+@contextlib.contextmanager
+def phase(name):
+    """
+    Time a block of code as the named phase of the running profiler.
+
+    :param str name: The phase name, eg. 'csv_parse'.
+    """
+    profiler = _active
+
+    if profiler is None:
+        yield
+        return
+
+    profiler.enter(name)
+    try:
+        yield
+    finally:
+        profiler.exit()
+
+
+class _Phase(object):
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.nested_seconds = 0.0
+
+
+class TaskProfiler(object):
+    """
+    Collect phase timings, and optionally cProfile and tracemalloc
+    statistics, for one task instance.
+    """
+
+    def __init__(self, cprofile=False, tracemalloc=False):
+        """
+        :param bool cprofile: Run the task's method under cProfile.
+        :param bool tracemalloc: Trace the task method's memory allocations.
+            Ignored before Python 3.4.
+        """
+        self.cprofile = cprofile
+        self.tracemalloc = tracemalloc
+
+        self.phases = {}
+        self.cprofile_stats = None
+        self.tracemalloc_stats = None
+        self.started = None
+        self.stopped = None
+
+        self._lock = threading.Lock()
+        # Each thread gets its own stack of open phases.
+        self._local = threading.local()
+
+    def start(self):
+        """
+        Make this the running profiler that :py:func:`phase` reports to.
+        """
+        global _active
+
+        self.started = time.time()
+        _active = self
+
+    def stop(self):
+        global _active
+
+        self.stopped = time.time()
+        if _active is self:
+            _active = None
+
+    def enter(self, name):
+        stack = self._stack()
+        stack.append((name, time.time(), [0.0]))
+
+    def exit(self):
+        stack = self._stack()
+        name, start, nested = stack.pop()
+        elapsed = time.time() - start
+
+        # Tell the enclosing phase how much of its time was spent in here.
+        if stack:
+            stack[-1][2][0] += elapsed
+
+        with self._lock:
+            timings = self.phases.setdefault(name, _Phase())
+            timings.calls += 1
+            timings.seconds += elapsed
+            timings.nested_seconds += nested[0]
+
+    def profile_call(self, func, *args, **kwargs):
+        """
+        Call func, under cProfile and tracemalloc if they're turned on.
+
+        :return: Whatever func returns.
+        """
+        profile = None
+        tracing = False
+
+        if self.cprofile:
+            import cProfile
+            profile = cProfile.Profile()
+
+        if self.tracemalloc:
+            try:
+                import tracemalloc
+                tracemalloc.start()
+                tracing = True
+            except ImportError:
+                logging.warning('tracemalloc needs Python 3.4 or newer; not tracing memory.')
+
+        try:
+            if profile is not None:
+                return profile.runcall(func, *args, **kwargs)
+            return func(*args, **kwargs)
+        finally:
+            if profile is not None:
+                self.cprofile_stats = _format_cprofile(profile)
+
+            if tracing:
+                self.tracemalloc_stats = _summarize_tracemalloc()
+
+    def report(self, tags=None):
+        """
+        Build the report as a JSON serializable dictionary.
+
+        :param dict tags: Identifying information to include, eg. the
+            dag_id, task_id and execution_date.
+        :rtype: dict
+        """
+        with self._lock:
+            phases = dict(
+                (name, {
+                    'calls': timings.calls,
+                    'seconds': timings.seconds,
+                    'self_seconds': timings.seconds - timings.nested_seconds,
+                })
+                for name, timings in self.phases.items()
+            )
+
+        report = dict(tags or {})
+        report['total_seconds'] = (self.stopped or time.time()) - self.started
+        report['phases'] = phases
+
+        if self.cprofile_stats is not None:
+            report['cprofile'] = self.cprofile_stats
+
+        if self.tracemalloc_stats is not None:
+            report['tracemalloc'] = self.tracemalloc_stats
+
+        return report
+
+    def summary(self):
+        """
+        A compact one line per phase summary, slowest first.
+
+        :rtype: str
+        """
+        report = self.report()
+        lines = ['total {:.3f}s'.format(report['total_seconds'])]
+
+        for name, timings in sorted(report['phases'].items(), key=lambda item: -item[1]['seconds']):
+            lines.append('{name}: {seconds:.3f}s ({self_seconds:.3f}s self) x{calls}'.format(name=name, **timings))
+
+        return '\n'.join(lines)
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+
+        if stack is None:
+            stack = self._local.stack = []
+
+        return stack
+
+
+def _format_cprofile(profile):
+    import pstats
+
+    output = StringIO()
+    pstats.Stats(profile, stream=output).sort_stats('cumulative').print_stats(TOP_ENTRIES)
+
+    return output.getvalue()
+
+
+def _summarize_tracemalloc():
+    import tracemalloc
+
+    snapshot = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'current_bytes': current,
+        'peak_bytes': peak,
+        'top_allocations': [str(stat) for stat in snapshot.statistics('lineno')[:TOP_ENTRIES]],
+    }
@@ -0,0 +1,101 @@
+"""
+Pace requests to a service with a rate that adapts to throttling.
+
+:py:class:`AdaptiveRateLimiter` spaces requests out evenly at its current
+rate and adjusts the rate like TCP congestion control (AIMD): every
+successful request nudges the rate up additively, and a throttling response
+cuts it by a factor. Sharing one limiter between every thread in a process
+keeps a fan-out of parallel requests just under the rate the service will
+accept, rather than bursting, getting throttled and backing off.
+
+Use :py:func:`get_rate_limiter` to get the process wide limiter for a name,
+such as an S3 bucket.
+"""
+
+import threading
+import time
+
+# name -> AdaptiveRateLimiter shared by the whole process
+_limiters = {}
+_lock = threading.Lock()
+
+
+class AdaptiveRateLimiter(object):
+    """
+    A thread safe request pacer with additive increase, multiplicative
+    decrease.
+    """
+
+    def __init__(self, initial_rate=100.0, min_rate=1.0, max_rate=3500.0, increase=10.0, decrease=0.5,
+                 cooldown=1.0):
+        """
+        :param float initial_rate: The starting rate in requests per second.
+        :param float min_rate: The rate never drops below this.
+        :param float max_rate: The rate never rises above this.
+        :param float increase: How much the rate grows per second of
+            successful requests, in requests per second.
+        :param float decrease: What the rate is multiplied by on throttling.
+        :param float cooldown: Seconds after a decrease during which further
+            throttling is put down to requests already in flight, and doesn't
+            decrease the rate again.
+        """
+        self.rate = float(initial_rate)
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate)
+        self.increase = float(increase)
+        self.decrease = float(decrease)
+        self.cooldown = float(cooldown)
+
+        self._next_slot = 0.0
+        self._last_decrease = None
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Block until the next request may be sent.
+        """
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1.0 / self.rate
+
+        if slot > now:
+            time.sleep(slot - now)
+
+    def on_success(self):
+        """
+        Record a successful request, raising the rate a little.
+        """
+        with self._lock:
+            # Spread the increase over the requests made in a second.
+            self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def on_throttle(self):
+        """
+        Record a throttled request, cutting the rate.
+        """
+        with self._lock:
+            now = time.time()
+            if self._last_decrease is not None and now - self._last_decrease < self.cooldown:
+                return
+
+            self._last_decrease = now
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+
+
+def get_rate_limiter(name, **kwargs):
+    """
+    Get the process wide rate limiter for a name, creating it on first use.
+
+    :param str name: What is being limited, eg. an S3 bucket name.
+    :param kwargs: Passed to :py:class:`AdaptiveRateLimiter` when it's
+        created, and ignored after that.
+    :rtype: AdaptiveRateLimiter
+    """
+    with _lock:
+        limiter = _limiters.get(name)
+
+        if limiter is None:
+            limiter = _limiters[name] = AdaptiveRateLimiter(**kwargs)
+
+        return limiter
@@ -0,0 +1,227 @@
+"""
+Retry transient storage failures with exponential backoff and jitter.
+
+A :py:class:`RetryPolicy` wraps a single request, such as one S3 GET or one
+part of a multipart upload, so a throttle or a dropped connection only
+repeats that request rather than failing the whole task. Waits between
+attempts grow exponentially with "full jitter": each wait is a random time
+between zero and the capped exponential delay, which stops many workers that
+were throttled together from retrying in lockstep.
+
+A :py:class:`RetryBudget` caps retries to a fraction of all requests, so that
+when a service is genuinely down the retries don't pile more load on it and
+tasks fail fast instead of backing off for minutes.
+
+A policy can also pace every attempt through a shared
+:py:class:`~fileflow.rate_limit.AdaptiveRateLimiter`, telling it about each
+success and throttle so it can find the rate the service accepts.
+"""
+
+import errno
+import logging
+import random
+import socket
+import threading
+import time
+
+try:
+    from httplib import HTTPException
+except ImportError:
+    from http.client import HTTPException
+
+from .instrumentation import note_retry
+
+# Errors that always mean the connection dropped or timed out.
+try:
+    CONNECTION_ERRORS = (socket.timeout, ConnectionError)
+except NameError:
+    # Python 2 has no ConnectionError.
+    CONNECTION_ERRORS = (socket.timeout,)
+
+# The errnos of socket errors that mean the connection dropped or timed out.
+# Other OS errors, like a full disk or a permission denied writing a
+# temporary file, won't go away by retrying.
+RETRYABLE_ERRNOS = frozenset([
+    errno.ECONNABORTED,
+    errno.ECONNREFUSED,
+    errno.ECONNRESET,
+    errno.EHOSTUNREACH,
+    errno.ENETDOWN,
+    errno.ENETRESET,
+    errno.ENETUNREACH,
+    errno.EPIPE,
+    errno.ETIMEDOUT,
+])
+
+# HTTP statuses that mean "try again later".
+RETRYABLE_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+# S3 and AWS error codes that mean "try again later".
+RETRYABLE_ERROR_CODES = frozenset([
+    'InternalError',
+    'RequestTimeout',
+    'ServiceUnavailable',
+    'SlowDown',
+    'Throttling',
+    'ThrottlingException',
+])
+
+# HTTP statuses and error codes that mean "slow down".
+THROTTLE_STATUSES = frozenset([429, 503])
+THROTTLE_ERROR_CODES = frozenset(['SlowDown', 'Throttling', 'ThrottlingException'])
+
+
+def is_transient(error):
+    """
+    Whether an error is worth retrying: a dropped or timed out connection, or
+    a throttling or server error response.
+
+    Responses are recognised by their ``status`` and ``error_code``
+    attributes, as set on boto's exceptions, so boto doesn't have to be
+    imported to check.
+
+    :param Exception error: The error raised by a request.
+    :rtype: bool
+    """
+    if isinstance(error, CONNECTION_ERRORS + (HTTPException,)):
+        return True
+
+    # socket.error is OSError on Python 3, so look at which error it is.
+    if isinstance(error, EnvironmentError) and error.errno in RETRYABLE_ERRNOS:
+        return True
+
+    return getattr(error, 'status', None) in RETRYABLE_STATUSES or \
+        getattr(error, 'error_code', None) in RETRYABLE_ERROR_CODES
+
+
+def is_throttle(error):
+    """
+    Whether an error is the service asking for fewer requests.
+
+    :param Exception error: The error raised by a request.
+    :rtype: bool
+    """
+    return getattr(error, 'status', None) in THROTTLE_STATUSES or \
+        getattr(error, 'error_code', None) in THROTTLE_ERROR_CODES
+
+
+class RetryBudget(object):
+    """
+    Allow retries up to a fraction of the requests made, plus a fixed
+    allowance so that the first few failures can always be retried.
+
+    A budget is shared by every request made through a driver, across threads.
+    """
+
+    def __init__(self, ratio=0.2, min_retries=10):
+        """
+        :param float ratio: Retries allowed per request made.
+        :param int min_retries: Retries allowed regardless of the ratio.
+        """
+        self.ratio = ratio
+        self.min_retries = min_retries
+
+        self.requests = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def try_spend(self):
+        """
+        Take a retry from the budget if there's one left.
+
+        :return: True if the retry may go ahead.
+        :rtype: bool
+        """
+        with self._lock:
+            if self.retries >= self.min_retries + self.ratio * self.requests:
+                return False
+
+            self.retries += 1
+            return True
+
+
+class RetryPolicy(object):
+    """
+    Call a function, retrying transient failures.
+
+    .. code-block:: python
+
+        policy = RetryPolicy(attempts=5, base_delay=0.1, max_delay=20)
+        key = policy.call(bucket.get_key, key_name)
+    """
+
+    def __init__(self, attempts=5, base_delay=0.1, max_delay=20.0, budget=None, retryable=is_transient,
+                 rate_limiter=None):
+        """
+        :param int attempts: The most times to try each request, including
+            the first. 1 turns retrying off.
+        :param float base_delay: The maximum wait in seconds before the first
+            retry. Doubles for each further retry.
+        :param float max_delay: The cap on the maximum wait in seconds.
+        :param RetryBudget budget: Limits retries across all requests.
+            Defaults to a new budget for this policy.
+        :param callable retryable: Takes an exception and returns whether to
+            retry it.
+        :param AdaptiveRateLimiter rate_limiter: Paces every attempt, if given.
+        """
+        self.attempts = max(1, int(attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget if budget is not None else RetryBudget()
+        self.retryable = retryable
+        self.rate_limiter = rate_limiter
+
+    def backoff(self, retry):
+        """
+        How long to wait before a retry.
+
+        :param int retry: Which retry this is, starting from 1.
+        :return: A random wait between zero and the capped exponential delay.
+        :rtype: float
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (retry - 1)))
+
+    def call(self, func, *args, **kwargs):
+        """
+        Call func, retrying it while it raises transient errors and both
+        attempts and the retry budget remain.
+
+        func must be safe to repeat: any state it changes, such as a stream's
+        position, has to be reset by func itself.
+
+        :return: Whatever func returns.
+        :raises: The last error if func doesn't succeed.
+        """
+        self.budget.record_request()
+
+        attempt = 1
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if self.rate_limiter is not None and is_throttle(e):
+                    self.rate_limiter.on_throttle()
+
+                if attempt >= self.attempts or not self.retryable(e) or not self.budget.try_spend():
+                    raise
+
+                delay = self.backoff(attempt)
+                logging.warning(
+                    'Retrying %s in %.2fs after attempt %d of %d failed: %r',
+                    getattr(func, '__name__', func), delay, attempt, self.attempts, e
+                )
+                note_retry()
+                time.sleep(delay)
+                attempt += 1
+            else:
+                if self.rate_limiter is not None:
+                    self.rate_limiter.on_success()
+
+                return result
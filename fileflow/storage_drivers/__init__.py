@@ -1,7 +1,12 @@
 from .storage_driver import StorageDriver, StorageDriverError
 from .file_storage_driver import FileStorageDriver
 from .s3_storage_driver import S3StorageDriver
-from .. import configuration
+from .tiered_storage_driver import TieredStorageDriver
+from .handoff_storage_driver import HandoffStorageDriver
+from .memory_storage_driver import MemoryStorageDriver
+from .instrumented_storage_driver import InstrumentedStorageDriver
+from .write_behind_storage_driver import WriteBehindStorageDriver
+from .registry import get_storage_driver_factory, register_storage_driver
 
 
 def get_storage_driver(
@@ -10,74 +15,73 @@ def get_storage_driver(
         environment=None,
         aws_access_key_id=None,
         aws_secret_access_key=None,
-        aws_bucket_name=None
+        aws_bucket_name=None,
+        date_granularity=None
 ):
     """
     Determine which intermediate storage driver to use and return it.
 
-    Reads from the given settings to determine whether to use the local
-    file system or AWS S3.
+    Reads from the given settings to determine which registered storage
+    driver to build. See :py:mod:`fileflow.storage_drivers.registry` for how
+    to add your own.
 
-    :param str storage_type: The storage type settings. Currently supports
-        'file' or 's3'.
+    :param str storage_type: The storage type settings. Ships with support
+        for 'file', 's3', 'tiered' (local files in front of S3), 'handoff'
+        (S3, with copies kept locally for tasks on the same worker) and
+        'memory'.
     :param str storage_prefix: The file storage prefix. Becomes the base path
-        for file storage.
+        for file storage, and for the local tier of tiered storage.
     :param str environment: The environment name. Currently supported values
         are 'produciton', 'qa', 'development', and 'test'.
-    :param str aws_access_key_id: AWS credential.
-    :param str aws_secret_access_key: AWS credential.
+    :param str aws_access_key_id: AWS credential. Looked up from the
+        configuration by drivers that use it when not given.
+    :param str aws_secret_access_key: AWS credential. Looked up from the
+        configuration by drivers that use it when not given.
     :param str aws_bucket_name: The S3 bucket name to use. Gets the
         environment name appended to it so buckets are tied to environments.
+    :param str date_granularity: How finely execution dates are told apart
+        in file names: 'day', 'hour', 'minute', 'second' or 'microsecond'.
     :return: A storage driver for reading and writing intermediate data.
     :rtype: fileflow.storage_drivers.storage_driver.StorageDriver
     """
 
-    from fileflow.errors import FileflowError
+    # The airflow configuration is only loaded once a driver is asked for,
+    # and only parsed once per process.
+    from ..configuration import get_settings
+
+    settings = get_settings()
 
     # Initialize all the things.
     if storage_type is None:
-        storage_type = configuration.get('fileflow', 'storage_type')
+        storage_type = settings.storage_type
 
     if storage_prefix is None:
-        storage_prefix = configuration.get('fileflow', 'storage_prefix')
+        storage_prefix = settings.storage_prefix
 
     if environment is None:
-        environment = configuration.get('fileflow', 'environment')
-
-    if aws_access_key_id is None:
-        aws_access_key_id = configuration.get('fileflow', 'aws_access_key_id')
+        environment = settings.environment
 
-    if aws_secret_access_key is None:
-        aws_secret_access_key = configuration.get('fileflow', 'aws_secret_access_key')
+    # AWS credentials are left for the drivers that need them to look up,
+    # since finding the defaults can mean importing boto.
 
     if aws_bucket_name is None:
-        aws_bucket_name = configuration.get('fileflow', 'aws_bucket_name')
-
-    # Now get to the real work.
-    if storage_type == 'file':
-        # Here the storage prefix is used for the base path.
-        return FileStorageDriver(prefix=storage_prefix)
-
-    elif storage_type == 's3':
-        full_bucket_name = aws_bucket_name
-        # Given any valid environment type name aside from production,
-        # append it to the provided bucket name.
-        if environment in ['qa', 'development', 'test']:
-            full_bucket_name += environment
-        elif environment == 'production':
-            # For production leave the bucket name as-is.
-            pass
-        else:
-            raise FileflowError("ENVIRONMENT setting is net set correctly")
+        aws_bucket_name = settings.aws_bucket_name
 
-        return S3StorageDriver(
-            access_key_id=aws_access_key_id,
-            secret_access_key=aws_secret_access_key,
-            bucket_name=full_bucket_name
-        )
+    if date_granularity is None:
+        date_granularity = settings.execution_date_granularity
 
-    raise FileflowError(
-        'Storage driver type {} does not exist.'.format(storage_type)
+    # Now get to the real work.
+    factory = get_storage_driver_factory(storage_type)
+
+    return factory(
+        storage_prefix=storage_prefix,
+        environment=environment,
+        aws_access_key_id=aws_access_key_id,
+        aws_secret_access_key=aws_secret_access_key,
+        aws_bucket_name=aws_bucket_name,
+        date_granularity=date_granularity
     )
 
-__all__ = ['StorageDriver', 'StorageDriverError', 'FileStorageDriver', 'S3StorageDriver', 'get_storage_driver']
+__all__ = ['StorageDriver', 'StorageDriverError', 'FileStorageDriver', 'S3StorageDriver', 'TieredStorageDriver',
+           'HandoffStorageDriver', 'MemoryStorageDriver', 'InstrumentedStorageDriver', 'WriteBehindStorageDriver',
+           'get_storage_driver', 'register_storage_driver']
@@ -6,23 +6,35 @@
 """
 
 import os
+import errno
 import codecs
+import uuid
 
-from .storage_driver import StorageDriver
+from .storage_driver import StorageDriver, DEFAULT_DATE_GRANULARITY, OUTPUT_NAME_SEPARATOR
+from ..concurrency import DEFAULT_WORKERS, thread_map
+
+# Files being written have this suffix, and a leading dot, until they're
+# renamed into place.
+TEMP_SUFFIX = '.tmp'
 
 
 class FileStorageDriver(StorageDriver):
     """
     Read and write to the local file system.
+
+    Files are written beside their final name and then renamed into place,
+    so a reader never sees part of a file, and a file that's still open or
+    memory mapped keeps its old contents rather than being truncated.
     """
 
-    def __init__(self, prefix):
+    def __init__(self, prefix, date_granularity=DEFAULT_DATE_GRANULARITY):
         """
         Set up the base path for storage.
 
         :param str prefix: The prefix or base path to use.
+        :param str date_granularity: How finely to tell execution dates apart.
         """
-        super(FileStorageDriver, self).__init__()
+        super(FileStorageDriver, self).__init__(date_granularity=date_granularity)
         self.prefix = prefix
 
     def get_filename(self, dag_id, task_id, execution_date):
@@ -36,13 +48,18 @@ class FileStorageDriver(StorageDriver):
     def get_path(self, dag_id, task_id):
         return os.path.join(self.prefix, dag_id, task_id)
 
-    def read(self, dag_id, task_id, execution_date, encoding='utf-8'):
-        filename = self.get_filename(dag_id, task_id, execution_date)
+    def get_local_path(self, dag_id, task_id, execution_date):
+        return self.get_filename(dag_id, task_id, execution_date)
+
+    def exists(self, dag_id, task_id, execution_date):
+        return os.path.isfile(self.get_filename(dag_id, task_id, execution_date))
 
-        with codecs.open(filename, 'rb', encoding=encoding) as f:
-            data = f.read()
+    def read(self, dag_id, task_id, execution_date, encoding='utf-8'):
+        return self.read_bytes(dag_id, task_id, execution_date).decode(encoding)
 
-        return data
+    def read_bytes(self, dag_id, task_id, execution_date):
+        with open(self.get_filename(dag_id, task_id, execution_date), 'rb') as f:
+            return f.read()
 
     def get_read_stream(self, dag_id, task_id, execution_date):
         filename = self.get_filename(dag_id, task_id, execution_date)
@@ -52,24 +69,81 @@ class FileStorageDriver(StorageDriver):
 
     def write(self, dag_id, task_id, execution_date, data, *args, **kwargs):
         # Note that content_type isn't used here.
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+
+        self.write_bytes(dag_id, task_id, execution_date, data)
+
+    def write_bytes(self, dag_id, task_id, execution_date, data, content_type=None):
         filename = self.get_filename(dag_id, task_id, execution_date)
 
-        self.check_or_create_dir(os.path.dirname(filename))
+        directory, name = os.path.split(filename)
+        self.check_or_create_dir(directory)
+
+        # Unlike a temporary file's, os.open's permissions follow the umask,
+        # as a file opened the usual way would.
+        temp_filename = os.path.join(directory, '.{}.{}{}'.format(name, uuid.uuid4().hex, TEMP_SUFFIX))
+        fd = os.open(temp_filename, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
 
-        with open(filename, "w") as f:
-            f.write(data)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+
+            os.rename(temp_filename, filename)
+        except Exception:
+            os.remove(temp_filename)
+            raise
 
     def write_from_stream(self, dag_id, task_id, execution_date, stream, *args, **kwargs):
         self.write(dag_id, task_id, execution_date, data=stream.read())
 
+    def delete(self, dag_id, task_id, execution_date):
+        filename = self.get_filename(dag_id, task_id, execution_date)
+
+        try:
+            os.remove(filename)
+        except OSError as e:
+            # Already gone is as good as deleted.
+            if e.errno != errno.ENOENT:
+                raise
+
+    def delete_many(self, task_instances, workers=DEFAULT_WORKERS):
+        """
+        Remove the files for many task instances using a pool of threads.
+        """
+        thread_map(
+            lambda task_instance: self.delete(*task_instance),
+            task_instances,
+            workers=workers
+        )
+
     def list_filenames_in_path(self, path):
         all_filenames = []
         for (dirpath, dirnames, filenames) in os.walk(path):
-            all_filenames.extend(filenames)
+            # Leave out files still being written.
+            all_filenames.extend(
+                filename for filename in filenames
+                if not (filename.startswith('.') and filename.endswith(TEMP_SUFFIX))
+            )
             break
 
         return all_filenames
 
+    def list_output_task_ids(self, dag_id, task_id):
+        dag_path = os.path.join(self.prefix, dag_id)
+
+        try:
+            names = os.listdir(dag_path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return []
+
+        return sorted(
+            name for name in names
+            if name.startswith(task_id + OUTPUT_NAME_SEPARATOR) and os.path.isdir(os.path.join(dag_path, name))
+        )
+
     def check_or_create_dir(self, dir):
         """
         Make sure our storage location exists.
@@ -0,0 +1,373 @@
+"""
+.. module:: storage_drivers.handoff_storage_driver
+    :synopsis: Hand outputs between tasks on the same worker through a local directory, with S3 as the source of truth.
+"""
+
+import errno
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+from .file_storage_driver import FileStorageDriver
+from .storage_driver import StorageDriver
+from ..concurrency import DEFAULT_WORKERS
+from ..instrumentation import note_cache_hit
+
+# The default size limit of the handoff directory, in bytes.
+DEFAULT_HANDOFF_MAX_BYTES = 10 * 1024 * 1024 * 1024
+
+# Each local copy has a manifest file beside it holding the remote ETag the
+# copy was made from.
+MANIFEST_SUFFIX = '.etag'
+
+# Files being written have this suffix until they are complete.
+TEMP_SUFFIX = '.tmp'
+
+
+class HandoffStorageDriver(StorageDriver):
+    """
+    Keep a copy of every file written or read in a local directory shared by
+    the tasks on a worker, in front of a remote driver, usually an
+    :py:class:`~fileflow.storage_drivers.s3_storage_driver.S3StorageDriver`.
+
+    Writes go to the remote driver before they return, as they would without
+    the handoff directory, and the local copy is kept as well. Reads use the
+    local copy when its manifest matches the remote file's ETag, which costs a
+    single metadata request instead of a download, so a task that runs on
+    the same worker as its upstream task reads at local disk speed. Otherwise
+    the file is downloaded and kept locally for the next reader.
+
+    The remote driver stays the source of truth: a local copy is only used
+    while the remote file is unchanged, and nothing is lost when the
+    directory is cleared. The remote driver must implement
+    :py:meth:`~fileflow.storage_drivers.storage_driver.StorageDriver.get_etag`,
+    or every read goes remote.
+
+    The least recently used copies are removed once the directory holds more
+    than ``max_bytes``. The directory is only walked the first time it's
+    used; after that the driver keeps count of the copies it writes, reads
+    and removes, so it doesn't see copies another process adds until it
+    uses them. Copies are written to temporary files and renamed into place,
+    so several processes can share the directory.
+    """
+
+    def __init__(self, remote, directory, max_bytes=DEFAULT_HANDOFF_MAX_BYTES):
+        """
+        :param StorageDriver remote: The authoritative storage driver.
+        :param str directory: The local directory to keep copies in.
+        :param int max_bytes: How big the local copies can get in total.
+        """
+        # Local copies are named like the remote files, so follow the remote driver.
+        super(HandoffStorageDriver, self).__init__(date_granularity=remote.date_granularity)
+
+        self.remote = remote
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+        # Names the local copies.
+        self.local = FileStorageDriver(prefix=directory, date_granularity=remote.date_granularity)
+
+        # Guards the copies and their total size.
+        self._lock = threading.Lock()
+        # Local copy filename -> size in bytes, least recently used first.
+        # Filled from the directory on first use.
+        self._copies = None
+        self._total_bytes = 0
+
+    def get_filename(self, dag_id, task_id, execution_date):
+        return self.remote.get_filename(dag_id, task_id, execution_date)
+
+    def get_path(self, dag_id, task_id):
+        return self.remote.get_path(dag_id, task_id)
+
+    def get_local_path(self, dag_id, task_id, execution_date):
+        return self._ensure_local(dag_id, task_id, execution_date)
+
+    def get_etag(self, dag_id, task_id, execution_date):
+        return self.remote.get_etag(dag_id, task_id, execution_date)
+
+    def compute_etag(self, stream):
+        return self.remote.compute_etag(stream)
+
+    def exists(self, dag_id, task_id, execution_date):
+        return self.remote.exists(dag_id, task_id, execution_date)
+
+    def read(self, dag_id, task_id, execution_date, encoding='utf-8'):
+        return self.read_bytes(dag_id, task_id, execution_date).decode(encoding)
+
+    def read_bytes(self, dag_id, task_id, execution_date):
+        with open(self._ensure_local(dag_id, task_id, execution_date), 'rb') as f:
+            return f.read()
+
+    def get_read_stream(self, dag_id, task_id, execution_date):
+        return open(self._ensure_local(dag_id, task_id, execution_date), 'rb')
+
+    def write(self, dag_id, task_id, execution_date, data, content_type='text/plain', *args, **kwargs):
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+
+        self.write_bytes(dag_id, task_id, execution_date, data, content_type=content_type)
+
+    def write_bytes(self, dag_id, task_id, execution_date, data, content_type='application/octet-stream'):
+        def write_data(f):
+            f.write(data)
+
+        self._write(dag_id, task_id, execution_date, write_data, content_type)
+
+    def write_from_stream(self, dag_id, task_id, execution_date, stream, content_type='text/plain', *args, **kwargs):
+        def write_data(f):
+            shutil.copyfileobj(stream, f)
+
+        self._write(dag_id, task_id, execution_date, write_data, content_type)
+
+    def delete(self, dag_id, task_id, execution_date):
+        self.remote.delete(dag_id, task_id, execution_date)
+        self._remove_local(self.local.get_filename(dag_id, task_id, execution_date))
+
+    def delete_many(self, task_instances, workers=DEFAULT_WORKERS):
+        task_instances = list(task_instances)
+
+        self.remote.delete_many(task_instances, workers=workers)
+
+        for task_instance in task_instances:
+            self._remove_local(self.local.get_filename(*task_instance))
+
+    def list_filenames_in_path(self, path):
+        return self.remote.list_filenames_in_path(path)
+
+    def list_filenames_in_task(self, dag_id, task_id):
+        return self.remote.list_filenames_in_task(dag_id, task_id)
+
+    def list_output_task_ids(self, dag_id, task_id):
+        return self.remote.list_output_task_ids(dag_id, task_id)
+
+    def flush(self):
+        self.remote.flush()
+
+    def _write(self, dag_id, task_id, execution_date, write_data, content_type):
+        """
+        Write a file locally, upload it, then keep the local copy under the
+        ETag of the data written.
+
+        :param function write_data: Writes the data to a binary file object.
+        """
+        filename = self.local.get_filename(dag_id, task_id, execution_date)
+        temp_filename = self._temp_filename(filename)
+
+        try:
+            with open(temp_filename, 'wb') as f:
+                write_data(f)
+
+            with open(temp_filename, 'rb') as f:
+                self.remote.write_from_stream(dag_id, task_id, execution_date, f, content_type=content_type)
+
+            # Work the ETag out from what was written. Asking the remote
+            # driver for it could return the ETag of another worker's write
+            # that landed just after this one.
+            with open(temp_filename, 'rb') as f:
+                etag = self.remote.compute_etag(f)
+
+            self._publish(filename, temp_filename, etag)
+        finally:
+            self._remove_file(temp_filename)
+
+        self._evict(keep=filename)
+
+    def _ensure_local(self, dag_id, task_id, execution_date):
+        """
+        Make sure the local copy of the task instance's file matches the
+        remote file, downloading it if it doesn't.
+
+        :return: The local copy's path.
+        :rtype: str
+        """
+        filename = self.local.get_filename(dag_id, task_id, execution_date)
+        etag = self.remote.get_etag(dag_id, task_id, execution_date)
+
+        if etag is not None and self._read_manifest(filename) == etag and os.path.isfile(filename):
+            note_cache_hit(True)
+            # Mark the copy as recently used, so it's evicted last, here and
+            # by processes that walk the directory later.
+            os.utime(filename, None)
+            self._used(filename)
+            return filename
+
+        note_cache_hit(False)
+        temp_filename = self._temp_filename(filename)
+
+        try:
+            stream = self.remote.get_read_stream(dag_id, task_id, execution_date)
+            try:
+                with open(temp_filename, 'wb') as f:
+                    shutil.copyfileobj(stream, f)
+            finally:
+                stream.close()
+
+            self._publish(filename, temp_filename, etag)
+        finally:
+            self._remove_file(temp_filename)
+
+        self._evict(keep=filename)
+
+        return filename
+
+    def _publish(self, filename, temp_filename, etag):
+        """
+        Move a complete temporary file into place as the local copy made from
+        the remote file with the given ETag.
+
+        The old manifest is removed first, so a reader never pairs the new
+        copy with the old ETag. Without an ETag there's nothing to check the
+        copy against later, so it has no manifest and is never used in place
+        of the remote file.
+        """
+        manifest_filename = filename + MANIFEST_SUFFIX
+
+        self._remove_file(manifest_filename)
+        os.rename(temp_filename, filename)
+        self._used(filename, os.path.getsize(filename))
+
+        if etag is not None:
+            temp_manifest_filename = self._temp_filename(manifest_filename)
+            with open(temp_manifest_filename, 'w') as f:
+                f.write(etag)
+            os.rename(temp_manifest_filename, manifest_filename)
+
+    def _read_manifest(self, filename):
+        """
+        :return: The ETag the local copy was made from, or None.
+        :rtype: str | None
+        """
+        try:
+            with open(filename + MANIFEST_SUFFIX) as f:
+                return f.read().strip()
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return None
+
+    def _temp_filename(self, filename):
+        """
+        Create an empty temporary file beside filename, creating its
+        directory if need be.
+
+        :return: The temporary file's path.
+        :rtype: str
+        """
+        directory = os.path.dirname(filename)
+
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            # Another task may have just made it.
+            if e.errno != errno.EEXIST:
+                raise
+
+        fd, temp_filename = tempfile.mkstemp(dir=directory, prefix='.', suffix=TEMP_SUFFIX)
+        os.close(fd)
+
+        return temp_filename
+
+    def _load_copies(self):
+        """
+        Find the local copies already in the directory, the first time it's
+        used, ordered by when they were last used.
+
+        Call with the lock held.
+        """
+        if self._copies is not None:
+            return
+
+        copies = []
+
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(MANIFEST_SUFFIX) or name.endswith(TEMP_SUFFIX):
+                    continue
+
+                filename = os.path.join(root, name)
+                try:
+                    stat = os.stat(filename)
+                except OSError:
+                    # Removed by another process in the meantime.
+                    continue
+
+                copies.append((stat.st_mtime, filename, stat.st_size))
+
+        self._copies = OrderedDict((filename, size) for _, filename, size in sorted(copies))
+        self._total_bytes = sum(self._copies.values())
+
+    def _used(self, filename, size=None):
+        """
+        Count a local copy as the most recently used.
+
+        :param int size: The copy's size, if it was just written. Otherwise
+            it's looked up the first time the copy is seen.
+        """
+        with self._lock:
+            self._load_copies()
+
+            known_size = self._copies.pop(filename, None)
+            if size is None:
+                size = known_size if known_size is not None else os.path.getsize(filename)
+
+            self._copies[filename] = size
+            self._total_bytes += size - (known_size or 0)
+
+    def _forget(self, filename):
+        """
+        Stop counting a local copy once it's been removed.
+        """
+        with self._lock:
+            if self._copies is not None and filename in self._copies:
+                self._total_bytes -= self._copies.pop(filename)
+
+    def _evict(self, keep=None):
+        """
+        Remove the least recently used local copies until the directory fits
+        in max_bytes.
+
+        :param str keep: A local copy not to remove, eg. the one just used.
+        """
+        with self._lock:
+            self._load_copies()
+
+            if self._total_bytes <= self.max_bytes:
+                return
+
+            evicted = []
+            for filename, size in self._copies.items():
+                if self._total_bytes <= self.max_bytes:
+                    break
+
+                if filename == keep:
+                    continue
+
+                evicted.append(filename)
+                self._total_bytes -= size
+
+            for filename in evicted:
+                del self._copies[filename]
+
+        for filename in evicted:
+            self._remove_files(filename)
+
+    def _remove_local(self, filename):
+        """
+        Remove a local copy and its manifest, if they exist.
+        """
+        self._forget(filename)
+        self._remove_files(filename)
+
+    def _remove_files(self, filename):
+        self._remove_file(filename + MANIFEST_SUFFIX)
+        self._remove_file(filename)
+
+    def _remove_file(self, filename):
+        try:
+            os.remove(filename)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
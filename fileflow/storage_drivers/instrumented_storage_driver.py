@@ -0,0 +1,239 @@
+"""
+.. module:: storage_drivers.instrumented_storage_driver
+    :synopsis: Wrap a StorageDriver to report every operation to I/O observers.
+"""
+
+from .storage_driver import StorageDriver, DEFAULT_DATE_GRANULARITY
+from ..concurrency import DEFAULT_WORKERS
+from ..instrumentation import IOEvent, recorded_operation
+
+
+class InstrumentedStorageDriver(StorageDriver):
+    """
+    Pass every call through to another storage driver, reporting reads,
+    writes, listings and deletes to :py:class:`~fileflow.instrumentation.IOObserver` objects.
+
+    Anything not instrumented here, including driver specific attributes
+    like :py:attr:`S3StorageDriver.bucket`, is looked up on the wrapped
+    driver.
+    """
+
+    def __init__(self, driver, observers, tags=None):
+        """
+        :param StorageDriver driver: The driver to wrap.
+        :param list[IOObserver] observers: Who to tell about each operation.
+        :param dict tags: The dag_id, task_id and execution_date of the task
+            instance doing the I/O, attached to every event.
+        """
+        super(InstrumentedStorageDriver, self).__init__(
+            date_granularity=getattr(driver, 'date_granularity', DEFAULT_DATE_GRANULARITY)
+        )
+
+        self.driver = driver
+        self.observers = observers
+        self.tags = tags or {}
+
+    def __getattr__(self, name):
+        # Only called for attributes not found the normal way.
+        if name == 'driver':
+            raise AttributeError(name)
+        return getattr(self.driver, name)
+
+    def get_filename(self, dag_id, task_id, execution_date):
+        return self.driver.get_filename(dag_id, task_id, execution_date)
+
+    def get_path(self, dag_id, task_id):
+        return self.driver.get_path(dag_id, task_id)
+
+    def get_local_path(self, dag_id, task_id, execution_date):
+        return self.driver.get_local_path(dag_id, task_id, execution_date)
+
+    def get_etag(self, dag_id, task_id, execution_date):
+        return self.driver.get_etag(dag_id, task_id, execution_date)
+
+    def compute_etag(self, stream):
+        return self.driver.compute_etag(stream)
+
+    def execution_date_string(self, execution_date):
+        return self.driver.execution_date_string(execution_date)
+
+    def parse_execution_date_string(self, date_string):
+        return self.driver.parse_execution_date_string(date_string)
+
+    def exists(self, dag_id, task_id, execution_date):
+        event = IOEvent('exists', dag_id, task_id, execution_date, tags=self.tags)
+
+        try:
+            with recorded_operation(event):
+                found = self.driver.exists(dag_id, task_id, execution_date)
+        finally:
+            self._record(event)
+
+        return found
+
+    def read(self, dag_id, task_id, execution_date, encoding='utf-8'):
+        event = IOEvent('read', dag_id, task_id, execution_date, tags=self.tags)
+
+        # Read the bytes and decode them here, so the event has the size that
+        # was read rather than the number of characters.
+        try:
+            with recorded_operation(event):
+                data = self.driver.read_bytes(dag_id, task_id, execution_date)
+                event.bytes = len(data)
+                data = data.decode(encoding)
+        finally:
+            self._record(event)
+
+        return data
+
+    def read_bytes(self, dag_id, task_id, execution_date):
+        event = IOEvent('read_bytes', dag_id, task_id, execution_date, tags=self.tags)
+
+        try:
+            with recorded_operation(event):
+                data = self.driver.read_bytes(dag_id, task_id, execution_date)
+                event.bytes = len(data)
+        finally:
+            self._record(event)
+
+        return data
+
+    def get_read_stream(self, dag_id, task_id, execution_date):
+        event = IOEvent('get_read_stream', dag_id, task_id, execution_date, tags=self.tags)
+
+        try:
+            with recorded_operation(event):
+                stream = self.driver.get_read_stream(dag_id, task_id, execution_date)
+                event.bytes = _stream_size(stream)
+        finally:
+            self._record(event)
+
+        return stream
+
+    def write(self, dag_id, task_id, execution_date, data, *args, **kwargs):
+        event = IOEvent('write', dag_id, task_id, execution_date, tags=self.tags)
+        event.bytes = len(data)
+
+        try:
+            with recorded_operation(event):
+                self.driver.write(dag_id, task_id, execution_date, data, *args, **kwargs)
+        finally:
+            self._record(event)
+
+    def write_bytes(self, dag_id, task_id, execution_date, data, content_type='application/octet-stream'):
+        event = IOEvent('write_bytes', dag_id, task_id, execution_date, tags=self.tags)
+        event.bytes = len(data)
+
+        try:
+            with recorded_operation(event):
+                self.driver.write_bytes(dag_id, task_id, execution_date, data, content_type=content_type)
+        finally:
+            self._record(event)
+
+    def write_from_stream(self, dag_id, task_id, execution_date, stream, *args, **kwargs):
+        event = IOEvent('write_from_stream', dag_id, task_id, execution_date, tags=self.tags)
+        start_position = _stream_position(stream)
+
+        try:
+            with recorded_operation(event):
+                self.driver.write_from_stream(dag_id, task_id, execution_date, stream, *args, **kwargs)
+
+                end_position = _stream_position(stream)
+                if start_position is not None and end_position is not None:
+                    event.bytes = end_position - start_position
+        finally:
+            self._record(event)
+
+    def list_filenames_in_path(self, path):
+        event = IOEvent('list', path=path, tags=self.tags)
+
+        try:
+            with recorded_operation(event):
+                filenames = self.driver.list_filenames_in_path(path)
+        finally:
+            self._record(event)
+
+        return filenames
+
+    def list_filenames_in_task(self, dag_id, task_id):
+        event = IOEvent('list', dag_id, task_id, path=self.get_path(dag_id, task_id), tags=self.tags)
+
+        try:
+            with recorded_operation(event):
+                filenames = self.driver.list_filenames_in_task(dag_id, task_id)
+        finally:
+            self._record(event)
+
+        return filenames
+
+    def list_output_task_ids(self, dag_id, task_id):
+        event = IOEvent('list', dag_id, task_id, path=self.get_path(dag_id, task_id), tags=self.tags)
+
+        try:
+            with recorded_operation(event):
+                task_ids = self.driver.list_output_task_ids(dag_id, task_id)
+        finally:
+            self._record(event)
+
+        return task_ids
+
+    def delete(self, dag_id, task_id, execution_date):
+        event = IOEvent('delete', dag_id, task_id, execution_date, tags=self.tags)
+
+        try:
+            with recorded_operation(event):
+                self.driver.delete(dag_id, task_id, execution_date)
+        finally:
+            self._record(event)
+
+    def delete_many(self, task_instances, workers=DEFAULT_WORKERS):
+        event = IOEvent('delete_many', tags=self.tags)
+
+        try:
+            with recorded_operation(event):
+                self.driver.delete_many(task_instances, workers=workers)
+        finally:
+            self._record(event)
+
+    def flush(self):
+        event = IOEvent('flush', tags=self.tags)
+
+        try:
+            with recorded_operation(event):
+                self.driver.flush()
+        finally:
+            self._record(event)
+
+    def task_finished(self):
+        """
+        Tell the observers the task is done, so they can report.
+        """
+        for observer in self.observers:
+            observer.task_finished(self.tags)
+
+    def _record(self, event):
+        for observer in self.observers:
+            observer.record(event)
+
+
+def _stream_position(stream):
+    try:
+        return stream.tell()
+    except (AttributeError, IOError, ValueError):
+        # Not seekable, or closed by the driver.
+        return None
+
+
+def _stream_size(stream):
+    """
+    Find a stream's size without reading it, if it can seek.
+    """
+    try:
+        position = stream.tell()
+        stream.seek(0, 2)
+        size = stream.tell()
+        stream.seek(position)
+    except (AttributeError, IOError, ValueError):
+        return None
+
+    return size - position
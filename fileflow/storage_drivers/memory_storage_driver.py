@@ -0,0 +1,177 @@
+"""
+.. module:: storage_drivers.memory_storage_driver
+    :synopsis: In-memory implementation of the base StorageDriver for tests
+        and single process pipelines.
+"""
+
+import io
+import threading
+
+from .storage_driver import StorageDriver, StorageDriverError, DEFAULT_DATE_GRANULARITY, OUTPUT_NAME_SEPARATOR
+from ..concurrency import DEFAULT_WORKERS
+
+
+class MemoryStorageDriver(StorageDriver):
+    """
+    Read and write to a dictionary held in this process's memory.
+
+    Data is kept as encoded bytes, exactly as it would be on disk or in S3.
+    Everything is lost when the process exits, so this is only suitable for
+    tests and pipelines that run all of their tasks in one process. Use
+    :py:meth:`shared` to get the instance every task in the process sees.
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, max_bytes=None, date_granularity=DEFAULT_DATE_GRANULARITY):
+        """
+        :param int max_bytes: The most bytes of data the driver may hold at
+            once. None or 0 means no limit.
+        :param str date_granularity: How finely to tell execution dates apart.
+        """
+        super(MemoryStorageDriver, self).__init__(date_granularity=date_granularity)
+
+        self.max_bytes = max_bytes or None
+
+        # filename -> bytes
+        self._files = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, max_bytes=None, date_granularity=DEFAULT_DATE_GRANULARITY):
+        """
+        Get the process wide driver, creating it on first use.
+
+        Tasks each build their own storage driver, so they have to share
+        one underlying store for downstream tasks to see upstream output.
+        Every caller has to ask for the same settings: changing them under
+        tasks that already hold the driver would move their files.
+
+        :param int max_bytes: The memory cap of the shared driver.
+        :param str date_granularity: The date granularity of the shared
+            driver.
+        :return: The shared driver.
+        :rtype: MemoryStorageDriver
+        :raises StorageDriverError: If the shared driver was created with
+            other settings.
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls(max_bytes=max_bytes, date_granularity=date_granularity)
+            elif (max_bytes or None, date_granularity) != (cls._shared.max_bytes, cls._shared.date_granularity):
+                raise StorageDriverError(
+                    'The shared memory storage driver has max_bytes={} and date_granularity={}, '
+                    'not max_bytes={} and date_granularity={}'.format(
+                        cls._shared.max_bytes, cls._shared.date_granularity, max_bytes or None, date_granularity
+                    )
+                )
+
+            return cls._shared
+
+    def get_filename(self, dag_id, task_id, execution_date):
+        return '{path}/{date}'.format(
+            path=self.get_path(dag_id, task_id),
+            date=self.execution_date_string(execution_date)
+        )
+
+    def get_path(self, dag_id, task_id):
+        return 'memory://{dag_id}/{task_id}'.format(dag_id=dag_id, task_id=task_id)
+
+    def exists(self, dag_id, task_id, execution_date):
+        filename = self.get_filename(dag_id, task_id, execution_date)
+
+        with self._lock:
+            return filename in self._files
+
+    def read(self, dag_id, task_id, execution_date, encoding='utf-8'):
+        return self.read_bytes(dag_id, task_id, execution_date).decode(encoding)
+
+    def read_bytes(self, dag_id, task_id, execution_date):
+        return self._get(self.get_filename(dag_id, task_id, execution_date))
+
+    def get_read_stream(self, dag_id, task_id, execution_date):
+        # Stored bytes are never mutated, and BytesIO shares an immutable
+        # initial buffer until it is written to, so this does not copy.
+        return io.BytesIO(self._get(self.get_filename(dag_id, task_id, execution_date)))
+
+    def write(self, dag_id, task_id, execution_date, data, *args, **kwargs):
+        # Note that content_type isn't used here.
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+
+        filename = self.get_filename(dag_id, task_id, execution_date)
+
+        with self._lock:
+            new_total = self._total_bytes - len(self._files.get(filename, b'')) + len(data)
+
+            if self.max_bytes is not None and new_total > self.max_bytes:
+                message = 'Writing {size} bytes to {filename} would exceed the memory limit of {max_bytes} bytes.'.format(
+                    size=len(data),
+                    filename=filename,
+                    max_bytes=self.max_bytes
+                )
+                raise StorageDriverError(message)
+
+            self._files[filename] = data
+            self._total_bytes = new_total
+
+    def write_from_stream(self, dag_id, task_id, execution_date, stream, *args, **kwargs):
+        self.write(dag_id, task_id, execution_date, data=stream.read())
+
+    def delete(self, dag_id, task_id, execution_date):
+        self.delete_many([(dag_id, task_id, execution_date)])
+
+    def delete_many(self, task_instances, workers=DEFAULT_WORKERS):
+        filenames = [self.get_filename(*task_instance) for task_instance in task_instances]
+
+        with self._lock:
+            for filename in filenames:
+                self._total_bytes -= len(self._files.pop(filename, b''))
+
+    def list_filenames_in_path(self, path):
+        prefix = path.rstrip('/') + '/'
+
+        with self._lock:
+            filenames = list(self._files)
+
+        return sorted(
+            filename[len(prefix):] for filename in filenames
+            if filename.startswith(prefix) and '/' not in filename[len(prefix):]
+        )
+
+    def list_output_task_ids(self, dag_id, task_id):
+        dag_path = self.get_path(dag_id, '')
+
+        with self._lock:
+            filenames = list(self._files)
+
+        return sorted(set(
+            filename[len(dag_path):].split('/', 1)[0] for filename in filenames
+            if filename.startswith(dag_path + task_id + OUTPUT_NAME_SEPARATOR)
+        ))
+
+    def clear(self):
+        """
+        Throw away everything stored in the driver.
+        """
+        with self._lock:
+            self._files = {}
+            self._total_bytes = 0
+
+    @property
+    def total_bytes(self):
+        """
+        The number of bytes of data currently held.
+        """
+        return self._total_bytes
+
+    def _get(self, filename):
+        with self._lock:
+            data = self._files.get(filename)
+
+        if data is None:
+            raise StorageDriverError('In-memory file {filename} does not exist.'.format(filename=filename))
+
+        return data
@@ -0,0 +1,213 @@
+"""
+.. module:: storage_drivers.registry
+    :synopsis: Look up storage driver factories by storage type name.
+
+A storage driver factory is any callable that takes the resolved fileflow
+settings as keyword arguments (``storage_prefix``, ``environment``,
+``aws_access_key_id``, ``aws_secret_access_key``, ``aws_bucket_name`` and
+``date_granularity``) and returns a :py:class:`~fileflow.storage_drivers.storage_driver.StorageDriver`.
+Factories should accept ``**kwargs`` so new settings can be added later. The
+AWS credentials are None unless passed explicitly to
+:py:func:`~fileflow.storage_drivers.get_storage_driver`; drivers that need
+them should look them up with :py:func:`fileflow.configuration.get`. Any
+other settings they need are in :py:func:`fileflow.configuration.get_settings`.
+
+Factories can be registered in code with :py:func:`register_storage_driver`,
+or shipped in another package through a setuptools entry point in the
+``fileflow.storage_drivers`` group:
+
+.. code-block:: python
+
+    setup(
+        ...
+        entry_points={
+            'fileflow.storage_drivers': [
+                'my_driver = my_package.storage:make_my_driver',
+            ],
+        },
+    )
+
+Then set ``storage_type = my_driver`` in the fileflow section of airflow.cfg.
+Factories registered as a ``'module:attribute'`` string or through an entry
+point are only imported when their storage type is actually used.
+"""
+
+import importlib
+import threading
+
+from fileflow.errors import FileflowError
+from .storage_driver import DEFAULT_DATE_GRANULARITY
+
+ENTRY_POINT_GROUP = 'fileflow.storage_drivers'
+
+# storage type -> factory callable, or a 'module:attribute' string to import on first use
+_factories = {}
+_lock = threading.Lock()
+
+
+def register_storage_driver(storage_type, factory):
+    """
+    Register a storage driver factory under a storage type name, replacing
+    any factory already registered under that name.
+
+    :param str storage_type: The name to select the driver by.
+    :param factory: The factory callable, or a ``'module:attribute'`` string
+        naming it so that it's only imported when first used.
+    :type factory: callable | str
+    """
+    with _lock:
+        _factories[storage_type] = factory
+
+
+def get_storage_driver_factory(storage_type):
+    """
+    Get the factory for a storage type, importing it if needed.
+
+    Registered factories are checked first, then setuptools entry points.
+
+    :param str storage_type: The storage type name.
+    :return: The storage driver factory.
+    :rtype: callable
+    :raises FileflowError: If no driver is registered under the name.
+    """
+    with _lock:
+        factory = _factories.get(storage_type)
+
+    if factory is None:
+        factory = _load_entry_point(storage_type)
+
+    if factory is None:
+        raise FileflowError(
+            'Storage driver type {} does not exist.'.format(storage_type)
+        )
+
+    if not callable(factory):
+        factory = _import_factory(factory)
+
+    register_storage_driver(storage_type, factory)
+
+    return factory
+
+
+def _load_entry_point(storage_type):
+    # pkg_resources is slow to import, so only pay for it when a storage
+    # type isn't one we already know about.
+    import pkg_resources
+
+    for entry_point in pkg_resources.iter_entry_points(ENTRY_POINT_GROUP, storage_type):
+        return entry_point.load()
+
+    return None
+
+
+def _import_factory(path):
+    module_name, attribute = path.split(':')
+
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def _get_full_bucket_name(aws_bucket_name, environment):
+    """
+    Given any valid environment type name aside from production, append it to
+    the provided bucket name so buckets are tied to environments.
+    """
+    if environment in ['qa', 'development', 'test']:
+        return aws_bucket_name + environment
+    elif environment == 'production':
+        # For production leave the bucket name as-is.
+        return aws_bucket_name
+
+    raise FileflowError("ENVIRONMENT setting is net set correctly")
+
+
+def file_storage_driver_factory(storage_prefix, date_granularity=DEFAULT_DATE_GRANULARITY, **kwargs):
+    from .file_storage_driver import FileStorageDriver
+
+    # Here the storage prefix is used for the base path.
+    return FileStorageDriver(prefix=storage_prefix, date_granularity=date_granularity)
+
+
+def s3_storage_driver_factory(environment, aws_access_key_id, aws_secret_access_key, aws_bucket_name,
+                              date_granularity=DEFAULT_DATE_GRANULARITY, **kwargs):
+    from .s3_storage_driver import S3StorageDriver, get_key_layout
+    from .. import configuration
+    from ..rate_limit import get_rate_limiter
+    from ..retry import RetryBudget, RetryPolicy
+
+    if aws_access_key_id is None:
+        aws_access_key_id = configuration.get('fileflow', 'aws_access_key_id')
+
+    if aws_secret_access_key is None:
+        aws_secret_access_key = configuration.get('fileflow', 'aws_secret_access_key')
+
+    settings = configuration.get_settings()
+    bucket_name = _get_full_bucket_name(aws_bucket_name, environment)
+
+    rate_limiter = None
+    if settings.s3_rate_limit > 0:
+        rate_limiter = get_rate_limiter(
+            's3://' + bucket_name,
+            initial_rate=settings.s3_rate_limit,
+            min_rate=settings.s3_rate_limit_min,
+            max_rate=settings.s3_rate_limit_max
+        )
+
+    return S3StorageDriver(
+        access_key_id=aws_access_key_id,
+        secret_access_key=aws_secret_access_key,
+        bucket_name=bucket_name,
+        date_granularity=date_granularity,
+        key_layout=get_key_layout(settings.s3_key_layout_version),
+        legacy_key_layouts=[get_key_layout(version) for version in settings.s3_legacy_key_layout_versions],
+        retry_policy=RetryPolicy(
+            attempts=settings.s3_retry_attempts,
+            base_delay=settings.s3_retry_base_delay,
+            max_delay=settings.s3_retry_max_delay,
+            budget=RetryBudget(
+                ratio=settings.s3_retry_budget_ratio,
+                min_retries=settings.s3_retry_budget_min
+            ),
+            rate_limiter=rate_limiter
+        )
+    )
+
+
+def tiered_storage_driver_factory(storage_prefix, date_granularity=DEFAULT_DATE_GRANULARITY, **kwargs):
+    from .tiered_storage_driver import TieredStorageDriver
+
+    # Here the storage prefix is used for the local tier's base path.
+    return TieredStorageDriver(
+        hot=file_storage_driver_factory(storage_prefix=storage_prefix, date_granularity=date_granularity),
+        cold=s3_storage_driver_factory(date_granularity=date_granularity, **kwargs)
+    )
+
+
+def handoff_storage_driver_factory(date_granularity=DEFAULT_DATE_GRANULARITY, **kwargs):
+    from .handoff_storage_driver import HandoffStorageDriver
+    from ..configuration import get_settings
+
+    settings = get_settings()
+
+    return HandoffStorageDriver(
+        remote=s3_storage_driver_factory(date_granularity=date_granularity, **kwargs),
+        directory=settings.handoff_dir,
+        max_bytes=settings.handoff_max_bytes
+    )
+
+
+def memory_storage_driver_factory(date_granularity=DEFAULT_DATE_GRANULARITY, **kwargs):
+    from .memory_storage_driver import MemoryStorageDriver
+    from ..configuration import get_settings
+
+    # Every task in the process has to see the same data.
+    return MemoryStorageDriver.shared(
+        max_bytes=get_settings().memory_max_bytes,
+        date_granularity=date_granularity
+    )
+
+
+register_storage_driver('file', file_storage_driver_factory)
+register_storage_driver('s3', s3_storage_driver_factory)
+register_storage_driver('tiered', tiered_storage_driver_factory)
+register_storage_driver('memory', memory_storage_driver_factory)
+register_storage_driver('handoff', handoff_storage_driver_factory)
@@ -5,33 +5,132 @@
 .. moduleauthor:: David Barbarisi <dbarbarisi@industrydive.com>
 """
 
-import boto
+import hashlib
+import io
 
-from .storage_driver import StorageDriver, StorageDriverError
+from .storage_driver import StorageDriver, StorageDriverError, DEFAULT_DATE_GRANULARITY, OUTPUT_NAME_SEPARATOR
+from ..concurrency import DEFAULT_WORKERS, chunked, thread_map
+from ..retry import RetryPolicy
+
+# The most keys S3 accepts in a single multi-object delete request.
+MAX_KEYS_PER_DELETE = 1000
+
+# Writes larger than this are uploaded in parts, so a failure only repeats
+# the part that failed rather than the whole upload.
+MULTIPART_THRESHOLD = 64 * 1024 * 1024
+
+# The size of each part of a multipart upload. S3's minimum is 5MB.
+MULTIPART_PART_SIZE = 16 * 1024 * 1024
+
+
+class FlatKeyLayout(object):
+    """
+    Layout version 1: ``<dag_id>/<task_id>/<date>``.
+    """
+
+    version = 1
+
+    def get_prefix(self, dag_id, task_id):
+        return '{dag_id}/{task_id}'.format(dag_id=dag_id, task_id=task_id)
+
+
+class HashedKeyLayout(object):
+    """
+    Layout version 2: ``<shard>/<dag_id>/<task_id>/<date>``, where the shard
+    is the start of a hash of the DAG and task IDs.
+
+    S3 scales request rates per key prefix, so putting the shard first spreads
+    tasks that run in parallel across prefixes instead of every task of a
+    DAG sharing one. All of a task's dates still share a prefix, so listing a
+    task is still a single listing. A task's named outputs are in its
+    shard, so they can be listed together.
+    """
+
+    version = 2
+
+    def __init__(self, shard_length=4):
+        """
+        :param int shard_length: How many hex characters of the hash to use.
+        """
+        self.shard_length = shard_length
+
+    def get_prefix(self, dag_id, task_id):
+        prefix = '{dag_id}/{task_id}'.format(dag_id=dag_id, task_id=task_id)
+        # Hash the task's own ID, without any output name.
+        owner = '{dag_id}/{task_id}'.format(dag_id=dag_id, task_id=task_id.split(OUTPUT_NAME_SEPARATOR, 1)[0])
+        shard = hashlib.md5(owner.encode('utf-8')).hexdigest()[:self.shard_length]
+
+        return '{shard}/{prefix}'.format(shard=shard, prefix=prefix)
+
+
+# layout version -> layout class
+KEY_LAYOUTS = {
+    FlatKeyLayout.version: FlatKeyLayout,
+    HashedKeyLayout.version: HashedKeyLayout,
+}
+
+
+def get_key_layout(version):
+    """
+    Get the key layout for a layout version.
+
+    :param int version: The layout version.
+    :raises StorageDriverError: If there's no such layout.
+    """
+    try:
+        return KEY_LAYOUTS[int(version)]()
+    except KeyError:
+        raise StorageDriverError('S3 key layout version {} does not exist.'.format(version))
 
 
 class S3StorageDriver(StorageDriver):
     """
     Read and write to S3.
+
+    Every request to S3 is retried on throttling, server errors and dropped
+    connections according to the driver's :py:class:`~fileflow.retry.RetryPolicy`.
+
+    Keys are named by the key layout. When a key isn't found under it, reads
+    fall back to the legacy layouts, so switching layout doesn't lose track
+    of files written before the switch. Listing a task and deleting cover
+    every layout too.
     """
 
-    def __init__(self, access_key_id, secret_access_key, bucket_name):
+    def __init__(self, access_key_id, secret_access_key, bucket_name, retry_policy=None, key_layout=None,
+                 legacy_key_layouts=None, date_granularity=DEFAULT_DATE_GRANULARITY):
         """
         Set up the credentials and bucket name.
 
         :param str access_key_id: AWS credentials.
         :param str secret_access_key: AWS credentials.
         :param str bucket_name: The S3 bucket to use.
+        :param RetryPolicy retry_policy: How to retry failed requests.
+            Defaults to :py:class:`~fileflow.retry.RetryPolicy` defaults.
+        :param key_layout: How to name new keys. Defaults to
+            :py:class:`FlatKeyLayout`.
+        :type key_layout: FlatKeyLayout | HashedKeyLayout
+        :param list legacy_key_layouts: Older layouts to also look for keys in.
+        :param str date_granularity: How finely to tell execution dates apart.
         """
-        super(S3StorageDriver, self).__init__()
+        super(S3StorageDriver, self).__init__(date_granularity=date_granularity)
+
+        self.key_layout = key_layout if key_layout is not None else FlatKeyLayout()
+        self.legacy_key_layouts = [
+            layout for layout in legacy_key_layouts or []
+            if layout.version != self.key_layout.version
+        ]
+
+        # boto is slow to import, so only load it once S3 is actually used.
+        import boto
 
         self.bucket_name = bucket_name
+        self.retry = retry_policy if retry_policy is not None else RetryPolicy()
 
         self.s3 = boto.connect_s3(
             aws_access_key_id=access_key_id,
             aws_secret_access_key=secret_access_key
         )
-        self.bucket = self.s3.get_bucket(self.bucket_name)
+        self.bucket = self.retry.call(self.s3.get_bucket, self.bucket_name)
 
     def get_filename(self, dag_id, task_id, execution_date):
 
@@ -41,13 +140,12 @@ class S3StorageDriver(StorageDriver):
         )
 
     def get_path(self, dag_id, task_id):
-        return 's3://{bucket_name}/{dag_id}/{task_id}'.format(
+        return 's3://{bucket_name}/{prefix}'.format(
             bucket_name=self.bucket_name,
-            dag_id=dag_id,
-            task_id=task_id
+            prefix=self.key_layout.get_prefix(dag_id, task_id)
         )
 
-    def get_key_name(self, dag_id, task_id, execution_date):
+    def get_key_name(self, dag_id, task_id, execution_date, key_layout=None):
         """
         Formats the S3 key name for the given task instance.
 
@@ -55,21 +153,78 @@ class S3StorageDriver(StorageDriver):
         :param str task_id: The airflow task ID.
         :param datetime.datetime execution_date: The execution date of the task
             instance.
+        :param key_layout: The layout to use instead of the driver's.
         :return: The S3 key name.
         :rtype: str
         """
-        return '{dag_id}/{task_id}/{date}'.format(
-            dag_id=dag_id,
-            task_id=task_id,
+        key_layout = key_layout or self.key_layout
+
+        return '{prefix}/{date}'.format(
+            prefix=key_layout.get_prefix(dag_id, task_id),
             date=self.execution_date_string(execution_date)
         )
 
+    def get_existing_key(self, dag_id, task_id, execution_date):
+        """
+        Find a task instance's key under the key layout or, failing that, the
+        legacy layouts.
+
+        :return: The boto key, or None if there isn't one.
+        :rtype: boto.s3.key.Key | None
+        """
+        for key_layout in [self.key_layout] + self.legacy_key_layouts:
+            key = self.retry.call(
+                self.bucket.get_key,
+                self.get_key_name(dag_id, task_id, execution_date, key_layout)
+            )
+
+            if key is not None:
+                return key
+
+        return None
+
+    def get_etag(self, dag_id, task_id, execution_date):
+        # The ETag comes back with the HEAD request get_existing_key makes.
+        key = self.get_existing_key(dag_id, task_id, execution_date)
+
+        if key is None or not key.etag:
+            return None
+
+        return key.etag.strip('"')
+
+    def compute_etag(self, stream):
+        """
+        S3's ETag is the MD5 of the data for a single upload. For a multipart
+        upload it's the MD5 of the parts' MD5s, followed by the number of
+        parts.
+        """
+        md5 = hashlib.md5()
+        part_digests = []
+        size = 0
+
+        for part in iter(lambda: stream.read(MULTIPART_PART_SIZE), b''):
+            md5.update(part)
+            part_digests.append(hashlib.md5(part).digest())
+            size += len(part)
+
+        if size > MULTIPART_THRESHOLD:
+            return '{}-{}'.format(hashlib.md5(b''.join(part_digests)).hexdigest(), len(part_digests))
+
+        return md5.hexdigest()
+
+    def exists(self, dag_id, task_id, execution_date):
+        # A HEAD request per key layout; nothing is downloaded.
+        return self.get_existing_key(dag_id, task_id, execution_date) is not None
+
     def read(self, dag_id, task_id, execution_date, encoding='utf-8'):
+        return self.read_bytes(dag_id, task_id, execution_date).decode(encoding)
+
+    def read_bytes(self, dag_id, task_id, execution_date):
         key_name = self.get_key_name(dag_id, task_id, execution_date)
-        key = self.bucket.get_key(key_name)
+        key = self.get_existing_key(dag_id, task_id, execution_date)
 
         if key is not None:
-            return key.get_contents_as_string(encoding=encoding)
+            return self.retry.call(key.get_contents_as_string)
 
         message = \
             'S3 key named {key_name} in bucket {bucket_name} does not exist.'.format(key_name=key_name,
@@ -79,12 +234,19 @@ class S3StorageDriver(StorageDriver):
 
     def get_read_stream(self, dag_id, task_id, execution_date):
         key_name = self.get_key_name(dag_id, task_id, execution_date)
-        key = self.bucket.get_key(key_name)
+        key = self.get_existing_key(dag_id, task_id, execution_date)
 
         if key is not None:
             import tempfile
             temp_file_stream = tempfile.TemporaryFile(mode='w+b')
-            key.get_file(temp_file_stream)
+
+            def download():
+                # Throw away anything a failed attempt got.
+                temp_file_stream.seek(0)
+                temp_file_stream.truncate()
+                key.get_file(temp_file_stream)
+
+            self.retry.call(download)
 
             # Stream has been read in and is now at the end
             # So reset it to the start
@@ -103,15 +265,75 @@ class S3StorageDriver(StorageDriver):
 
         :param string content_type: The content-type. If set to None, it is not set.
         """
-        key_name = self.get_key_name(dag_id, task_id, execution_date)
+        # Encode first, so large writes are told apart by their size in bytes.
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+
+        self.upload(self.get_key_name(dag_id, task_id, execution_date), data, content_type)
+
+    def write_bytes(self, dag_id, task_id, execution_date, data, content_type='application/octet-stream'):
+        """
+        :param str|None content_type: The content-type, or None not to set it.
+        """
+        self.upload(self.get_key_name(dag_id, task_id, execution_date), data, content_type)
+
+    def upload(self, key_name, data, content_type='text/plain'):
+        """
+        Upload data to a key, in parts if it's large enough. Each request is
+        retried.
+
+        :param str key_name: The name of the S3 key.
+        :param bytes data: The data to write.
+        :param str|None content_type: The content-type, or None not to set it.
+        """
+        if len(data) > MULTIPART_THRESHOLD:
+            self.write_multipart(key_name, data, content_type)
+            return
 
         key = self.get_or_create_key(key_name)
 
         if content_type is not None:
             key.set_metadata('Content-Type', content_type)
 
-        key.set_contents_from_string(data)
-        key.set_acl('private')
+        self.retry.call(key.set_contents_from_string, data)
+        self.retry.call(key.set_acl, 'private')
+
+    def write_multipart(self, key_name, data, content_type='text/plain', workers=DEFAULT_WORKERS):
+        """
+        Upload data as a multipart upload, several parts at a time. Each part
+        is retried on its own. If the upload fails, it is aborted so S3
+        doesn't keep the parts.
+
+        :param str key_name: The name of the S3 key.
+        :param data: The data to write. Unicode is encoded as utf-8.
+        :type data: str | unicode
+        :param str|None content_type: The content-type, or None not to set it.
+        :param int workers: How many parts to upload at once.
+        """
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+
+        headers = {'Content-Type': content_type} if content_type is not None else None
+        upload = self.retry.call(self.bucket.initiate_multipart_upload, key_name, headers=headers, policy='private')
+
+        def upload_part(part):
+            part_number, offset = part
+            # A fresh file object per attempt, so retries start from the beginning of the part.
+            self.retry.call(
+                lambda: upload.upload_part_from_file(
+                    io.BytesIO(data[offset:offset + MULTIPART_PART_SIZE]),
+                    part_number
+                )
+            )
+
+        parts = list(enumerate(range(0, len(data), MULTIPART_PART_SIZE), 1))
+
+        try:
+            thread_map(upload_part, parts, workers=workers)
+            self.retry.call(upload.complete_upload)
+        except Exception:
+            upload.cancel_upload()
+            raise
 
     def write_from_stream(self, dag_id, task_id, execution_date, stream, content_type='text/plain', *args, **kwargs):
         """
@@ -121,6 +343,41 @@ class S3StorageDriver(StorageDriver):
         str = stream.read()
         self.write(dag_id, task_id, execution_date, str, content_type)
 
+    def delete(self, dag_id, task_id, execution_date):
+        # S3 deletes are idempotent so a missing key is not an error.
+        for key_layout in [self.key_layout] + self.legacy_key_layouts:
+            self.retry.call(self.bucket.delete_key, self.get_key_name(dag_id, task_id, execution_date, key_layout))
+
+    def delete_many(self, task_instances, workers=DEFAULT_WORKERS):
+        """
+        Delete the keys for many task instances using S3's multi-object
+        delete, sending up to 1000 keys per request and several requests in
+        parallel.
+
+        :raises StorageDriverError: If S3 reports any key it failed to delete.
+        """
+        key_names = [
+            self.get_key_name(dag_id, task_id, execution_date, key_layout)
+            for dag_id, task_id, execution_date in task_instances
+            for key_layout in [self.key_layout] + self.legacy_key_layouts
+        ]
+
+        results = thread_map(
+            lambda batch: self.retry.call(self.bucket.delete_keys, batch, quiet=True),
+            chunked(key_names, MAX_KEYS_PER_DELETE),
+            workers=workers
+        )
+
+        errors = [error for result in results for error in result.errors]
+
+        if errors:
+            message = 'Failed to delete {count} keys from bucket {bucket_name}: {details}'.format(
+                count=len(errors),
+                bucket_name=self.bucket_name,
+                details=', '.join('{} ({})'.format(error.key, error.code) for error in errors)
+            )
+            raise StorageDriverError(message)
+
     def list_filenames_in_path(self, path):
         """
         This requires some special treatment. The path here is the full url
@@ -138,10 +395,59 @@ class S3StorageDriver(StorageDriver):
         # already be there and then appending one.
         prefix = prefix.rstrip('/') + '/'
 
-        results = self.bucket.list(prefix=prefix)
+        # Cut the path prefix off the key names.
+        return [name[len(prefix):] for name in self.list_key_names(prefix)]
+
+    def list_key_names(self, prefix):
+        """
+        List the names of the keys starting with prefix.
+
+        :param str prefix: The start of the key names.
+        :rtype: list[str]
+        """
+        # Fetch the listing a page at a time so a failure only repeats the
+        # page that failed.
+        key_names = []
+        marker = ''
+        while True:
+            page = self.retry.call(self.bucket.get_all_keys, prefix=prefix, marker=marker)
+            key_names.extend(k.name for k in page)
+
+            if not page.is_truncated or not len(page):
+                break
+            marker = page[-1].name
+
+        return key_names
+
+    def list_output_task_ids(self, dag_id, task_id):
+        """
+        List the task's named outputs under the key layout and the legacy
+        layouts.
+        """
+        task_ids = set()
+        for key_layout in [self.key_layout] + self.legacy_key_layouts:
+            prefix = key_layout.get_prefix(dag_id, task_id + OUTPUT_NAME_SEPARATOR)
+            # Where the task ID starts in the key names.
+            start = len(prefix) - len(task_id + OUTPUT_NAME_SEPARATOR)
+
+            task_ids.update(name[start:].split('/', 1)[0] for name in self.list_key_names(prefix))
+
+        return sorted(task_ids)
+
+    def list_filenames_in_task(self, dag_id, task_id):
+        """
+        List the task's files under the key layout and the legacy layouts.
+        """
+        filenames = set()
+        for key_layout in [self.key_layout] + self.legacy_key_layouts:
+            filenames.update(self.list_filenames_in_path(
+                's3://{bucket_name}/{prefix}'.format(
+                    bucket_name=self.bucket_name,
+                    prefix=key_layout.get_prefix(dag_id, task_id)
+                )
+            ))
 
-        # Get the key names from all found keys and cut off the path prefix.
-        return [k.name[len(prefix):] for k in results]
+        return sorted(filenames)
 
     def get_or_create_key(self, key_name):
         """
@@ -152,7 +458,7 @@ class S3StorageDriver(StorageDriver):
         :return: A boto key object.
         :rtype: boto.s3.key.Key
         """
-        key = self.bucket.get_key(key_name)
+        key = self.retry.call(self.bucket.get_key, key_name)
 
         if key is None:
             key = self.bucket.new_key(key_name)
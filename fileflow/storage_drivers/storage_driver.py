@@ -5,6 +5,35 @@
 .. moduleauthor:: David Barbarisi <dbarbarisi@industrydive.com>
 """
 
+import bisect
+import datetime
+
+from ..concurrency import DEFAULT_WORKERS, thread_map
+
+# How finely execution dates are told apart in file names, and the
+# strftime format for each. Every format is fixed width with the most
+# significant field first, so sorting names as strings sorts them in time
+# order. The time is in ISO 8601 basic format, without colons, since colons
+# aren't allowed in file names everywhere.
+DATE_FORMATS = {
+    'day': '%Y-%m-%d',
+    'hour': '%Y-%m-%dT%H',
+    'minute': '%Y-%m-%dT%H%M',
+    'second': '%Y-%m-%dT%H%M%S',
+    'microsecond': '%Y-%m-%dT%H%M%S.%f',
+}
+
+DEFAULT_DATE_GRANULARITY = 'day'
+
+# Separates a task ID from an output name in the task ID a named output is
+# stored under, eg. 'the_task~summary'. Airflow doesn't allow it in task IDs,
+# so a named output never shares its storage with another task's output.
+OUTPUT_NAME_SEPARATOR = '~'
+
+# exists_many lists a task's outputs once, instead of checking each one, when
+# it is asked about at least this many execution dates of the task.
+EXISTS_LIST_THRESHOLD = 4
+
 
 class StorageDriver(object):
     """
@@ -30,6 +59,20 @@ class StorageDriver(object):
         self.assertEqual(1, self.sensor.storage.read.call_count)
     """
 
+    def __init__(self, date_granularity=DEFAULT_DATE_GRANULARITY):
+        """
+        :param str date_granularity: How finely to tell execution dates apart
+            in file names: 'day', 'hour', 'minute', 'second' or
+            'microsecond'. Task instances whose execution dates only differ
+            by less than this share a file.
+        """
+        if date_granularity not in DATE_FORMATS:
+            raise StorageDriverError('Execution date granularity {} does not exist. Use one of: {}'.format(
+                date_granularity, ', '.join(sorted(DATE_FORMATS))
+            ))
+
+        self.date_granularity = date_granularity
+
     def get_filename(self, dag_id, task_id, execution_date):
         """
         Return an identifying path or URL to the file related to an airflow
@@ -60,11 +103,106 @@ class StorageDriver(object):
         """
         raise NotImplementedError()
 
+    def get_local_path(self, dag_id, task_id, execution_date):
+        """
+        Return the path of the task instance's file on the local file system,
+        if the driver keeps it there, so that it can be opened or memory
+        mapped directly.
+
+        :param str dag_id: The airflow DAG ID.
+        :param str task_id: The airflow task ID.
+        :param datetime.datetime execution_date: The datetime for the task
+            instance.
+        :return: The local path, or None if the file isn't stored locally.
+        :rtype: str | None
+        """
+        return None
+
+    def get_etag(self, dag_id, task_id, execution_date):
+        """
+        Return a tag that changes whenever the task instance's file changes,
+        such as S3's ETag, so a copy of the file kept elsewhere can be
+        checked without downloading it again.
+
+        :param str dag_id: The airflow DAG ID.
+        :param str task_id: The airflow task ID.
+        :param datetime.datetime execution_date: The datetime for the task
+            instance.
+        :return: The tag, or None if the file doesn't exist or the driver
+            can't tell.
+        :rtype: str | None
+        """
+        return None
+
+    def compute_etag(self, stream):
+        """
+        Work out the tag :py:meth:`get_etag` would return for a file holding
+        the data in stream, without asking the driver, eg. for data just
+        written.
+
+        :param stream: A binary file object, read to the end.
+        :return: The tag, or None if the driver can't tell.
+        :rtype: str | None
+        """
+        return None
+
+    def exists(self, dag_id, task_id, execution_date):
+        """
+        Whether the airflow task instance has written its output.
+
+        Lists the task's outputs unless a concrete storage driver has a
+        cheaper way, such as a single metadata request.
+
+        :param str dag_id: The airflow DAG ID.
+        :param str task_id: The airflow task ID.
+        :param datetime.datetime execution_date: The datetime for the task
+            instance.
+        :rtype: bool
+        """
+        return self.execution_date_string(execution_date) in self.list_filenames_in_task(dag_id, task_id)
+
+    def exists_many(self, task_instances, workers=DEFAULT_WORKERS):
+        """
+        Whether each of many airflow task instances has written its output.
+
+        A task asked about for several execution dates has its outputs
+        listed once; the rest are checked with :py:meth:`exists`, several at
+        a time.
+
+        :param task_instances: (dag_id, task_id, execution_date) tuples.
+        :type task_instances: list[tuple]
+        :param int workers: How many checks to run at once.
+        :return: Whether each task instance's output exists, in order.
+        :rtype: list[bool]
+        """
+        task_instances = list(task_instances)
+
+        by_task = {}
+        for dag_id, task_id, execution_date in task_instances:
+            by_task.setdefault((dag_id, task_id), []).append(execution_date)
+
+        def check(task):
+            execution_dates = by_task[task]
+
+            if len(execution_dates) >= EXISTS_LIST_THRESHOLD:
+                filenames = set(self.list_filenames_in_task(*task))
+                found = [self.execution_date_string(date) in filenames for date in execution_dates]
+            else:
+                found = [self.exists(task[0], task[1], date) for date in execution_dates]
+
+            return dict(zip(execution_dates, found))
+
+        tasks = list(by_task)
+        results = dict(zip(tasks, thread_map(check, tasks, workers=workers)))
+
+        return [results[(dag_id, task_id)][execution_date] for dag_id, task_id, execution_date in task_instances]
+
     def read(self, dag_id, task_id, execution_date, encoding):
         """
         Read the data output from the given airflow task instance.
 
-        Concrete storage drivers should implement this method.
+        Decodes what :py:meth:`read_bytes` returns. Concrete storage drivers
+        only need to override this if they can decode more cheaply.
 
         :param str dag_id: The airflow DAG ID.
         :param str task_id: The airflow task ID.
@@ -74,7 +212,29 @@ class StorageDriver(object):
         :return: The data from the file.
         :rtype: str
         """
-        raise NotImplementedError()
+        return self.read_bytes(dag_id, task_id, execution_date).decode(encoding)
+
+    def read_bytes(self, dag_id, task_id, execution_date):
+        """
+        Read the raw bytes output from the given airflow task instance,
+        without decoding them.
+
+        Reads the whole of :py:meth:`get_read_stream` unless a concrete
+        storage driver has a faster way.
+
+        :param str dag_id: The airflow DAG ID.
+        :param str task_id: The airflow task ID.
+        :param datetime.datetime execution_date: The datetime for the task
+            instance.
+        :return: The contents of the file.
+        :rtype: bytes
+        """
+        stream = self.get_read_stream(dag_id, task_id, execution_date)
+
+        try:
+            return stream.read()
+        finally:
+            stream.close()
 
     def get_read_stream(self, dag_id, task_id, execution_date):
         """
@@ -122,16 +282,117 @@ class StorageDriver(object):
         """
         raise NotImplementedError()
 
+    def write_bytes(self, dag_id, task_id, execution_date, data, content_type='application/octet-stream'):
+        """
+        Write raw bytes to the output file identified by the airflow task
+        instance, without encoding them.
+
+        Passes the bytes to :py:meth:`write` unless a concrete storage driver
+        has a faster way.
+
+        :param str dag_id: The airflow DAG ID.
+        :param str task_id: The airflow task ID.
+        :param datetime.datetime execution_date: The datetime for the task
+            instance.
+        :param bytes data: The data to write.
+        :param str content_type: The Content-Type to use, where the storage
+            keeps one.
+        """
+        self.write(dag_id, task_id, execution_date, data, content_type=content_type)
+
+    def delete(self, dag_id, task_id, execution_date):
+        """
+        Delete the output file identified by the airflow task instance.
+
+        Deleting a file that does not exist is not an error.
+
+        Concrete storage drivers should implement this method.
+
+        :param str dag_id: The airflow DAG ID.
+        :param str task_id: The airflow task ID.
+        :param datetime.datetime execution_date: The datetime for the task
+            instance.
+        """
+        raise NotImplementedError()
+
+    def delete_many(self, task_instances, workers=DEFAULT_WORKERS):
+        """
+        Delete the output files of many task instances at once.
+
+        This base implementation calls delete once per task instance.
+        Concrete storage drivers should override it with something that
+        batches or parallelizes the work.
+
+        :param task_instances: An iterable of (dag_id, task_id,
+            execution_date) tuples.
+        :param int workers: The maximum number of concurrent requests a
+            driver may use.
+        """
+        for dag_id, task_id, execution_date in task_instances:
+            self.delete(dag_id, task_id, execution_date)
+
+    def clear_task_outputs(self, dag_id, task_id, date_range, workers=DEFAULT_WORKERS):
+        """
+        Delete a task's output files for every execution date in a range,
+        including its named outputs.
+
+        Useful to clean up before a backfill or after a failed run.
+
+        :param str dag_id: The DAG ID of the task.
+        :param str task_id: The task ID.
+        :param date_range: An iterable of execution dates to clear.
+        :type date_range: list[datetime.datetime]
+        :param int workers: The maximum number of concurrent requests a
+            driver may use.
+        """
+        date_range = list(date_range)
+        task_ids = [task_id] + self.list_output_task_ids(dag_id, task_id)
+
+        self.delete_many(
+            [(dag_id, output_task_id, execution_date) for output_task_id in task_ids for execution_date in date_range],
+            workers=workers
+        )
+
+    def flush(self):
+        """
+        Block until every write made through this driver is durable.
+
+        Drivers that write synchronously have nothing to do here. Drivers
+        that buffer or upload in the background should override this and
+        raise a :py:class:`StorageDriverError` if any write failed.
+        """
+        pass
+
     def execution_date_string(self, execution_date):
         """
         Format the execution date per our standard file naming convention.
 
+        Dates with a timezone are converted to UTC first; naive dates are
+        assumed to be UTC already, as airflow's are.
+
         :param datetime.datetime execution_date: The airflow task instance
             execution date.
         :return: The formatted date string.
         :rtype: str
         """
-        return execution_date.strftime("%Y-%m-%d")
+        offset = execution_date.utcoffset()
+        if offset is not None:
+            execution_date = (execution_date - offset).replace(tzinfo=None)
+
+        return execution_date.strftime(DATE_FORMATS[self.date_granularity])
+
+    def parse_execution_date_string(self, date_string):
+        """
+        Turn a file name made by :py:meth:`execution_date_string` back into
+        the execution date, in UTC.
+
+        :param str date_string: The file name.
+        :return: The execution date, without a timezone.
+        :rtype: datetime.datetime
+        :raises ValueError: If the name isn't a date string of the driver's
+            granularity.
+        """
+        return datetime.datetime.strptime(date_string, DATE_FORMATS[self.date_granularity])
 
     def list_filenames_in_path(self, path):
         """
@@ -163,6 +424,45 @@ class StorageDriver(object):
 
         return self.list_filenames_in_path(the_path)
 
+    def list_output_task_ids(self, dag_id, task_id):
+        """
+        List the task IDs a task's named outputs are stored under, eg.
+        ``the_task~summary``. See
+        :py:func:`~fileflow.task_runners.task_runner.get_output_task_id`.
+
+        Drivers that can't list them return an empty list.
+
+        :param str dag_id: The DAG ID of the task.
+        :param str task_id: The task ID.
+        :return: The task IDs, sorted.
+        :rtype: list[str]
+        """
+        return []
+
+    def list_filenames_in_task_between(self, dag_id, task_id, start=None, end=None):
+        """
+        Get the filenames stored by a task for execution dates from start to
+        end inclusive, oldest first. The last one is the latest output.
+
+        File names sort in time order, so this is a listing of the task
+        followed by a binary search for each end of the range.
+
+        :param str dag_id: The DAG ID of the task.
+        :param str task_id: The task ID.
+        :param datetime.datetime start: The earliest execution date, or None
+            for no lower bound.
+        :param datetime.datetime end: The latest execution date, or None for
+            no upper bound.
+        :return: The file names in time order.
+        :rtype: list[str]
+        """
+        filenames = sorted(self.list_filenames_in_task(dag_id, task_id))
+
+        low = 0 if start is None else bisect.bisect_left(filenames, self.execution_date_string(start))
+        high = len(filenames) if end is None else bisect.bisect_right(filenames, self.execution_date_string(end))
+
+        return filenames[low:high]
+
 
 class StorageDriverError(Exception):
     """
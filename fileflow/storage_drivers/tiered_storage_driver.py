@@ -0,0 +1,259 @@
+"""
+.. module:: storage_drivers.tiered_storage_driver
+    :synopsis: Local disk hot tier in front of a remote cold tier, such as S3.
+"""
+
+import errno
+import os
+import shutil
+import tempfile
+import threading
+from multiprocessing.pool import ThreadPool
+
+from .storage_driver import StorageDriver, StorageDriverError
+from ..concurrency import DEFAULT_WORKERS
+from ..instrumentation import note_cache_hit
+
+
+class TieredStorageDriver(StorageDriver):
+    """
+    Compose a fast local :py:class:`~fileflow.storage_drivers.file_storage_driver.FileStorageDriver`
+    hot tier with a durable cold tier, usually an
+    :py:class:`~fileflow.storage_drivers.s3_storage_driver.S3StorageDriver`.
+
+    Writes land on local disk first and are uploaded to the cold tier in the
+    background (write-behind). Call :py:meth:`flush` to block until every
+    upload has finished; :py:class:`~fileflow.operators.DivePythonOperator`
+    does this when the task's callable returns.
+
+    Reads are served from local disk when the local copy matches the cold
+    tier's. Otherwise the file is fetched from the cold tier and kept
+    locally, so later tasks on the same worker only ask the cold tier for
+    its ETag. Downloads are written to a temporary file and renamed into
+    place, so a reader never sees a partial copy.
+
+    The cold tier is the source of truth for naming and listing: filenames and
+    paths are the cold tier's. Local copies are checked against the ETag the
+    cold tier reports, eg. after an upstream task reran on another worker.
+    When the cold tier can't tell, which is the case for drivers that don't
+    implement :py:meth:`~fileflow.storage_drivers.storage_driver.StorageDriver.get_etag`
+    and for files whose upload failed, the local copy is used.
+    """
+
+    def __init__(self, hot, cold, workers=DEFAULT_WORKERS):
+        """
+        :param FileStorageDriver hot: The local storage driver.
+        :param StorageDriver cold: The remote, authoritative storage driver.
+        :param int workers: The number of background upload threads.
+        """
+        # Both tiers have to name files alike, so follow the cold tier.
+        super(TieredStorageDriver, self).__init__(date_granularity=cold.date_granularity)
+
+        self.hot = hot
+        self.cold = cold
+        self.workers = workers
+
+        # Upload thread pool; created on the first write.
+        self._pool = None
+        # (dag_id, task_id, execution_date) -> pending upload AsyncResults.
+        self._pending = {}
+        self._lock = threading.Lock()
+        # Local filename -> (mtime, size, ETag), so unchanged local copies
+        # aren't hashed again on every read.
+        self._local_etags = {}
+
+    def get_filename(self, dag_id, task_id, execution_date):
+        return self.cold.get_filename(dag_id, task_id, execution_date)
+
+    def get_path(self, dag_id, task_id):
+        return self.cold.get_path(dag_id, task_id)
+
+    def get_local_path(self, dag_id, task_id, execution_date):
+        self._ensure_local(dag_id, task_id, execution_date)
+
+        return self.hot.get_local_path(dag_id, task_id, execution_date)
+
+    def exists(self, dag_id, task_id, execution_date):
+        if self.hot.exists(dag_id, task_id, execution_date):
+            return True
+
+        return self.cold.exists(dag_id, task_id, execution_date)
+
+    def read(self, dag_id, task_id, execution_date, encoding='utf-8'):
+        self._ensure_local(dag_id, task_id, execution_date)
+
+        return self.hot.read(dag_id, task_id, execution_date, encoding=encoding)
+
+    def read_bytes(self, dag_id, task_id, execution_date):
+        self._ensure_local(dag_id, task_id, execution_date)
+
+        return self.hot.read_bytes(dag_id, task_id, execution_date)
+
+    def get_read_stream(self, dag_id, task_id, execution_date):
+        self._ensure_local(dag_id, task_id, execution_date)
+
+        return self.hot.get_read_stream(dag_id, task_id, execution_date)
+
+    def write(self, dag_id, task_id, execution_date, data, content_type='text/plain', *args, **kwargs):
+        self._wait_for_upload(dag_id, task_id, execution_date)
+        self.hot.write(dag_id, task_id, execution_date, data)
+        self._schedule_upload(dag_id, task_id, execution_date, content_type)
+
+    def write_bytes(self, dag_id, task_id, execution_date, data, content_type='application/octet-stream'):
+        self._wait_for_upload(dag_id, task_id, execution_date)
+        self.hot.write_bytes(dag_id, task_id, execution_date, data)
+        self._schedule_upload(dag_id, task_id, execution_date, content_type)
+
+    def write_from_stream(self, dag_id, task_id, execution_date, stream, content_type='text/plain', *args, **kwargs):
+        self._wait_for_upload(dag_id, task_id, execution_date)
+        self.hot.write_from_stream(dag_id, task_id, execution_date, stream)
+        self._schedule_upload(dag_id, task_id, execution_date, content_type)
+
+    def delete(self, dag_id, task_id, execution_date):
+        # Let any in-flight upload land first so it can't resurrect the file.
+        self._wait_for_upload(dag_id, task_id, execution_date)
+        self.hot.delete(dag_id, task_id, execution_date)
+        self.cold.delete(dag_id, task_id, execution_date)
+
+    def delete_many(self, task_instances, workers=DEFAULT_WORKERS):
+        task_instances = list(task_instances)
+
+        self.flush()
+        self.hot.delete_many(task_instances, workers=workers)
+        self.cold.delete_many(task_instances, workers=workers)
+
+    def list_filenames_in_path(self, path):
+        # Pending uploads are not visible in the cold tier yet.
+        self.flush()
+
+        return self.cold.list_filenames_in_path(path)
+
+    def list_output_task_ids(self, dag_id, task_id):
+        self.flush()
+
+        return self.cold.list_output_task_ids(dag_id, task_id)
+
+    def flush(self):
+        """
+        Block until every pending upload to the cold tier has finished.
+
+        :raises StorageDriverError: If any upload failed. The local copies of
+            failed uploads are kept.
+        """
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+            pool = self._pool
+            self._pool = None
+
+        failures = []
+        for task_instance, results in pending.items():
+            for result in results:
+                try:
+                    result.get()
+                except Exception as e:
+                    failures.append('{} ({})'.format(self.get_filename(*task_instance), e))
+
+        # Every upload it was given has finished; the next write starts a new
+        # pool.
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+        if failures:
+            raise StorageDriverError(
+                'Failed to upload {count} files to the cold tier: {details}'.format(
+                    count=len(failures),
+                    details=', '.join(failures)
+                )
+            )
+
+    def _ensure_local(self, dag_id, task_id, execution_date):
+        """
+        Copy the task instance's file from the cold tier to local disk unless
+        the local copy matches the cold tier's.
+        """
+        # Until its upload lands, the cold tier has an older file, if any.
+        self._wait_for_upload(dag_id, task_id, execution_date)
+
+        filename = self.hot.get_filename(dag_id, task_id, execution_date)
+
+        if os.path.isfile(filename):
+            cold_etag = self.cold.get_etag(dag_id, task_id, execution_date)
+
+            if cold_etag is None or self._local_etag(filename) == cold_etag:
+                note_cache_hit(True)
+                return
+
+        note_cache_hit(False)
+        self.hot.check_or_create_dir(os.path.dirname(filename))
+
+        fd, temp_filename = tempfile.mkstemp(dir=os.path.dirname(filename), prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                stream = self.cold.get_read_stream(dag_id, task_id, execution_date)
+                try:
+                    shutil.copyfileobj(stream, f)
+                finally:
+                    stream.close()
+
+            os.rename(temp_filename, filename)
+        except Exception:
+            try:
+                os.remove(temp_filename)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+            raise
+
+    def _local_etag(self, filename):
+        """
+        The ETag the cold tier would give the local copy.
+
+        :rtype: str | None
+        """
+        stat = os.stat(filename)
+        cached = self._local_etags.get(filename)
+
+        if cached is not None and cached[:2] == (stat.st_mtime, stat.st_size):
+            return cached[2]
+
+        with open(filename, 'rb') as f:
+            etag = self.cold.compute_etag(f)
+
+        self._local_etags[filename] = (stat.st_mtime, stat.st_size, etag)
+
+        return etag
+
+    def _schedule_upload(self, dag_id, task_id, execution_date, content_type):
+        """
+        Queue an upload of the local file to the cold tier.
+        """
+        task_instance = (dag_id, task_id, execution_date)
+
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPool(self.workers)
+
+            result = self._pool.apply_async(self._upload, task_instance + (content_type,))
+            self._pending.setdefault(task_instance, []).append(result)
+
+    def _wait_for_upload(self, dag_id, task_id, execution_date):
+        """
+        Wait for uploads of this task instance's file to finish so that the
+        local file isn't changed while it's being read for upload.
+
+        Failures are left for :py:meth:`flush` to report.
+        """
+        with self._lock:
+            results = list(self._pending.get((dag_id, task_id, execution_date), []))
+
+        for result in results:
+            result.wait()
+
+    def _upload(self, dag_id, task_id, execution_date, content_type):
+        """
+        Upload the local file for the task instance to the cold tier.
+        """
+        with open(self.hot.get_filename(dag_id, task_id, execution_date), 'rb') as f:
+            self.cold.write_from_stream(dag_id, task_id, execution_date, f, content_type=content_type)
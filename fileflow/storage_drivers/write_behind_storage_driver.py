@@ -0,0 +1,268 @@
+"""
+.. module:: storage_drivers.write_behind_storage_driver
+    :synopsis: Wrap a StorageDriver so writes upload in the background while the task carries on.
+"""
+
+import io
+import threading
+from multiprocessing.pool import ThreadPool
+
+from .storage_driver import StorageDriver, StorageDriverError
+from ..concurrency import DEFAULT_WORKERS
+
+# The default limits on writes waiting to be uploaded: their total size in
+# bytes, and how many there are.
+DEFAULT_MAX_PENDING_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_PENDING_WRITES = 64
+
+
+def _byte_size(data):
+    """
+    How many bytes data takes once stored. Text is written as UTF-8, so a
+    character can take several bytes.
+
+    :param str|unicode|bytes data: The data of a write.
+    :rtype: int
+    """
+    if isinstance(data, bytes):
+        return len(data)
+
+    return len(data.encode('utf-8'))
+
+
+class WriteBehindStorageDriver(StorageDriver):
+    """
+    Queue writes to another storage driver and upload them from a pool of
+    background threads, so a task's method carries on computing while its
+    outputs upload.
+
+    The data of queued writes is held in memory. Once the queued writes hold
+    ``max_pending_bytes`` or number ``max_pending_writes``, the next write
+    blocks until enough of them have finished. A single write bigger than
+    the budget waits for the queue to empty and is then queued on its own.
+
+    Writes to the same task instance are uploaded in the order they were
+    made, and reading, checking or deleting a task instance's file waits for
+    its queued writes, so the task always sees its own writes. Writes to
+    different task instances finish in any order.
+
+    Failed writes are reported by :py:meth:`flush`, which waits for every
+    queued write. :py:class:`~fileflow.operators.DivePythonOperator` flushes
+    when the task's method returns, so the task only succeeds once all of its
+    outputs are stored.
+
+    Anything not wrapped here, like :py:attr:`S3StorageDriver.bucket`, is
+    looked up on the wrapped driver.
+    """
+
+    def __init__(self, driver, workers=DEFAULT_WORKERS, max_pending_bytes=DEFAULT_MAX_PENDING_BYTES,
+                 max_pending_writes=DEFAULT_MAX_PENDING_WRITES):
+        """
+        :param StorageDriver driver: The driver to write to.
+        :param int workers: The number of background upload threads.
+        :param int max_pending_bytes: How much queued data to hold in memory.
+        :param int max_pending_writes: How many writes to queue.
+        """
+        super(WriteBehindStorageDriver, self).__init__(date_granularity=driver.date_granularity)
+
+        self.driver = driver
+        self.workers = workers
+        self.max_pending_bytes = max_pending_bytes
+        self.max_pending_writes = max_pending_writes
+
+        # Upload thread pool; created on the first write.
+        self._pool = None
+        # Guards the counts below, and is notified whenever a write finishes.
+        self._condition = threading.Condition()
+        self._pending_bytes = 0
+        self._pending_writes = 0
+        # The (dag_id, task_id, execution_date) of every queued write. Each
+        # task instance has at most one, so its writes land in order.
+        self._pending_task_instances = set()
+        # Descriptions of the writes that failed since the last flush.
+        self._failures = []
+
+    def __getattr__(self, name):
+        # Only called for attributes not found the normal way.
+        if name == 'driver':
+            raise AttributeError(name)
+        return getattr(self.driver, name)
+
+    def get_filename(self, dag_id, task_id, execution_date):
+        return self.driver.get_filename(dag_id, task_id, execution_date)
+
+    def get_path(self, dag_id, task_id):
+        return self.driver.get_path(dag_id, task_id)
+
+    def execution_date_string(self, execution_date):
+        return self.driver.execution_date_string(execution_date)
+
+    def parse_execution_date_string(self, date_string):
+        return self.driver.parse_execution_date_string(date_string)
+
+    def get_local_path(self, dag_id, task_id, execution_date):
+        self._wait_for_writes(dag_id, task_id, execution_date)
+
+        return self.driver.get_local_path(dag_id, task_id, execution_date)
+
+    def get_etag(self, dag_id, task_id, execution_date):
+        self._wait_for_writes(dag_id, task_id, execution_date)
+
+        return self.driver.get_etag(dag_id, task_id, execution_date)
+
+    def compute_etag(self, stream):
+        return self.driver.compute_etag(stream)
+
+    def exists(self, dag_id, task_id, execution_date):
+        self._wait_for_writes(dag_id, task_id, execution_date)
+
+        return self.driver.exists(dag_id, task_id, execution_date)
+
+    def read(self, dag_id, task_id, execution_date, encoding='utf-8'):
+        self._wait_for_writes(dag_id, task_id, execution_date)
+
+        return self.driver.read(dag_id, task_id, execution_date, encoding=encoding)
+
+    def read_bytes(self, dag_id, task_id, execution_date):
+        self._wait_for_writes(dag_id, task_id, execution_date)
+
+        return self.driver.read_bytes(dag_id, task_id, execution_date)
+
+    def get_read_stream(self, dag_id, task_id, execution_date):
+        self._wait_for_writes(dag_id, task_id, execution_date)
+
+        return self.driver.get_read_stream(dag_id, task_id, execution_date)
+
+    def write(self, dag_id, task_id, execution_date, data, content_type='text/plain', *args, **kwargs):
+        self._queue_write(
+            (dag_id, task_id, execution_date), _byte_size(data),
+            lambda: self.driver.write(dag_id, task_id, execution_date, data, content_type=content_type)
+        )
+
+    def write_bytes(self, dag_id, task_id, execution_date, data, content_type='application/octet-stream'):
+        self._queue_write(
+            (dag_id, task_id, execution_date), _byte_size(data),
+            lambda: self.driver.write_bytes(dag_id, task_id, execution_date, data, content_type=content_type)
+        )
+
+    def write_from_stream(self, dag_id, task_id, execution_date, stream, content_type='text/plain', *args, **kwargs):
+        # The caller is free to close the stream once this returns, so read
+        # it now.
+        data = stream.read()
+
+        def write():
+            copy = io.BytesIO(data) if isinstance(data, bytes) else io.StringIO(data)
+            self.driver.write_from_stream(dag_id, task_id, execution_date, copy, content_type=content_type)
+
+        self._queue_write((dag_id, task_id, execution_date), _byte_size(data), write)
+
+    def delete(self, dag_id, task_id, execution_date):
+        # Let queued writes land first so they can't resurrect the file.
+        self._wait_for_writes(dag_id, task_id, execution_date)
+        self.driver.delete(dag_id, task_id, execution_date)
+
+    def delete_many(self, task_instances, workers=DEFAULT_WORKERS):
+        self._wait_for_all_writes()
+        self.driver.delete_many(task_instances, workers=workers)
+
+    def list_filenames_in_path(self, path):
+        # Queued writes aren't in the listing until they've landed.
+        self._wait_for_all_writes()
+
+        return self.driver.list_filenames_in_path(path)
+
+    def list_filenames_in_task(self, dag_id, task_id):
+        self._wait_for_all_writes()
+
+        return self.driver.list_filenames_in_task(dag_id, task_id)
+
+    def list_output_task_ids(self, dag_id, task_id):
+        self._wait_for_all_writes()
+
+        return self.driver.list_output_task_ids(dag_id, task_id)
+
+    def flush(self):
+        """
+        Block until every queued write has finished, then flush the wrapped
+        driver.
+
+        :raises StorageDriverError: If any write failed.
+        """
+        self._wait_for_all_writes()
+
+        with self._condition:
+            failures = self._failures
+            self._failures = []
+            pool = self._pool
+            self._pool = None
+
+        # Every write it was given has finished; the next write starts a new
+        # pool.
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+        if failures:
+            raise StorageDriverError(
+                'Failed to write {count} files: {details}'.format(
+                    count=len(failures),
+                    details=', '.join(failures)
+                )
+            )
+
+        self.driver.flush()
+
+    def _queue_write(self, task_instance, size, write):
+        """
+        Queue a write, once earlier writes to the task instance have finished
+        and there's room in the budget.
+
+        :param tuple task_instance: The (dag_id, task_id, execution_date).
+        :param int size: How much memory the write's data takes.
+        :param function write: Does the write.
+        """
+        with self._condition:
+            while task_instance in self._pending_task_instances or (
+                    self._pending_writes and (self._pending_bytes + size > self.max_pending_bytes or
+                                              self._pending_writes >= self.max_pending_writes)):
+                self._condition.wait()
+
+            self._pending_bytes += size
+            self._pending_writes += 1
+            self._pending_task_instances.add(task_instance)
+
+            if self._pool is None:
+                self._pool = ThreadPool(self.workers)
+
+            self._pool.apply_async(self._write, (task_instance, size, write))
+
+    def _write(self, task_instance, size, write):
+        """
+        Do a queued write in a background thread, keeping any failure for
+        :py:meth:`flush` to report.
+        """
+        try:
+            write()
+        except Exception as e:
+            with self._condition:
+                self._failures.append('{} ({})'.format(self.get_filename(*task_instance), e))
+        finally:
+            with self._condition:
+                self._pending_bytes -= size
+                self._pending_writes -= 1
+                self._pending_task_instances.discard(task_instance)
+                self._condition.notify_all()
+
+    def _wait_for_writes(self, dag_id, task_id, execution_date):
+        """
+        Wait for the queued writes of a task instance to finish. Failures are
+        left for :py:meth:`flush` to report.
+        """
+        with self._condition:
+            while (dag_id, task_id, execution_date) in self._pending_task_instances:
+                self._condition.wait()
+
+    def _wait_for_all_writes(self):
+        with self._condition:
+            while self._pending_writes:
+                self._condition.wait()
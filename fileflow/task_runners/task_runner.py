@@ -6,14 +6,95 @@
 .. moduleauthor:: Miriam Sexton <miriam@industrydive.com>
 """
 
+import copy
 import datetime
-import json
-
-from fileflow.utils import read_and_clean_csv_to_dataframe, clean_and_write_dataframe_to_csv
-from fileflow.storage_drivers import get_storage_driver
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+from fileflow.concurrency import DEFAULT_WORKERS, build_once, chunked, thread_map
+from fileflow.errors import FileflowError
+from fileflow.utils import read_and_clean_csv_to_dataframe, clean_and_write_dataframe_to_csv, partition_dataframe
+from fileflow.utils import json_utils
+from fileflow.utils.native_utils import dumps_native, load_native_file, load_native_stream
+from fileflow.utils.dataframe_utils import partition_value
+from fileflow.storage_drivers import get_storage_driver, InstrumentedStorageDriver, MemoryStorageDriver, WriteBehindStorageDriver
+from fileflow.storage_drivers.storage_driver import OUTPUT_NAME_SEPARATOR
+from fileflow.instrumentation import get_io_observers
+from fileflow.profiling import phase
+
+# Identifies the index of a partitioned dataframe output, and its version.
+PARTITION_INDEX_FORMAT = 'fileflow.partitioned_dataframe'
+PARTITION_INDEX_VERSION = 1
+
+# The Content-Type of outputs written by write_pandas_native.
+NATIVE_CONTENT_TYPE = 'application/x-fileflow-native'
+
+# The read_upstream_* method TaskRunner.map_upstreams reads with, by format.
+READ_METHODS = {
+    'file': 'read_upstream_file',
+    'bytes': 'read_upstream_bytes',
+    'json': 'read_upstream_json',
+    'json_lines': 'read_upstream_json_lines',
+    'pandas': 'read_upstream_pandas',
+    'pandas_csv': 'read_upstream_pandas_csv',
+    'pandas_native': 'read_upstream_pandas_native',
+}
+
+# The formats that read as dataframes, which read_upstream_range can concatenate.
+DATAFRAME_FORMATS = ('pandas', 'pandas_csv', 'pandas_native')
+
+# The write_* method TaskRunner.map_upstreams writes outputs with, by format.
+WRITE_METHODS = {
+    'file': 'write_file',
+    'bytes': 'write_bytes',
+    'json': 'write_json',
+    'json_lines': 'write_json_lines',
+    'pandas_csv': 'write_pandas_csv',
+    'pandas_native': 'write_pandas_native',
+}
+
+# The map_upstreams executors.
+EXECUTORS = ('thread', 'process')
+
+
+def get_output_task_id(task_id, name=None):
+    """
+    Get the task ID a task's output is stored under.
+
+    A task's main output is stored under its own task ID. Each named output
+    is stored like the output of a separate task, under the task ID and the
+    name, so it can be read without touching the task's other outputs.
+
+    :param str task_id: The task ID.
+    :param str name: The output name, or None for the main output.
+    :return: The task ID to pass to the storage driver.
+    :rtype: str
+    :raises FileflowError: If the name is empty or has a slash in it.
+    """
+    if name is None:
+        return task_id
+
+    if not name or '/' in name or '\\' in name:
+        raise FileflowError('Output name {!r} must be non-empty and must not contain slashes.'.format(name))
+
+    return task_id + OUTPUT_NAME_SEPARATOR + name
 
 
 class TaskRunner(object):
+    """
+    Base class for a task's business logic.
+
+    Every write and read method takes an optional output ``name``. A task can
+    write any number of named outputs alongside its main output, and
+    downstream tasks read just the ones they need:
+
+    .. code-block:: python
+
+        self.write_json(summary, name='summary')
+        ...
+        summary = self.read_upstream_json('upstream', name='summary')
+    """
+
     def __init__(self, context):
 
         # The upstream dependencies
@@ -25,40 +106,104 @@ class TaskRunner(object):
         self.task_instance = context['ti']
         self.date = context['execution_date']
 
-        # Picking a storage driver for this task instance.
-        self.storage = get_storage_driver()
+        # The storage driver; built on first use by the storage property, so
+        # a task that never touches storage never connects to it. A driver
+        # that is already built can be passed in the context instead, or a
+        # function that builds one from the settings, eg. the operator's
+        # storage property.
+        self._storage = None
+        self._given_storage = context.pop('storage', None)
+        self._storage_factory = context.pop('storage_factory', None)
+        # Whether the driver was set on the runner rather than built.
+        self._storage_set = False
+
+        # Whether writes upload in the background while the task carries on.
+        self.async_writes = context.pop('async_writes', False)
+
+    @property
+    def storage(self):
+        """
+        The storage driver for this task instance, wrapped to report every
+        storage operation if any I/O observers are configured, and to upload
+        writes in the background if async_writes is on.
 
-    def get_input_filename(self, data_dependency, dag_id=None):
+        :rtype: fileflow.storage_drivers.storage_driver.StorageDriver
+        """
+        # The runner's own thread pools can ask for it at the same time, and
+        # must all share one driver, so everything they write gets flushed.
+        return build_once(self, '_storage', self._build_storage)
+
+    @storage.setter
+    def storage(self, value):
+        """
+        Allow the storage property to be set, in particularly for tests that mock this property with a Mock object.
+
+        :param value: Value to set this object's storage property to.
+        """
+        self._storage = value
+        self._storage_set = True
+
+    def _build_storage(self):
+        storage = self._given_storage
+        if storage is None:
+            storage = (self._storage_factory or get_storage_driver)()
+
+        observers = get_io_observers()
+        if observers:
+            storage = InstrumentedStorageDriver(storage, observers, tags={
+                'dag_id': self.task_instance.dag_id,
+                'task_id': self.task_instance.task_id,
+                'execution_date': self.date,
+            })
+
+        # Outside the instrumentation, so background uploads are recorded,
+        # retries and all, by the threads that do them.
+        if self.async_writes:
+            from fileflow.configuration import get_settings
+
+            settings = get_settings()
+            storage = WriteBehindStorageDriver(
+                storage,
+                max_pending_bytes=settings.async_write_max_bytes,
+                max_pending_writes=settings.async_write_max_pending
+            )
+
+        return storage
+
+    def get_input_filename(self, data_dependency, dag_id=None, name=None):
         """
         Generate the default input filename for a class.
 
         :param str data_dependency: Key for the target data_dependency in
             self.data_dependencies that you want to construct a filename for.
         :param str dag_id: Defaults to the current DAG id
+        :param str name: The upstream task's named output. Defaults to its
+            main output.
         :return: File system path or S3 URL to the input file.
         :rtype: str
         """
         if dag_id is None:
             dag_id = self.task_instance.dag_id
 
-        task_id = self.data_dependencies[data_dependency]
+        task_id = get_output_task_id(self.data_dependencies[data_dependency], name)
 
         return self.storage.get_filename(dag_id, task_id, self.date)
 
-    def get_output_filename(self):
+    def get_output_filename(self, name=None):
         """
         Generate the default output filename or S3 URL for this task instance.
 
+        :param str name: The named output. Defaults to the main output.
         :return: File system path to output filename
         :rtype: str
         """
         return self.storage.get_filename(
             self.task_instance.dag_id,
-            self.task_instance.task_id,
+            get_output_task_id(self.task_instance.task_id, name),
             self.date
         )
 
-    def get_upstream_stream(self, data_dependency_key, dag_id=None):
+    def get_upstream_stream(self, data_dependency_key, dag_id=None, name=None):
         """
         Returns a stream to the file that was output by a seperate task in the same dag.
 
@@ -67,22 +212,25 @@ class TaskRunner(object):
             self.data_dependencies dictionary to determine the file to read
             from.
         :param str dag_id: Defaults to the current DAG id.
-        :param str encoding: The file encoding to use. Defaults to 'utf-8'.
+        :param str name: The upstream task's named output. Defaults to its
+            main output.
         :return: stream to the file
         :rtype: stream
         """
         if dag_id is None:
             dag_id = self.task_instance.dag_id
 
-        task_id = self.data_dependencies[data_dependency_key]
-        stream = self.storage.get_read_stream(dag_id, task_id, self.date)
+        task_id = get_output_task_id(self.data_dependencies[data_dependency_key], name)
+
+        with phase('storage_read'):
+            stream = self.storage.get_read_stream(dag_id, task_id, self.date)
 
         # Just make 100% sure we're at the beginning
         stream.seek(0)
 
         return stream
 
-    def read_upstream_file(self, data_dependency_key, dag_id=None, encoding='utf-8'):
+    def read_upstream_file(self, data_dependency_key, dag_id=None, encoding='utf-8', name=None):
         """
         Reads the file that was output by a seperate task in the same dag.
 
@@ -92,82 +240,383 @@ class TaskRunner(object):
             from.
         :param str dag_id: Defaults to the current DAG id.
         :param str encoding: The file encoding to use. Defaults to 'utf-8'.
+        :param str name: The upstream task's named output. Defaults to its
+            main output.
         :return: Result of reading the file
         :rtype: str
         """
         if dag_id is None:
             dag_id = self.task_instance.dag_id
 
-        task_id = self.data_dependencies[data_dependency_key]
+        task_id = get_output_task_id(self.data_dependencies[data_dependency_key], name)
+
+        with phase('storage_read'):
+            return self.storage.read(dag_id, task_id, self.date, encoding=encoding)
+
+    def read_upstream_bytes(self, data_dependency_key, dag_id=None, name=None):
+        """
+        Reads the raw bytes of a file output by a separate task, without
+        decoding them, for binary formats such as pickles or images.
+
+        :param str data_dependency_key: The key (business logic name) for the
+            upstream dependency.
+        :param str dag_id: Defaults to the current DAG id.
+        :param str name: The upstream task's named output. Defaults to its
+            main output.
+        :return: The contents of the file.
+        :rtype: bytes
+        """
+        if dag_id is None:
+            dag_id = self.task_instance.dag_id
+
+        task_id = get_output_task_id(self.data_dependencies[data_dependency_key], name)
 
-        return self.storage.read(dag_id, task_id, self.date, encoding=encoding)
+        with phase('storage_read'):
+            return self.storage.read_bytes(dag_id, task_id, self.date)
 
-    def read_upstream_pandas_csv(self, data_dependency_key, dag_id=None, encoding='utf-8'):
+    def read_upstream_pandas_csv(self, data_dependency_key, dag_id=None, encoding='utf-8', name=None, usecols=None,
+                                 dtype=None, filters=None, chunksize=None, compact=False, downcast=False):
         """
         Reads a csv file from upstream into a pandas DataFrame. Specifically
         reads a csv into memory as a pandas dataframe in a standard
         manner. Reads the data in from a file output by a previous task.
 
+        Columns that aren't in usecols are never parsed, and rows that don't
+        match the filters are dropped as each chunk is parsed, so neither
+        takes up memory.
+
+        .. code-block:: python
+
+            data = self.read_upstream_pandas_csv(
+                'sales',
+                usecols=['id', 'revenue'],
+                dtype={'revenue': float},
+                filters=[('region', '==', 'east')]
+            )
+
         :param str data_dependency_key: The key (business logic name) for the
             upstream dependency. This will get the value from the
             self.data_dependencies dictionary to determine the file to read
             from.
         :param str dag_id: Defaults to the current DAG id.
         :param str encoding: The file encoding to use. Defaults to 'utf-8'.
+        :param str name: The upstream task's named output. Defaults to its
+            main output.
+        :param list[str] usecols: The columns to read. Defaults to all of them.
+        :param dict dtype: Column name to dtype, for columns that shouldn't be
+            read as strings.
+        :param filters: (column, operator, value) tuples that rows must all
+            match. See :py:func:`~fileflow.utils.read_and_clean_csv_to_dataframe`.
+        :type filters: list[tuple]
+        :param int chunksize: How many rows to parse at a time.
+        :param bool compact: Store low cardinality string columns as
+            categoricals, which can take several times less memory.
+        :param bool downcast: Store numeric string columns as numbers.
         :return: The pandas dataframe.
         :rtype: :py:obj:`pd.DataFrame`
         """
         # Read the upstream file as a stream, abstracting away storage concerns
-        input_stream = self.get_upstream_stream(data_dependency_key, dag_id)
+        input_stream = self.get_upstream_stream(data_dependency_key, dag_id, name=name)
 
         return read_and_clean_csv_to_dataframe(
             filename_or_stream=input_stream,
-            encoding=encoding
+            encoding=encoding,
+            usecols=usecols,
+            dtype=dtype,
+            filters=filters,
+            chunksize=chunksize,
+            compact=compact,
+            downcast=downcast
         )
 
-    def read_upstream_json(self, data_dependency_key, dag_id=None, encoding='utf-8'):
+    def read_upstream_pandas(self, data_dependency_key, dag_id=None, filters=None, name=None,
+                             workers=DEFAULT_WORKERS):
+        """
+        Reads a partitioned dataframe written by :py:meth:`write_pandas_partitioned`
+        upstream, fetching only the partitions that match the filters, several
+        at a time.
+
+        Filters can only be on partition columns, and compare against
+        partition values as strings, as they read back from a CSV.
+
+        .. code-block:: python
+
+            # Only downloads and parses the east and west partitions.
+            data = self.read_upstream_pandas('sales', filters={'region': ['east', 'west']})
+
+        :param str data_dependency_key: The key for the upstream data
+            dependency.
+        :param str dag_id: Defaults to the current DAG id.
+        :param dict filters: Partition column name to the value, or list of
+            values, to keep. None is the null partition. Defaults to keeping
+            every partition.
+        :param str name: The upstream task's named output. Defaults to its
+            main output.
+        :param int workers: How many partitions to fetch at once.
+        :return: The matching rows, with the columns in their original order.
+        :rtype: :py:obj:`pd.DataFrame`
+        :raises FileflowError: If the upstream output isn't partitioned, or
+            a filter isn't on a partition column.
+        """
+        import pandas as pd
+
+        index = self.read_upstream_json(data_dependency_key, dag_id, name=name)
+
+        if not isinstance(index, dict) or index.get('format') != PARTITION_INDEX_FORMAT:
+            raise FileflowError('The upstream output for {} is not a partitioned dataframe.'.format(
+                data_dependency_key
+            ))
+
+        # Compare as strings, the way partition values are stored.
+        filters = dict(
+            (column, set(partition_value(v) for v in (value if isinstance(value, (list, tuple, set)) else [value])))
+            for column, value in (filters or {}).items()
+        )
+
+        unknown_columns = set(filters) - set(index['partition_cols'])
+        if unknown_columns:
+            raise FileflowError('Can only filter on partition columns {}, not {}.'.format(
+                ', '.join(index['partition_cols']), ', '.join(sorted(unknown_columns))
+            ))
+
+        partitions = [
+            partition for partition in index['partitions']
+            if all(partition['values'][column] in values for column, values in filters.items())
+        ]
+
+        def read_partition(partition):
+            stream = self.get_upstream_stream(data_dependency_key, dag_id, name=partition['name'])
+            data = read_and_clean_csv_to_dataframe(filename_or_stream=stream)
+
+            for column, value in partition['values'].items():
+                data[column] = value
+
+            return data
+
+        frames = thread_map(read_partition, partitions, workers=workers)
+
+        if not frames:
+            return pd.DataFrame(columns=index['columns'])
+
+        return pd.concat(frames, ignore_index=True)[index['columns']]
+
+    def read_upstream_pandas_native(self, data_dependency_key, dag_id=None, name=None):
+        """
+        Reads a dataframe, or any other python object, written upstream by
+        :py:meth:`write_pandas_native`.
+
+        When the storage driver keeps the file on local disk, it's memory
+        mapped rather than read, and the dataframe's arrays are paged in
+        from it as they're used.
+
+        :param str data_dependency_key: The key for the upstream data
+            dependency.
+        :param str dag_id: Defaults to the current DAG id.
+        :param str name: The upstream task's named output. Defaults to its
+            main output.
+        :return: The dataframe.
+        :rtype: :py:obj:`pd.DataFrame`
+        :raises FileflowError: If the output isn't in the native format, or
+            was written with a different python or pandas version.
+        """
+        if dag_id is None:
+            dag_id = self.task_instance.dag_id
+
+        task_id = get_output_task_id(self.data_dependencies[data_dependency_key], name)
+
+        with phase('storage_read'):
+            local_path = self.storage.get_local_path(dag_id, task_id, self.date)
+
+        if local_path is not None:
+            with phase('deserialize'):
+                return load_native_file(local_path)
+
+        stream = self.get_upstream_stream(data_dependency_key, dag_id, name=name)
+
+        try:
+            with phase('deserialize'):
+                return load_native_stream(stream)
+        finally:
+            stream.close()
+
+    def read_upstream_json(self, data_dependency_key, dag_id=None, encoding='utf-8', name=None):
         """
         Reads a json file from upstream into a python object.
 
+        The file's raw bytes are handed straight to the JSON decoder, orjson
+        if it's installed, without decoding them to a string first.
+
         :param str data_dependency_key: The key for the upstream data
             dependency. This will get the value from the
             self.data_dependencies dict to determine the file to read.
         :param str dag_id: Defaults to the current DAG id.
         :param str encoding: The file encoding. Defaults to 'utf-8'.
+        :param str name: The upstream task's named output. Defaults to its
+            main output.
         :return: A python object.
         """
-        return json.loads(
-            self.read_upstream_file(
-                data_dependency_key,
-                dag_id,
-                encoding=encoding
-            )
-        )
+        data = self.read_upstream_bytes(data_dependency_key, dag_id, name=name)
+
+        with phase('json_parse'):
+            return json_utils.loads(data, encoding=encoding)
+
+    def read_upstream_json_lines(self, data_dependency_key, dag_id=None, encoding='utf-8', name=None):
+        """
+        Reads a JSON Lines file from upstream one record at a time.
+
+        .. code-block:: python
+
+            for record in self.read_upstream_json_lines('events'):
+                totals[record['type']] += 1
 
-    def write_file(self, data, content_type='text/plain'):
+        :param str data_dependency_key: The key for the upstream data
+            dependency.
+        :param str dag_id: Defaults to the current DAG id.
+        :param str encoding: The file encoding. Defaults to 'utf-8'.
+        :param str name: The upstream task's named output. Defaults to its
+            main output.
+        :return: A generator of python objects, one per line.
+        """
+        stream = self.get_upstream_stream(data_dependency_key, dag_id, name=name)
+
+        try:
+            for record in json_utils.iter_json_lines(stream, encoding=encoding):
+                yield record
+        finally:
+            stream.close()
+
+    def read_upstream_range(self, data_dependency_key, start, end, format='pandas_csv', dag_id=None, name=None,
+                            concat=True, date_column=None, workers=DEFAULT_WORKERS, **read_kwargs):
+        """
+        Reads an upstream task's outputs for every execution date from start
+        to end inclusive, eg. the last week of a daily task for a rolling
+        aggregate.
+
+        The dates with outputs are found with a single listing of the
+        upstream task, so dates it has no output for are skipped rather than
+        failing the read, and the outputs are fetched several at a time.
+
+        .. code-block:: python
+
+            week = self.read_upstream_range('sales', self.date - timedelta(days=6), self.date,
+                                            date_column='execution_date')
+
+            for execution_date, events in self.read_upstream_range('events', start, end, format='json',
+                                                                   concat=False):
+                ...
+
+        :param str data_dependency_key: The key for the upstream data
+            dependency.
+        :param datetime.datetime start: The earliest execution date.
+        :param datetime.datetime end: The latest execution date.
+        :param str format: How to read each output; a key of
+            ``READ_METHODS``, eg. 'json'.
+        :param str dag_id: Defaults to the current DAG id.
+        :param str name: The upstream task's named output. Defaults to its
+            main output.
+        :param bool concat: Concatenate the outputs into one dataframe,
+            oldest first. Only for the dataframe formats; otherwise pass
+            False to get each date's output.
+        :param str date_column: When concatenating, add a column of this
+            name holding the execution date each row came from.
+        :param int workers: How many outputs to fetch at once. When not
+            concatenating, this is also how far ahead of the caller reads
+            get.
+        :param read_kwargs: Passed on to the read method, eg. ``usecols``.
+        :return: The concatenated dataframe, or a generator of
+            (execution date, output) pairs, oldest first.
+        :raises FileflowError: If the format is unknown, or can't be
+            concatenated.
+        """
+        if format not in READ_METHODS:
+            raise FileflowError('Cannot read format {!r}; use one of {}.'.format(
+                format, ', '.join(sorted(READ_METHODS))
+            ))
+
+        if concat and format not in DATAFRAME_FORMATS:
+            raise FileflowError('Only dataframes can be concatenated; pass concat=False to read {} outputs.'.format(
+                format
+            ))
+
+        if dag_id is None:
+            dag_id = self.task_instance.dag_id
+
+        task_id = get_output_task_id(self.data_dependencies[data_dependency_key], name)
+
+        dates = []
+        with phase('storage_list'):
+            for filename in self.storage.list_filenames_in_task_between(dag_id, task_id, start, end):
+                try:
+                    dates.append(self.storage.parse_execution_date_string(filename))
+                except ValueError:
+                    # Not an output, eg. a file left behind by something else.
+                    continue
+
+        def read(execution_date):
+            runner = self._at_date(execution_date)
+            return getattr(runner, READ_METHODS[format])(data_dependency_key, dag_id=dag_id, name=name, **read_kwargs)
+
+        if not concat:
+            return _read_dates(read, dates, workers)
+
+        import pandas as pd
+
+        frames = thread_map(read, dates, workers=workers)
+
+        if not frames:
+            return pd.DataFrame()
+
+        if date_column is not None:
+            for execution_date, frame in zip(dates, frames):
+                frame[date_column] = execution_date
+
+        return pd.concat(frames, ignore_index=True)
+
+    def write_file(self, data, content_type='text/plain', name=None):
         """
         Writes the data out to the correct file.
 
         :param str data: The data to output.
         :param str content_type: The Content-Type to use. Currently only used
             by S3.
+        :param str name: Write a named output rather than the main output.
         """
-        self.storage.write(
-            self.task_instance.dag_id,
-            self.task_instance.task_id,
-            self.date,
-            data,
-            content_type=content_type
-        )
+        with phase('storage_write'):
+            self.storage.write(
+                self.task_instance.dag_id,
+                get_output_task_id(self.task_instance.task_id, name),
+                self.date,
+                data,
+                content_type=content_type
+            )
 
-    def write_from_stream(self, stream, content_type='text/plain'):
-        self.storage.write_from_stream(
-            self.task_instance.dag_id,
-            self.task_instance.task_id,
-            self.date,
-            stream,
-            content_type=content_type
-        )
+    def write_bytes(self, data, content_type='application/octet-stream', name=None):
+        """
+        Writes raw bytes out to the correct file, without encoding them.
+
+        :param bytes data: The data to output.
+        :param str content_type: The Content-Type to use. Currently only used
+            by S3.
+        :param str name: Write a named output rather than the main output.
+        """
+        with phase('storage_write'):
+            self.storage.write_bytes(
+                self.task_instance.dag_id,
+                get_output_task_id(self.task_instance.task_id, name),
+                self.date,
+                data,
+                content_type=content_type
+            )
+
+    def write_from_stream(self, stream, content_type='text/plain', name=None):
+        with phase('storage_write'):
+            self.storage.write_from_stream(
+                self.task_instance.dag_id,
+                get_output_task_id(self.task_instance.task_id, name),
+                self.date,
+                stream,
+                content_type=content_type
+            )
 
     def write_timestamp_file(self):
         """
@@ -177,27 +626,355 @@ class TaskRunner(object):
 
         self.write_json(json)
 
-    def write_pandas_csv(self, data):
+    def write_pandas_csv(self, data, name=None):
         """
         Specifically writes a csv from a pandas dataframe to the default
         output file in a standard manner.
 
         :param data: the dataframe to write.
+        :param str name: Write a named output rather than the main output.
         """
         # When you pass filename=None, the result is returned as a string
         output = clean_and_write_dataframe_to_csv(data=data, filename=None)
 
-        self.write_file(output, content_type='text/csv')
+        self.write_file(output, content_type='text/csv', name=name)
+
+    def write_pandas_partitioned(self, data, partition_cols, name=None, workers=DEFAULT_WORKERS):
+        """
+        Writes a dataframe as one CSV per distinct combination of values in
+        the partition columns, plus an index, so downstream tasks can read
+        just the partitions they need with :py:meth:`read_upstream_pandas`.
+
+        The index is written as the output (or the named output, if a name
+        is given). Each partition is written as a named output of its own,
+        without the partition columns, which are restored on read.
+
+        :param data: the dataframe to write.
+        :param list[str] partition_cols: The columns to partition by.
+        :param str name: Write a named output rather than the main output.
+        :param int workers: How many partitions to write at once.
+        """
+        partitions = partition_dataframe(data, partition_cols)
+
+        index = {
+            'format': PARTITION_INDEX_FORMAT,
+            'version': PARTITION_INDEX_VERSION,
+            'partition_cols': list(partition_cols),
+            'columns': list(data.columns),
+            'partitions': [],
+        }
+
+        for number, (values, rows) in enumerate(partitions):
+            partition_name = 'partition-{:05d}'.format(number)
+            if name is not None:
+                partition_name = name + OUTPUT_NAME_SEPARATOR + partition_name
 
-    def write_json(self, data):
+            index['partitions'].append({'name': partition_name, 'values': values, 'rows': len(rows)})
+
+        def write_partition(number):
+            self.write_pandas_csv(partitions[number][1], name=index['partitions'][number]['name'])
+
+        thread_map(write_partition, range(len(partitions)), workers=workers)
+
+        # The index goes last, so readers never see partitions that aren't written yet.
+        self.write_json(index, name=name)
+
+    def write_pandas_native(self, data, name=None):
+        """
+        Writes a dataframe, or any other python object, in fileflow's native
+        binary format for :py:meth:`read_upstream_pandas_native` to read in
+        a downstream task.
+
+        This skips CSV formatting and parsing entirely, and keeps dtypes, the
+        index and categoricals, but only suits handoffs between tasks on the
+        same python and pandas versions. See
+        :py:mod:`fileflow.utils.native_utils`.
+
+        :param data: the dataframe to write.
+        :param str name: Write a named output rather than the main output.
+        """
+        with phase('serialize'):
+            output = dumps_native(data)
+
+        self.write_bytes(output, content_type=NATIVE_CONTENT_TYPE, name=name)
+
+    def write_json(self, data, name=None):
         """
         Write a python object to a JSON output file.
 
         :param object data: The python object to save.
+        :param str name: Write a named output rather than the main output.
         """
         # TODO: Kinda weird that we embed the json.dumps() as we do since
         # it doesn't match the other conveience methods. Consider separating
-        self.write_file(json.dumps(data), content_type='application/json')
+        with phase('serialize'):
+            output = json_utils.dumps(data)
+
+        self.write_file(output, content_type='application/json', name=name)
+
+    def write_json_lines(self, records, name=None):
+        """
+        Write records to a JSON Lines output file, one JSON document per line.
+
+        Records are encoded one at a time into a temporary file, so passing a
+        generator means the records never all have to be in memory.
+
+        :param records: An iterable of python objects.
+        :param str name: Write a named output rather than the main output.
+        :return: The number of records written.
+        :rtype: int
+        """
+        with phase('serialize'):
+            output, count = json_utils.write_json_lines_to_file(records)
+
+        try:
+            self.write_from_stream(output, content_type='application/x-ndjson', name=name)
+        finally:
+            output.close()
+
+        return count
+
+    def map_upstreams(self, func, data_dependency_keys, format='file', executor='thread', workers=DEFAULT_WORKERS,
+                      output=None, dag_id=None, name=None, **read_kwargs):
+        """
+        Read several upstream outputs and apply func to each, several at a
+        time, in a pool of threads or processes.
+
+        Each upstream output is read, parsed and handed to func inside the
+        worker, so with ``executor='process'`` the parsing as well as func
+        run on every core, rather than on the one the task's own thread has.
+
+        .. code-block:: python
+
+            def summarize(data):
+                return data.groupby('region').sum()
+
+            for key, summary in self.map_upstreams(summarize, ['east', 'west'], format='pandas_csv',
+                                                   executor='process'):
+                ...
+
+        With the process executor, func and its results have to be
+        picklable, so func must be a module level function. Each worker
+        process builds its own storage driver from this process's
+        :py:func:`~fileflow.configuration.get_settings`, so the settings are
+        pickled rather than the driver. A driver given to or set on the
+        runner can't be rebuilt that way, and memory storage can't be shared
+        with the workers, so both are refused.
+
+        All of the work is done, and any outputs written, by the time this
+        returns.
+
+        :param callable func: Called with each parsed upstream output.
+        :param list data_dependency_keys: The keys for the upstream data
+            dependencies.
+        :param str format: How to read the upstream outputs; a key of
+            ``READ_METHODS``, eg. 'pandas_csv'.
+        :param str executor: 'thread' for I/O bound work, or 'process' for
+            CPU bound work.
+        :param int workers: How many upstream outputs to handle at once.
+        :param str output: Write each result as a named output of this task,
+            named after its key, in this format, rather than returning it; a
+            key of ``WRITE_METHODS``, eg. 'json'.
+        :param str dag_id: Defaults to the current DAG id.
+        :param str name: The upstream tasks' named output. Defaults to their
+            main output.
+        :param read_kwargs: Passed on to the read method, eg. ``usecols``.
+        :return: A list of (key, result) pairs, in the order of the keys.
+            When writing outputs, the result is the output's name.
+        :rtype: list
+        :raises FileflowError: If the format, output format or executor is
+            unknown, or the process executor is asked for with memory
+            storage or a driver that wasn't built from the settings.
+        """
+        if format not in READ_METHODS:
+            raise FileflowError('Cannot read format {!r}; use one of {}.'.format(
+                format, ', '.join(sorted(READ_METHODS))
+            ))
+
+        if output is not None and output not in WRITE_METHODS:
+            raise FileflowError('Cannot write format {!r}; use one of {}.'.format(
+                output, ', '.join(sorted(WRITE_METHODS))
+            ))
+
+        if executor not in EXECUTORS:
+            raise FileflowError('Unknown executor {!r}; use one of {}.'.format(executor, ', '.join(EXECUTORS)))
+
+        keys = list(data_dependency_keys)
+        workers = max(1, min(workers, len(keys)))
+        arguments = [(func, key, format, output, dag_id, name, read_kwargs) for key in keys]
+
+        if executor == 'process':
+            from fileflow.configuration import get_settings
+
+            settings = get_settings()
+
+            # Build the driver, if the task hasn't yet, to see what it is.
+            if settings.storage_type == 'memory' or isinstance(_unwrap_storage(self.storage), MemoryStorageDriver):
+                raise FileflowError('Memory storage is not shared with worker processes; use the thread executor.')
+
+            if self._given_storage is not None or self._storage_set:
+                raise FileflowError('Worker processes build their storage driver from the settings, so they would not '
+                                    'use the one given to this task; use the thread executor.')
+
+            pool = multiprocessing.Pool(workers, initializer=_init_map_worker, initargs=(
+                settings,
+                self.task_instance.dag_id,
+                self.task_instance.task_id,
+                self.date,
+                self.data_dependencies,
+            ))
+            return _pool_map(pool, _map_upstream_in_worker, arguments)
+
+        if workers == 1:
+            return [_map_upstream(self, *item) for item in arguments]
+
+        return _pool_map(ThreadPool(workers), lambda item: _map_upstream(self, *item), arguments)
+
+    def _at_date(self, execution_date):
+        """
+        A copy of this runner that reads and writes as of another execution
+        date, sharing this runner's storage driver.
+
+        :param datetime.datetime execution_date: The execution date.
+        :rtype: TaskRunner
+        """
+        runner = copy.copy(self)
+        runner.storage = self.storage
+        runner.date = execution_date
+
+        return runner
+
+    def flush(self):
+        """
+        Block until everything this task has written is durably stored.
+
+        :py:class:`~fileflow.operators.DivePythonOperator` calls this through
+        :py:meth:`finish` once the task's method returns, so storage drivers
+        that upload in the background still fail the task if an upload fails.
+        """
+        # Nothing can have been written if storage was never used.
+        if self._storage is None:
+            return
+
+        with phase('flush'):
+            self._storage.flush()
+
+    def finish(self):
+        """
+        Wrap up once the task's method has returned: make sure the output is
+        stored, then let any I/O observers report.
+        """
+        try:
+            self.flush()
+        finally:
+            storage = self._storage
+            if isinstance(storage, WriteBehindStorageDriver):
+                storage = storage.driver
+            if isinstance(storage, InstrumentedStorageDriver):
+                storage.task_finished()
 
     def run(self, *args, **kwargs):
         raise NotImplementedError("You must implement the run method for this task class.")
+
+
+class _TaskInstanceIds(object):
+    """
+    The parts of a task instance a TaskRunner uses, for runners in
+    map_upstreams worker processes.
+    """
+
+    def __init__(self, dag_id, task_id):
+        self.dag_id = dag_id
+        self.task_id = task_id
+
+
+# The TaskRunner of a map_upstreams worker process.
+_map_worker_runner = None
+
+
+def _init_map_worker(settings, dag_id, task_id, execution_date, data_dependencies):
+    """
+    Set up a map_upstreams worker process to read and write as the task
+    instance, with the settings of the process that started it.
+    """
+    global _map_worker_runner
+
+    from fileflow.configuration import set_settings
+
+    set_settings(settings)
+    _map_worker_runner = TaskRunner({
+        'ti': _TaskInstanceIds(dag_id, task_id),
+        'execution_date': execution_date,
+        'data_dependencies': data_dependencies,
+    })
+
+
+def _map_upstream(runner, func, key, format, output, dag_id, name, read_kwargs):
+    """
+    Read one upstream output and apply func to it, writing the result as a
+    named output if asked to.
+
+    :return: The key and the result, or the output's name.
+    :rtype: tuple
+    """
+    data = getattr(runner, READ_METHODS[format])(key, dag_id=dag_id, name=name, **read_kwargs)
+    result = func(data)
+
+    if output is None:
+        return key, result
+
+    getattr(runner, WRITE_METHODS[output])(result, name=key)
+
+    return key, key
+
+
+def _map_upstream_in_worker(arguments):
+    result = _map_upstream(_map_worker_runner, *arguments)
+
+    # The worker's driver may upload in the background, and the task has to
+    # know the output is stored before it can finish.
+    _map_worker_runner.flush()
+
+    return result
+
+
+def _read_dates(read, dates, workers):
+    """
+    Yield (execution date, output) pairs, reading a batch of outputs at a
+    time so only a batch is held in memory.
+    """
+    for batch in chunked(dates, max(1, workers)):
+        for execution_date, data in zip(batch, thread_map(read, batch, workers=workers)):
+            yield execution_date, data
+
+
+def _pool_map(pool, func, items):
+    """
+    Apply func to each item in a pool, and shut the pool down once they're
+    all done or one has failed.
+
+    :return: The results, in the order of the items.
+    :rtype: list
+    """
+    try:
+        results = pool.map(func, items)
+    except BaseException:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+
+    return results
+
+
+def _unwrap_storage(storage):
+    """
+    :return: The driver that actually holds the data, beneath any
+        instrumentation or write behind wrappers.
+    """
+    while isinstance(storage, (InstrumentedStorageDriver, WriteBehindStorageDriver)):
+        storage = storage.driver
+
+    return storage
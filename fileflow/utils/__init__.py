@@ -1,3 +1,6 @@
-from .dataframe_utils import clean_and_write_dataframe_to_csv, read_and_clean_csv_to_dataframe
+from .dataframe_utils import clean_and_write_dataframe_to_csv, read_and_clean_csv_to_dataframe, partition_dataframe, \
+    compact_dataframe
+from . import json_utils, native_utils
 
-__all__ = ['clean_and_write_dataframe_to_csv', 'read_and_clean_csv_to_dataframe']
+__all__ = ['clean_and_write_dataframe_to_csv', 'read_and_clean_csv_to_dataframe', 'partition_dataframe',
+           'compact_dataframe', 'json_utils', 'native_utils']
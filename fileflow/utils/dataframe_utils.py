@@ -10,47 +10,285 @@
 
 import csv
 import logging
-import pandas as pd
 
+from fileflow.profiling import phase
 
-def read_and_clean_csv_to_dataframe(filename_or_stream, encoding='utf-8'):
+# pandas is imported inside the functions below rather than here, since it
+# takes a long time to import and most tasks never touch a dataframe.
+
+# How many rows read_and_clean_csv_to_dataframe parses at a time when filtering.
+FILTER_CHUNKSIZE = 100000
+
+# The most distinct values per row for compact_dataframe to make a column a
+# categorical.
+MAX_CATEGORY_RATIO = 0.5
+
+FILTER_OPERATORS = {
+    '==': lambda values, value: values.isnull() if value is None else values == value,
+    '!=': lambda values, value: values.notnull() if value is None else values != value,
+    '<': lambda values, value: values.notnull() & (values < value),
+    '<=': lambda values, value: values.notnull() & (values <= value),
+    '>': lambda values, value: values.notnull() & (values > value),
+    '>=': lambda values, value: values.notnull() & (values >= value),
+    'in': lambda values, value: values.isin(list(value)),
+    'not in': lambda values, value: ~values.isin(list(value)),
+}
+
+
+def read_and_clean_csv_to_dataframe(filename_or_stream, encoding='utf-8', usecols=None, dtype=None, filters=None,
+                                    chunksize=None, compact=False, downcast=False):
     """
     Reads a utf-8 encoded CSV directly into a pandas dataframe as string values and scrubs np.NaN values to Python None
 
+    Only the columns in usecols are parsed and cleaned. Columns get the
+    dtypes given, and are strings otherwise. Null cleaning only applies to
+    string columns. Filters are applied a chunk at a time as the CSV is
+    parsed, so rows that are filtered out are never all in memory at once.
+
+    .. code-block:: python
+
+        data = read_and_clean_csv_to_dataframe(
+            stream,
+            usecols=['id', 'region', 'revenue'],
+            dtype={'revenue': float},
+            filters=[('region', 'in', ['east', 'west']), ('revenue', '>', 1000)]
+        )
+
     :param str filename_or_stream: path to CSV
+    :param list[str] usecols: The columns to read. Defaults to all of them.
+    :param dict dtype: Column name to dtype, for columns that shouldn't be
+        read as strings.
+    :param filters: Rows to keep, as (column, operator, value) tuples that
+        must all hold. The operators are ==, !=, <, <=, >, >=, in and not in.
+        Values are compared after null cleaning, so None means null. Filter
+        columns don't have to be in usecols.
+    :type filters: list[tuple]
+    :param int chunksize: How many rows to parse at a time. Defaults to
+        parsing everything at once, or FILTER_CHUNKSIZE rows at a time when
+        there are filters.
+    :param bool compact: Store low cardinality string columns as pandas
+        categoricals. See :py:func:`compact_dataframe`.
+    :param bool downcast: Store integer and decimal string columns as the
+        smallest numeric dtype that holds them. See
+        :py:func:`compact_dataframe`.
     :return:
     """
+    filters = list(filters or [])
+    for column, op, value in filters:
+        if op not in FILTER_OPERATORS:
+            raise ValueError('Unknown filter operator {}. Use one of: {}'.format(op, ', '.join(sorted(FILTER_OPERATORS))))
+
+    # Filter columns have to be parsed too, but are dropped again afterwards.
+    read_columns = None
+    if usecols is not None:
+        read_columns = list(usecols) + [column for column, _, _ in filters if column not in usecols]
+
+    # pandas can't default unlisted columns to a dtype, so list them all.
+    column_dtypes = str
+    if dtype:
+        names = read_columns if read_columns is not None else _read_csv_header(filename_or_stream, encoding)
+        column_dtypes = dict((column, dtype.get(column, str)) for column in names)
+
+    if filters and chunksize is None:
+        chunksize = FILTER_CHUNKSIZE
+
+    start = _stream_position(filename_or_stream)
+
     # pulls data in as utf8, all as strings, and without pre whitespace padding
     try:
-        data = pd.read_csv(
-            filepath_or_buffer=filename_or_stream,
-            encoding=encoding,
-            dtype=str,
-            skipinitialspace=True
+        data = _read_clean_and_filter_csv(
+            filename_or_stream, encoding, read_columns, column_dtypes, filters, chunksize
         )
     except AttributeError:
         # this is an empty dataframe and pandas crashed because it can't coerce the columns to strings
         # issue and PR to fix is open on pandas core at https://github.com/pydata/pandas/issues/12048
         # slated for 1.8 release
         # so for now just try loading the dataframe without specifying dtype
-        data = pd.read_csv(
+        if start is not None:
+            filename_or_stream.seek(start)
+
+        data = _read_clean_and_filter_csv(filename_or_stream, encoding, read_columns, None, filters, None)
+    logging.info('File read via the pandas read_csv methodology.')
+
+    if usecols is not None and len(read_columns) != len(usecols):
+        data = data[list(usecols)]
+
+    if compact or downcast:
+        data = compact_dataframe(data, categories=compact, downcast=downcast)
+
+    logging.info("Dataframe of shape %s has been retrieved." % str(data.shape))
+
+    return data
+
+
+def _read_clean_and_filter_csv(filename_or_stream, encoding, usecols, dtype, filters, chunksize):
+    """
+    Parse, clean and filter a CSV, a chunk at a time if chunksize is set.
+    """
+    import pandas as pd
+
+    kwargs = {}
+    if dtype is not None:
+        kwargs['dtype'] = dtype
+    if usecols is not None:
+        kwargs['usecols'] = usecols
+
+    with phase('csv_parse'):
+        reader = pd.read_csv(
             filepath_or_buffer=filename_or_stream,
             encoding=encoding,
-            skipinitialspace=True
+            skipinitialspace=True,
+            chunksize=chunksize,
+            **kwargs
         )
-    logging.info('File read via the pandas read_csv methodology.')
 
-    # coerces pandas nulls (of np.NaN type) into python None
-    data = data.where((pd.notnull(data)), None)
+    reader = iter([reader]) if chunksize is None else iter(reader)
 
-    # coerces string representations of Python None to a real Python None
-    data[data == 'None'] = None
-    data[data == ''] = None
-    logging.info("Dataframe of shape %s has been retrieved." % str(data.shape))
+    parts = []
+    while True:
+        with phase('csv_parse'):
+            chunk = next(reader, None)
+
+        if chunk is None:
+            break
+
+        with phase('null_cleaning'):
+            chunk = _clean_string_nulls(chunk)
+
+        if filters:
+            with phase('filter'):
+                chunk = _filter_rows(chunk, filters)
+
+        parts.append(chunk)
+
+    if len(parts) == 1 and not filters:
+        return parts[0]
+
+    return pd.concat(parts, ignore_index=True)
+
+
+def _clean_string_nulls(data):
+    """
+    Turn pandas nulls, and the strings 'None' and '', into None in every
+    string column.
+    """
+    import pandas as pd
+
+    for column in data.columns:
+        values = data[column]
+
+        if values.dtype == object:
+            # coerces pandas nulls (of np.NaN type), and string representations of Python None, to a real Python None
+            data[column] = values.where(pd.notnull(values) & (values != 'None') & (values != ''), None)
+
+    return data
+
+
+def _filter_rows(data, filters):
+    mask = None
+    for column, op, value in filters:
+        column_mask = FILTER_OPERATORS[op](data[column], value)
+        mask = column_mask if mask is None else mask & column_mask
+
+    return data[mask]
+
+
+def _stream_position(filename_or_stream):
+    try:
+        return filename_or_stream.tell()
+    except AttributeError:
+        return None
+
+
+def _read_csv_header(filename_or_stream, encoding):
+    """
+    Read just the column names of a CSV, leaving a stream where it was.
+    """
+    import pandas as pd
+
+    start = _stream_position(filename_or_stream)
+
+    columns = list(pd.read_csv(filepath_or_buffer=filename_or_stream, encoding=encoding, skipinitialspace=True,
+                               nrows=0).columns)
+
+    if start is not None:
+        filename_or_stream.seek(start)
+
+    return columns
+
+
+def compact_dataframe(data, categories=True, downcast=False, max_category_ratio=MAX_CATEGORY_RATIO):
+    """
+    Shrink the string columns of a dataframe, as read by
+    :py:func:`read_and_clean_csv_to_dataframe`, in place.
+
+    A string column costs a pointer per row plus a Python object per distinct
+    string. A categorical stores each distinct string once plus a one or two
+    byte code per row, so columns like status codes or country names shrink
+    many times over.
+
+    Only columns without nulls are changed, since neither categoricals nor
+    integer columns can hold None, and missing values must keep reading back
+    as None. Numbers are only downcast when converting them back to strings
+    gives the original strings, so values like '007' stay strings.
+
+    :param data: The dataframe to shrink.
+    :type data: :class:`pandas.DataFrame`
+    :param bool categories: Make low cardinality string columns categoricals.
+    :param bool downcast: Make integer string columns the smallest integer
+        dtype that holds them, and other numeric string columns floats.
+    :param float max_category_ratio: The most distinct values per row for a
+        column to become a categorical.
+    :return: The same dataframe.
+    :rtype: :class:`pandas.DataFrame`
+    """
+    with phase('compact'):
+        for column in data.columns:
+            values = data[column]
+
+            if values.dtype != object or values.isnull().any():
+                continue
+
+            if downcast:
+                numbers = _downcast_numbers(values)
+
+                if numbers is not None:
+                    data[column] = numbers
+                    continue
+
+            if categories and values.nunique() <= max_category_ratio * len(values):
+                data[column] = values.astype('category')
 
     return data
 
 
+def _downcast_numbers(values):
+    """
+    A string column as the smallest numeric dtype that holds it, or None if
+    it isn't all numbers.
+    """
+    import numpy as np
+    import pandas as pd
+
+    numbers = pd.to_numeric(values, errors='coerce')
+
+    if not len(values) or numbers.isnull().any():
+        return None
+
+    if not (numbers == numbers.round()).all():
+        return numbers.astype(np.float64)
+
+    # Whole numbers that don't read back the same, like '007' or '1.0', stay strings.
+    if not (numbers.astype(np.int64).astype(str) == values).all():
+        return None
+
+    for int_type in (np.int8, np.int16, np.int32, np.int64):
+        if np.iinfo(int_type).min <= numbers.min() and numbers.max() <= np.iinfo(int_type).max:
+            return numbers.astype(int_type)
+
+    return None
+
+
 def clean_and_write_dataframe_to_csv(data, filename):
     """
     Cleans a dataframe of np.NaNs and saves to file via pandas.to_csv
@@ -64,11 +302,82 @@ def clean_and_write_dataframe_to_csv(data, filename):
         returns None.
     :rtype: str | None
     """
+    import pandas as pd
+
     # cleans np.NaN values
-    data = data.where((pd.notnull(data)), None)
+    with phase('null_cleaning'):
+        # categoricals, as made by compact_dataframe, can't hold None
+        categorical = [column for column in data.columns if data[column].dtype.name == 'category']
+        if categorical:
+            data = data.copy()
+            for column in categorical:
+                data[column] = data[column].astype(object)
+
+        data = data.where((pd.notnull(data)), None)
+
     # If filename=None, to_csv will return a string
-    result = data.to_csv(path_or_buf=filename, encoding='utf-8', dtype=str, index=False, na_rep=None,
-                         skipinitialspace=True, quoting=csv.QUOTE_ALL)
+    with phase('serialize'):
+        result = data.to_csv(path_or_buf=filename, encoding='utf-8', dtype=str, index=False, na_rep=None,
+                             skipinitialspace=True, quoting=csv.QUOTE_ALL)
     logging.info("Dataframe of shape %s has been stored." % str(data.shape))
 
     return result
+
+
+def partition_value(value):
+    """
+    The string form of a partition column value, which is how it reads back
+    from a CSV, or None for nulls.
+    """
+    import pandas as pd
+
+    if value is None or (not isinstance(value, (list, tuple, dict)) and pd.isnull(value)):
+        return None
+
+    try:
+        string_types = basestring
+    except NameError:
+        string_types = str
+
+    return value if isinstance(value, string_types) else str(value)
+
+
+def partition_dataframe(data, partition_cols):
+    """
+    Split a dataframe into one dataframe per distinct combination of values
+    in the partition columns, which are dropped from each part.
+
+    Values are compared as strings, the way they read back from a CSV, and
+    nulls get a partition of their own.
+
+    :param data: The dataframe to split.
+    :type data: :class:`pandas.DataFrame`
+    :param list[str] partition_cols: The columns to split on.
+    :return: Pairs of the partition's values, as a dict of column name to
+        string or None, and the partition's rows without the partition
+        columns, ordered by partition values.
+    :rtype: list[(dict, :class:`pandas.DataFrame`)]
+    """
+    if not partition_cols:
+        raise ValueError('At least one partition column is needed.')
+
+    # Key every row by its string partition values. Nulls are swapped for a
+    # marker that can't appear in string data, since groupby drops null keys.
+    null_marker = u'\x00null'
+    keys = [data[column].map(partition_value).fillna(null_marker) for column in partition_cols]
+
+    other_columns = [column for column in data.columns if column not in partition_cols]
+
+    partitions = []
+    with phase('partition'):
+        for key, rows in data.groupby(keys, sort=True):
+            if len(partition_cols) == 1:
+                key = (key,)
+
+            values = dict(
+                (column, None if value == null_marker else value)
+                for column, value in zip(partition_cols, key)
+            )
+            partitions.append((values, rows[other_columns]))
+
+    return partitions
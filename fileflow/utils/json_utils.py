@@ -0,0 +1,161 @@
+"""
+.. module:: utils.json_utils
+   :synopsis: Utility functions for reading and writing JSON and JSON Lines
+
+JSON is encoded and decoded with `orjson <https://github.com/ijl/orjson>`_
+when it is installed, which is several times faster than the standard
+library, and with :py:mod:`json` otherwise. Anything orjson can't encode,
+such as integers too big for 64 bits, falls back to :py:mod:`json`. So does
+anything with ``NaN`` or infinite floats, which orjson would write as
+``null``, and documents holding them, which orjson refuses to read, so the
+same data is written and read whichever library is installed.
+
+JSON Lines files hold one JSON document per line, so records can be read and
+written one at a time instead of holding the whole list, and its text, in
+memory.
+"""
+
+import json
+import math
+import tempfile
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# The name of the JSON library in use, for logging and debugging.
+JSON_BACKEND = 'orjson' if orjson is not None else 'json'
+
+# How many bytes of JSON Lines write_json_lines_to_file keeps in memory
+# before spilling to a temporary file.
+SPOOL_MAX_BYTES = 16 * 1024 * 1024
+
+
+def dumps(data):
+    """
+    Encode a python object as JSON.
+
+    :param object data: The python object.
+    :return: The JSON, as UTF-8 encoded bytes.
+    :rtype: bytes
+    """
+    if orjson is not None:
+        try:
+            output = orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass
+        else:
+            # orjson writes non-finite floats as null, so only look for them
+            # when there's a null they could have become.
+            if b'null' not in output or not _has_non_finite_floats(data):
+                return output
+
+    output = json.dumps(data)
+
+    return output if isinstance(output, bytes) else output.encode('utf-8')
+
+
+def loads(data, encoding='utf-8'):
+    """
+    Decode a JSON document.
+
+    :param data: The JSON, either text or bytes in the given encoding.
+    :type data: bytes | unicode
+    :param str encoding: The encoding of the bytes.
+    :return: A python object.
+    """
+    if isinstance(data, bytes) and encoding.lower().replace('_', '-') not in ('utf-8', 'utf8'):
+        data = data.decode(encoding)
+
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # Possibly NaN or Infinity, which json writes but orjson won't
+            # read.
+            pass
+
+    if isinstance(data, bytes):
+        # json.loads only takes bytes from Python 3.6 on
+        data = data.decode('utf-8')
+
+    return json.loads(data)
+
+
+def _has_non_finite_floats(data):
+    """
+    Whether there's a NaN or infinite float anywhere in data.
+    """
+    pending = [data]
+
+    while pending:
+        value = pending.pop()
+
+        if isinstance(value, float):
+            if math.isnan(value) or math.isinf(value):
+                return True
+        elif isinstance(value, dict):
+            pending.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            pending.extend(value)
+
+    return False
+
+
+def load(stream, encoding='utf-8'):
+    """
+    Decode a JSON document from a binary stream.
+
+    The raw bytes are handed straight to the decoder, rather than being
+    decoded to text first, so the document is never held as a string twice.
+
+    :param stream: A binary file-like object.
+    :param str encoding: The encoding of the stream.
+    :return: A python object.
+    """
+    return loads(stream.read(), encoding=encoding)
+
+
+def iter_json_lines(stream, encoding='utf-8'):
+    """
+    Decode JSON Lines from a binary stream one record at a time.
+
+    Blank lines are skipped.
+
+    :param stream: A binary file-like object.
+    :param str encoding: The encoding of the stream.
+    :return: A generator of python objects.
+    """
+    for line in stream:
+        if line.strip():
+            yield loads(line, encoding=encoding)
+
+
+def write_json_lines_to_file(records, spool_max_bytes=SPOOL_MAX_BYTES):
+    """
+    Encode records as JSON Lines into a temporary file, which stays in memory
+    until it grows past spool_max_bytes.
+
+    :param records: An iterable of python objects, eg. a generator, which is
+        only read once.
+    :param int spool_max_bytes: How big the file can get in memory.
+    :return: The file, positioned at the start, and the number of records.
+        Close the file to delete it.
+    :rtype: (file, int)
+    """
+    output = tempfile.SpooledTemporaryFile(max_size=spool_max_bytes)
+    count = 0
+
+    try:
+        for record in records:
+            output.write(dumps(record))
+            output.write(b'\n')
+            count += 1
+    except Exception:
+        output.close()
+        raise
+
+    output.seek(0)
+
+    return output, count
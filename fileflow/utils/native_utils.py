@@ -0,0 +1,218 @@
+"""
+.. module:: utils.native_utils
+   :synopsis: Fast binary serialization of python objects, such as dataframes, for python to python handoff
+
+Objects are pickled with the highest protocol available. From Python 3.8 on
+that is protocol 5, which hands large buffers, like the numpy arrays behind
+a dataframe's columns, to fileflow "out-of-band" instead of copying them
+into the pickle. They are written after the pickle, each starting on a 64
+byte boundary, and on read they are handed back to the unpickler as slices
+of the file's bytes, or of a memory map of the file, without being copied.
+
+Every file starts with a header recording the format version, the pickle
+protocol and the python and pandas versions that wrote it. Pickles of pandas
+objects aren't reliably portable between pandas versions, so a reader with
+a different python or pandas version, or without the pickle protocol, raises
+a :py:class:`~fileflow.errors.FileflowError` instead of loading something
+subtly wrong.
+
+The layout is::
+
+    MAGIC | header length (4 bytes, little endian) | header (JSON) | padding
+          | pickle | padding | buffer | padding | buffer ...
+"""
+
+import json
+import mmap
+import platform
+import struct
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from fileflow.errors import FileflowError
+
+MAGIC = b'FFNATIVE'
+NATIVE_FORMAT_VERSION = 1
+
+# Sections start on this boundary, so out-of-band buffers are aligned for numpy.
+ALIGNMENT = 64
+
+_HEADER_LENGTH = struct.Struct('<I')
+
+
+def _versions():
+    try:
+        import pandas
+        pandas_version = pandas.__version__
+    except ImportError:
+        pandas_version = None
+
+    return {
+        'python': '.'.join(platform.python_version_tuple()[:2]),
+        'pandas': pandas_version,
+    }
+
+
+def _padding(offset):
+    return b'\x00' * (-offset % ALIGNMENT)
+
+
+def dumps_native(data):
+    """
+    Serialize a python object in the native format.
+
+    :param object data: The object, eg. a dataframe.
+    :return: The serialized object.
+    :rtype: bytes
+    """
+    buffers = []
+
+    if pickle.HIGHEST_PROTOCOL >= 5:
+        pickled = pickle.dumps(data, protocol=5, buffer_callback=buffers.append)
+        buffers = [buffer.raw() for buffer in buffers]
+    else:
+        pickled = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+
+    header = {
+        'format_version': NATIVE_FORMAT_VERSION,
+        'protocol': min(pickle.HIGHEST_PROTOCOL, 5),
+        'versions': _versions(),
+        'sections': [],
+    }
+
+    # Section offsets depend on the header length, which depends on the
+    # offsets, so reserve room for them with a first pass.
+    sections = [pickled] + buffers
+    header['sections'] = [[0, len(section)] for section in sections]
+    header_length = len(json.dumps(header).encode('utf-8')) + 20 * len(sections)
+
+    offset = len(MAGIC) + _HEADER_LENGTH.size + header_length
+    for number, section in enumerate(sections):
+        offset += -offset % ALIGNMENT
+        header['sections'][number][0] = offset
+        offset += len(section)
+
+    encoded_header = json.dumps(header).encode('utf-8')
+    encoded_header += b' ' * (header_length - len(encoded_header))
+
+    parts = [MAGIC, _HEADER_LENGTH.pack(header_length), encoded_header]
+    position = len(MAGIC) + _HEADER_LENGTH.size + header_length
+
+    for (section_offset, length), section in zip(header['sections'], sections):
+        parts.append(_padding(position))
+        parts.append(section)
+        position = section_offset + length
+
+    return b''.join(parts)
+
+
+def read_native_header(data):
+    """
+    Read and check the header of a native format file.
+
+    :param data: The file's contents, or a memory map of it.
+    :return: The header.
+    :rtype: dict
+    :raises FileflowError: If the data isn't in the native format, or was
+        written by a version this reader can't safely load.
+    """
+    if data[:len(MAGIC)] != MAGIC:
+        raise FileflowError('Data is not in the fileflow native format.')
+
+    start = len(MAGIC) + _HEADER_LENGTH.size
+    header_length, = _HEADER_LENGTH.unpack(data[len(MAGIC):start])
+    header = json.loads(bytes(data[start:start + header_length]).decode('utf-8'))
+
+    if header['format_version'] > NATIVE_FORMAT_VERSION:
+        raise FileflowError('Native format version {} is newer than the supported version {}.'.format(
+            header['format_version'], NATIVE_FORMAT_VERSION
+        ))
+
+    if header['protocol'] > pickle.HIGHEST_PROTOCOL:
+        raise FileflowError('Data was pickled with protocol {}, but this python only supports up to {}.'.format(
+            header['protocol'], pickle.HIGHEST_PROTOCOL
+        ))
+
+    versions = _versions()
+    for name, written_version in sorted(header['versions'].items()):
+        if written_version is not None and versions.get(name) != written_version:
+            raise FileflowError('Data was written with {name} {written}, but this is {name} {current}.'.format(
+                name=name, written=written_version, current=versions.get(name)
+            ))
+
+    return header
+
+
+def loads_native(data):
+    """
+    Load an object serialized with :py:func:`dumps_native`.
+
+    Out-of-band buffers are slices of data rather than copies, so arrays in
+    the object share data's memory, and keep it alive. Arrays backed by
+    immutable data, such as bytes, are read-only.
+
+    :param data: The serialized object: bytes, a bytearray, or a memory map
+        of a file.
+    :return: The object.
+    :raises FileflowError: See :py:func:`read_native_header`.
+    """
+    header = read_native_header(data)
+    sections = header['sections']
+
+    pickle_offset, pickle_length = sections[0]
+
+    if header['protocol'] >= 5:
+        view = memoryview(data)
+        buffers = [view[offset:offset + length] for offset, length in sections[1:]]
+        return pickle.loads(view[pickle_offset:pickle_offset + pickle_length], buffers=buffers)
+
+    return pickle.loads(bytes(data[pickle_offset:pickle_offset + pickle_length]))
+
+
+def load_native_stream(stream):
+    """
+    Load an object serialized with :py:func:`dumps_native` from a binary
+    stream, reading it into a single writable buffer that the object's
+    arrays then share.
+
+    :param stream: A seekable binary file-like object.
+    :return: The object.
+    :raises FileflowError: See :py:func:`read_native_header`.
+    """
+    stream.seek(0, 2)
+    data = bytearray(stream.tell())
+    stream.seek(0)
+
+    view = memoryview(data)
+    position = 0
+    while position < len(data):
+        read = stream.readinto(view[position:])
+        if not read:
+            raise FileflowError('Stream ended after {} of {} bytes.'.format(position, len(data)))
+        position += read
+
+    return loads_native(data)
+
+
+def load_native_file(filename):
+    """
+    Load an object serialized with :py:func:`dumps_native` from a local file
+    through a memory map, so out-of-band buffers are paged in from the file
+    as they're used instead of being read up front.
+
+    The map is copy-on-write: arrays in the object can be changed without
+    changing the file. Storage drivers replace a file by renaming a new one
+    into place, which leaves the mapped file intact; rewriting the file in
+    place while the object is in use would crash the process on access.
+
+    :param str filename: The local path of the file.
+    :return: The object.
+    :raises FileflowError: See :py:func:`read_native_header`.
+    """
+    with open(filename, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    return loads_native(mapped)
@@ -0,0 +1,99 @@
+from unittest import TestCase
+from airflow.models import TaskInstance
+from fileflow.operators import DivePythonOperator
+from fileflow.storage_drivers import MemoryStorageDriver, WriteBehindStorageDriver
+from fileflow.task_runners import TaskRunner
+from datetime import datetime
+from nose.plugins.attrib import attr
+import mock
+
+
+class WritingTaskRunner(TaskRunner):
+    def run(self):
+        self.write_file('the output')
+
+
+class IdleTaskRunner(TaskRunner):
+    def run(self):
+        return 'nothing stored'
+
+
+@attr('unittest')
+class TestDivePythonOperator(TestCase):
+    def setUp(self):
+        self.date = datetime(2016, 1, 2)
+
+    def run_operator(self, python_object, storage=None, **kwargs):
+        operator = DivePythonOperator(task_id='the_task', python_object=python_object, **kwargs)
+        if storage is not None:
+            operator.storage = storage
+
+        fake_task = mock.MagicMock()
+        fake_task.dag_id = 'the_dag'
+        fake_task.task_id = 'the_task'
+        context = {'execution_date': self.date, 'ti': TaskInstance(fake_task, self.date)}
+
+        operator.pre_execute(context)
+        result = operator.execute(context)
+
+        return operator, result
+
+    def test_runner_shares_operator_storage(self):
+        """
+        Test the task runner uses the operator's storage driver instead of building its own.
+        """
+        storage = MemoryStorageDriver()
+
+        with mock.patch('fileflow.task_runners.task_runner.get_storage_driver') as mock_get_storage_driver:
+            operator, _ = self.run_operator(WritingTaskRunner, storage=storage)
+
+        self.assertFalse(mock_get_storage_driver.called)
+        self.assertIs(operator.task_runner.storage, storage)
+        self.assertEqual(storage.read('the_dag', 'the_task', self.date), 'the output')
+
+    @mock.patch('fileflow.operators.dive_operator.get_storage_driver')
+    def test_storage_built_once_when_used(self, mock_get_storage_driver):
+        """
+        Test the operator's driver is built once, when the runner first uses it, and not at all for a task that
+        never touches storage.
+        """
+        _, result = self.run_operator(IdleTaskRunner)
+        self.assertEqual(result, 'nothing stored')
+        self.assertFalse(mock_get_storage_driver.called)
+
+        mock_get_storage_driver.return_value = MemoryStorageDriver()
+        operator, _ = self.run_operator(WritingTaskRunner)
+        mock_get_storage_driver.assert_called_once_with()
+        self.assertIs(operator.task_runner.storage, operator.storage)
+
+    def test_async_writes(self):
+        """
+        Test with async writes the runner's writes go through a write-behind driver, and have all landed once the
+        operator finishes.
+        """
+        storage = MemoryStorageDriver()
+        operator, _ = self.run_operator(WritingTaskRunner, storage=storage, async_writes=True)
+
+        self.assertIsInstance(operator.task_runner.storage, WriteBehindStorageDriver)
+        self.assertIs(operator.task_runner.storage.driver, storage)
+        self.assertEqual(storage.read('the_dag', 'the_task', self.date), 'the output')
+
+    @mock.patch('fileflow.operators.dive_operator.get_storage_driver')
+    def test_storage_built_once_across_threads(self, mock_get_storage_driver):
+        """
+        Test threads asking for the operator's storage at the same time all get the one driver.
+        """
+        import time
+        from fileflow.concurrency import thread_map
+
+        def slow_driver():
+            time.sleep(0.05)
+            return MemoryStorageDriver()
+
+        mock_get_storage_driver.side_effect = slow_driver
+        operator = DivePythonOperator(task_id='the_task', python_object=WritingTaskRunner)
+
+        drivers = thread_map(lambda _: operator.storage, range(6), workers=6)
+
+        mock_get_storage_driver.assert_called_once_with()
+        self.assertTrue(all(driver is drivers[0] for driver in drivers))
@@ -0,0 +1,81 @@
+from unittest import TestCase
+from airflow.exceptions import AirflowSensorTimeout, AirflowSkipException
+from fileflow.operators import DiveStorageSensor
+from fileflow.storage_drivers import MemoryStorageDriver
+from datetime import datetime, timedelta
+from nose.plugins.attrib import attr
+import mock
+
+
+@attr('unittest')
+@mock.patch('fileflow.operators.dive_storage_sensor.time')
+class TestDiveStorageSensor(TestCase):
+    def setUp(self):
+        self.storage = MemoryStorageDriver()
+        self.date = datetime(2016, 1, 2)
+        self.context = {'execution_date': self.date}
+
+        self.sensor = DiveStorageSensor(
+            task_id='wait',
+            external_dag_id='upstream_dag',
+            data_dependencies={'one': 'task_one', 'two': 'task_two', 'again': 'task_one'},
+            poke_interval=10,
+            max_poke_interval=25,
+            timeout=100
+        )
+        self.sensor.storage = self.storage
+
+    def test_waits_for_every_output(self, mock_time):
+        """
+        Test the sensor checks each upstream output once per poke, stops checking outputs once they exist, and
+        backs off exponentially up to the maximum interval.
+        """
+        mock_time.time.return_value = 0
+        self.storage.exists_many = mock.MagicMock(wraps=self.storage.exists_many)
+
+        def arrive(seconds):
+            if len(mock_time.sleep.call_args_list) == 1:
+                self.storage.write('upstream_dag', 'task_one', self.date, 'one')
+            elif len(mock_time.sleep.call_args_list) == 3:
+                self.storage.write('upstream_dag', 'task_two', self.date, 'two')
+
+        mock_time.sleep.side_effect = arrive
+
+        self.sensor.execute(self.context)
+
+        self.assertListEqual([call[0][0] for call in mock_time.sleep.call_args_list], [10, 20, 25])
+        self.assertListEqual([call[0][0] for call in self.storage.exists_many.call_args_list], [
+            [('upstream_dag', 'task_one', self.date), ('upstream_dag', 'task_two', self.date)],
+            [('upstream_dag', 'task_one', self.date), ('upstream_dag', 'task_two', self.date)],
+            [('upstream_dag', 'task_two', self.date)],
+            [('upstream_dag', 'task_two', self.date)],
+        ])
+
+    def test_execution_delta(self, mock_time):
+        """
+        Test the sensor looks for outputs at the execution date shifted back by the execution delta.
+        """
+        self.sensor.execution_delta = timedelta(days=1)
+
+        self.assertListEqual(self.sensor.get_task_instances(self.context), [
+            ('upstream_dag', 'task_one', datetime(2016, 1, 1)),
+            ('upstream_dag', 'task_two', datetime(2016, 1, 1)),
+        ])
+
+    def test_timeout(self, mock_time):
+        """
+        Test the sensor fails once the timeout has passed, or is skipped with soft_fail.
+        """
+        mock_time.time.side_effect = [0, 50, 150]
+
+        with self.assertRaises(AirflowSensorTimeout):
+            self.sensor.execute(self.context)
+
+        # never sleeps past the timeout
+        self.assertListEqual([call[0][0] for call in mock_time.sleep.call_args_list], [10])
+
+        mock_time.time.side_effect = [0, 150]
+        self.sensor.soft_fail = True
+
+        with self.assertRaises(AirflowSkipException):
+            self.sensor.execute(self.context)
@@ -93,6 +93,44 @@ class TestFileStorageDriver(TestCase):
         # Clean up.
         os.remove(filepath)
 
+    def test_write_and_read_bytes(self):
+        """
+        Test raw bytes, which aren't valid utf-8, round trip through the local file system untouched.
+        """
+        driver = FileStorageDriver('')
+        filepath = 'tests/test-output/FileStorageDriverBytesTest.bin'
+        driver.get_filename = MagicMock(return_value=filepath)
+        data = b'\x80\x02\xff\x00\r\n'
+
+        driver.write_bytes('the_dag', 'the_task', datetime(1983, 9, 5), data)
+
+        self.assertEqual(driver.read_bytes('the_dag', 'the_task', datetime(1983, 9, 5)), data)
+
+        # Clean up.
+        os.remove(filepath)
+
+    def test_rewrite_replaces_file(self):
+        """
+        Test rewriting a file replaces it rather than truncating it, so a reader that has it open, or memory
+        mapped, keeps the old contents, and no temporary file is left behind.
+        """
+        import shutil
+
+        prefix = 'tests/test-output/FileStorageDriverRewriteTest'
+        driver = FileStorageDriver(prefix)
+        driver.write('the_dag', 'the_task', datetime(1983, 9, 5), 'old contents')
+
+        with driver.get_read_stream('the_dag', 'the_task', datetime(1983, 9, 5)) as reader:
+            driver.write('the_dag', 'the_task', datetime(1983, 9, 5), 'new')
+
+            self.assertEqual(reader.read(), b'old contents')
+
+        try:
+            self.assertEqual(driver.read('the_dag', 'the_task', datetime(1983, 9, 5)), 'new')
+            self.assertListEqual(os.listdir(driver.get_path('the_dag', 'the_task')), ['1983-09-05'])
+        finally:
+            shutil.rmtree(prefix)
+
     def test_write_from_stream(self):
         """
         Test writing to the file system from a stream
@@ -156,3 +194,43 @@ class TestFileStorageDriver(TestCase):
 
         # Clean up.
         os.rmdir(dir_name)
+
+    def test_delete(self):
+        """
+        Test deleting a task instance's file, and that deleting a file that
+        doesn't exist does nothing.
+        """
+        driver = FileStorageDriver('tests/test-output')
+        driver.write('the_dag', 'the_task', datetime(1983, 9, 5), 'delete me')
+        filepath = driver.get_filename('the_dag', 'the_task', datetime(1983, 9, 5))
+        self.assertTrue(os.path.exists(filepath))
+
+        driver.delete('the_dag', 'the_task', datetime(1983, 9, 5))
+        self.assertFalse(os.path.exists(filepath))
+
+        # A second delete should not raise.
+        driver.delete('the_dag', 'the_task', datetime(1983, 9, 5))
+
+    def test_clear_task_outputs(self):
+        """
+        Test clearing a range of dates removes only those dates' files, named outputs included, and leaves other
+        tasks alone, even ones whose IDs start the same.
+        """
+        driver = FileStorageDriver('tests/test-output')
+        dates = [datetime(2016, 1, day) for day in range(1, 6)]
+        task_ids = ['the_clear_task', 'the_clear_task~summary', 'the_clear_task.summary']
+
+        for task_id in task_ids:
+            for date in dates:
+                driver.write('the_dag', task_id, date, 'some data')
+
+        self.assertListEqual(driver.list_output_task_ids('the_dag', 'the_clear_task'), ['the_clear_task~summary'])
+
+        driver.clear_task_outputs('the_dag', 'the_clear_task', dates[:3])
+
+        for task_id in task_ids[:2]:
+            self.assertItemsEqual(driver.list_filenames_in_task('the_dag', task_id), ['2016-01-04', '2016-01-05'])
+        self.assertEqual(len(driver.list_filenames_in_task('the_dag', 'the_clear_task.summary')), 5)
+
+        # Clean up.
+        driver.delete_many([('the_dag', task_id, date) for task_id in task_ids for date in dates])
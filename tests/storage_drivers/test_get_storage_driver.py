@@ -1,9 +1,34 @@
+import contextlib
 from unittest import TestCase
-from fileflow.storage_drivers import get_storage_driver, FileStorageDriver, S3StorageDriver
+from fileflow.storage_drivers import get_storage_driver, FileStorageDriver, S3StorageDriver, TieredStorageDriver, \
+    MemoryStorageDriver, HandoffStorageDriver
 from fileflow.errors import FileflowError
 from moto import mock_s3
 from nose.plugins.attrib import attr
+from fileflow import configuration
 import boto
+import mock
+
+
+@contextlib.contextmanager
+def patch_settings(**settings):
+    """
+    Override fileflow settings, leaving the rest as configured.
+    """
+    original_get = configuration.get
+
+    def get(section, key, **kwargs):
+        if section == 'fileflow' and key in settings:
+            return settings[key]
+        return original_get(section, key, **kwargs)
+
+    # The parsed settings are cached, so make them be read again.
+    with mock.patch.object(configuration, 'get', side_effect=get):
+        configuration.reset_settings()
+        try:
+            yield
+        finally:
+            configuration.reset_settings()
 
 
 @attr('unittest')
@@ -83,6 +108,107 @@ class TestGetStorageDriver(TestCase):
         self.assertIsInstance(driver, FileStorageDriver)
         self.assertEqual(driver.prefix, '/the/prefix/')
 
+    def test_tiered_driver(self):
+        """
+        Test the tiered storage driver is returned when configured, with the
+        storage prefix used for the local tier.
+        """
+        self.conn.create_bucket('the_buckettest')
+
+        driver = get_storage_driver('tiered', '/the/prefix/', 'test', '', '', 'the_bucket')
+        self.assertIsInstance(driver, TieredStorageDriver)
+        self.assertIsInstance(driver.hot, FileStorageDriver)
+        self.assertEqual(driver.hot.prefix, '/the/prefix/')
+        self.assertIsInstance(driver.cold, S3StorageDriver)
+        self.assertEqual(driver.cold.bucket_name, 'the_buckettest')
+
+    def test_handoff_driver(self):
+        """
+        Test the handoff driver keeps copies in the configured directory, in front of S3.
+        """
+        self.conn.create_bucket('the_buckettest')
+
+        with patch_settings(handoff_dir='/the/handoff/', handoff_max_bytes='1024'):
+            driver = get_storage_driver('handoff', '/the/prefix/', 'test', '', '', 'the_bucket')
+
+        self.assertIsInstance(driver, HandoffStorageDriver)
+        self.assertEqual(driver.directory, '/the/handoff/')
+        self.assertEqual(driver.max_bytes, 1024)
+        self.assertIsInstance(driver.remote, S3StorageDriver)
+        self.assertEqual(driver.remote.bucket_name, 'the_buckettest')
+
+    def test_s3_key_layout_and_rate_limit(self):
+        """
+        Test the S3 key layout, legacy layouts and rate limiter come from the
+        settings, and the rate limiter is shared by drivers for the bucket.
+        """
+        self.conn.create_bucket('the_bucket')
+
+        with patch_settings(s3_key_layout_version='2', s3_legacy_key_layout_versions='1', s3_rate_limit='50'):
+            driver = get_storage_driver('s3', '', 'production', '', '', 'the_bucket')
+            other_driver = get_storage_driver('s3', '', 'production', '', '', 'the_bucket')
+
+        self.assertEqual(driver.key_layout.version, 2)
+        self.assertListEqual([layout.version for layout in driver.legacy_key_layouts], [1])
+        self.assertIsNotNone(driver.retry.rate_limiter)
+        self.assertIs(driver.retry.rate_limiter, other_driver.retry.rate_limiter)
+
+    def test_s3_defaults(self):
+        """
+        Test S3 keys use the flat layout and aren't rate limited by default.
+        """
+        self.conn.create_bucket('the_bucket')
+
+        driver = get_storage_driver('s3', '', 'production', '', '', 'the_bucket')
+
+        self.assertEqual(driver.key_layout.version, 1)
+        self.assertListEqual(driver.legacy_key_layouts, [])
+        self.assertIsNone(driver.retry.rate_limiter)
+
+    def test_memory_driver(self):
+        """
+        Test the shared in-memory storage driver is returned when configured.
+        """
+        driver = get_storage_driver('memory', '', '', '', '')
+        self.assertIsInstance(driver, MemoryStorageDriver)
+        self.assertIs(driver, get_storage_driver('memory', '', '', '', ''))
+
+    def test_date_granularity(self):
+        """
+        Test the date granularity is passed to the driver, and to both tiers
+        of tiered storage.
+        """
+        driver = get_storage_driver('file', '/the/prefix/', '', '', '', date_granularity='minute')
+        self.assertEqual(driver.date_granularity, 'minute')
+
+        self.conn.create_bucket('the_buckettest')
+        driver = get_storage_driver('tiered', '/the/prefix/', 'test', '', '', 'the_bucket', date_granularity='hour')
+        self.assertEqual(driver.hot.date_granularity, 'hour')
+        self.assertEqual(driver.cold.date_granularity, 'hour')
+
+        with patch_settings(execution_date_granularity='second'):
+            driver = get_storage_driver('file', '/the/prefix/', '', '', '')
+        self.assertEqual(driver.date_granularity, 'second')
+
+    def test_settings_parsed_once(self):
+        """
+        Test the settings are read and parsed once, and can't be changed.
+        """
+        configuration.reset_settings()
+        settings = configuration.get_settings()
+
+        with mock.patch.object(configuration, 'get') as mock_get:
+            self.assertIs(configuration.get_settings(), settings)
+            get_storage_driver('file', '', '', '', '')
+        self.assertFalse(mock_get.called)
+
+        self.assertIsInstance(settings.memory_max_bytes, int)
+        self.assertIsInstance(settings.s3_retry_base_delay, float)
+        self.assertTupleEqual(settings.s3_legacy_key_layout_versions, ('1',))
+
+        with self.assertRaises(AttributeError):
+            settings.storage_type = 'memory'
+
     def test_bad_storage_type(self):
         """
         Test an error is raised when an unknown storage type is configured.
@@ -0,0 +1,181 @@
+from unittest import TestCase
+from fileflow.storage_drivers import S3StorageDriver, HandoffStorageDriver, StorageDriverError
+from datetime import datetime
+from mock import MagicMock, patch
+from moto import mock_s3
+from nose.plugins.attrib import attr
+import boto
+import os
+import shutil
+
+
+@attr('unittest')
+@mock_s3
+class TestHandoffStorageDriver(TestCase):
+    def setUp(self):
+        """
+        Set up a handoff directory in front of a moto backed S3 driver.
+        """
+        self.directory = 'tests/test-output/handoff'
+        self.bucket_name = 'handoffstoragedrivertest'
+        conn = boto.connect_s3()
+        conn.create_bucket(self.bucket_name)
+        self.bucket = conn.get_bucket(self.bucket_name)
+
+        self.remote = S3StorageDriver('', '', self.bucket_name)
+        self.driver = HandoffStorageDriver(self.remote, self.directory)
+        self.date = datetime(1983, 9, 5)
+        self.local_filename = os.path.join(self.directory, 'the_dag', 'the_task', '1983-09-05')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_get_filename(self):
+        """
+        Test that filenames are the remote driver's.
+        """
+        expected = 's3://' + self.bucket_name + '/the_dag/the_task/1983-09-05'
+
+        self.assertEqual(self.driver.get_filename('the_dag', 'the_task', self.date), expected)
+
+    def test_write_is_remote_and_local(self):
+        """
+        Test a write is in S3 when it returns, and a copy is kept locally.
+        """
+        self.driver.write('the_dag', 'the_task', self.date, u'handed off \xe4')
+
+        key = self.bucket.get_key('the_dag/the_task/1983-09-05')
+        self.assertEqual(key.get_contents_as_string(), u'handed off \xe4'.encode('utf-8'))
+
+        with open(self.local_filename, 'rb') as f:
+            self.assertEqual(f.read(), u'handed off \xe4'.encode('utf-8'))
+
+        self.assertListEqual(sorted(os.listdir(os.path.dirname(self.local_filename))), ['1983-09-05', '1983-09-05.etag'])
+
+    def test_write_computes_etag(self):
+        """
+        Test the local copy's manifest holds the ETag of the data written, without asking S3 for it.
+        """
+        self.remote.get_etag = MagicMock(side_effect=AssertionError('asked S3 for the ETag'))
+
+        self.driver.write('the_dag', 'the_task', self.date, 'tagged')
+
+        with open(self.local_filename + '.etag') as f:
+            self.assertEqual(f.read(), self.bucket.get_key('the_dag/the_task/1983-09-05').etag.strip('"'))
+
+    def test_read_uses_valid_local_copy(self):
+        """
+        Test reads of a file written on this worker only ask S3 for its ETag.
+        """
+        self.driver.write_bytes('the_dag', 'the_task', self.date, b'\x80\x02\xff')
+        self.remote.get_read_stream = MagicMock()
+
+        self.assertEqual(self.driver.read_bytes('the_dag', 'the_task', self.date), b'\x80\x02\xff')
+        self.assertEqual(self.driver.get_read_stream('the_dag', 'the_task', self.date).read(), b'\x80\x02\xff')
+        self.assertEqual(self.driver.get_local_path('the_dag', 'the_task', self.date), self.local_filename)
+
+        self.assertFalse(self.remote.get_read_stream.called)
+
+    def test_read_skips_stale_local_copy(self):
+        """
+        Test a local copy is replaced once the file changes in S3, eg. when written from another worker.
+        """
+        self.driver.write('the_dag', 'the_task', self.date, 'old data')
+        self.remote.write('the_dag', 'the_task', self.date, 'new data')
+
+        self.assertEqual(self.driver.read('the_dag', 'the_task', self.date), 'new data')
+
+        with open(self.local_filename) as f:
+            self.assertEqual(f.read(), 'new data')
+
+    def test_read_downloads_and_keeps_copy(self):
+        """
+        Test a file written elsewhere is downloaded once and then read locally.
+        """
+        self.remote.write('the_dag', 'the_task', self.date, 'remote data')
+
+        self.assertEqual(self.driver.read('the_dag', 'the_task', self.date), 'remote data')
+        self.assertTrue(os.path.exists(self.local_filename))
+
+        self.remote.get_read_stream = MagicMock()
+        self.assertEqual(self.driver.read('the_dag', 'the_task', self.date), 'remote data')
+        self.assertFalse(self.remote.get_read_stream.called)
+
+    def test_read_missing(self):
+        """
+        Test reading a file that isn't in S3 raises, even if a local copy is left over.
+        """
+        date = datetime(1983, 9, 6)
+        local_filename = os.path.join(self.directory, 'the_dag', 'the_task', '1983-09-06')
+        os.makedirs(os.path.dirname(local_filename))
+        with open(local_filename, 'w') as f:
+            f.write('left over')
+
+        with self.assertRaises(StorageDriverError):
+            self.driver.read('the_dag', 'the_task', date)
+
+    def test_failed_upload_keeps_no_copy(self):
+        """
+        Test nothing is kept locally when the upload fails.
+        """
+        self.remote.write_from_stream = MagicMock(side_effect=IOError('connection reset'))
+
+        with self.assertRaises(IOError):
+            self.driver.write('the_dag', 'the_task', self.date, 'this upload fails.')
+
+        self.assertListEqual(os.listdir(os.path.dirname(self.local_filename)), [])
+
+    def test_eviction(self):
+        """
+        Test the least recently used copies are removed once the directory is over its size limit.
+        """
+        self.driver.max_bytes = 25
+
+        for day in range(1, 4):
+            self.driver.write('the_dag', 'the_task', datetime(2016, 1, day), 'ten bytes!')
+            # Make the files' ages distinguishable.
+            filename = os.path.join(self.directory, 'the_dag', 'the_task', '2016-01-0{}'.format(day))
+            os.utime(filename, (day, day))
+
+        # Reading the first copy makes the second the least recently used.
+        self.driver.read('the_dag', 'the_task', datetime(2016, 1, 1))
+        self.driver.write('the_dag', 'the_task', datetime(2016, 1, 4), 'ten bytes!')
+
+        self.assertListEqual(
+            sorted(os.listdir(os.path.join(self.directory, 'the_dag', 'the_task'))),
+            ['2016-01-01', '2016-01-01.etag', '2016-01-04', '2016-01-04.etag']
+        )
+
+        # Evicted copies are still in S3.
+        self.assertEqual(self.driver.read('the_dag', 'the_task', datetime(2016, 1, 2)), 'ten bytes!')
+
+    def test_eviction_walks_directory_once(self):
+        """
+        Test copies already in the directory count towards the limit, and the directory is only walked once.
+        """
+        self.driver.write('the_dag', 'the_task', datetime(2016, 1, 1), 'ten bytes!')
+
+        driver = HandoffStorageDriver(self.remote, self.directory, max_bytes=25)
+
+        with patch('os.walk', wraps=os.walk) as walk:
+            driver.write('the_dag', 'the_task', datetime(2016, 1, 2), 'ten bytes!')
+            driver.read('the_dag', 'the_task', datetime(2016, 1, 2))
+            driver.write('the_dag', 'the_task', datetime(2016, 1, 3), 'ten bytes!')
+
+        # os.walk calls itself for each subdirectory, so only count walks of the directory itself.
+        self.assertEqual([args for args, _ in walk.call_args_list if args[0] == self.directory], [(self.directory,)])
+        self.assertListEqual(
+            sorted(os.listdir(os.path.join(self.directory, 'the_dag', 'the_task'))),
+            ['2016-01-02', '2016-01-02.etag', '2016-01-03', '2016-01-03.etag']
+        )
+
+    def test_delete(self):
+        """
+        Test a delete removes the file from S3 and the local copy.
+        """
+        self.driver.write('the_dag', 'the_task', self.date, 'delete me')
+        self.driver.delete_many([('the_dag', 'the_task', self.date)])
+
+        self.assertFalse(os.path.exists(self.local_filename))
+        self.assertFalse(os.path.exists(self.local_filename + '.etag'))
+        self.assertIsNone(self.bucket.get_key('the_dag/the_task/1983-09-05'))
@@ -0,0 +1,114 @@
+from unittest import TestCase
+from fileflow.storage_drivers import InstrumentedStorageDriver, MemoryStorageDriver, StorageDriverError
+from fileflow.instrumentation import MemoryObserver, note_retry, note_cache_hit
+from datetime import datetime
+from nose.plugins.attrib import attr
+import io
+
+
+@attr('unittest')
+class TestInstrumentedStorageDriver(TestCase):
+    def setUp(self):
+        self.observer = MemoryObserver()
+        self.tags = {'dag_id': 'the_dag', 'task_id': 'the_reader', 'execution_date': datetime(1983, 9, 5)}
+        self.inner = MemoryStorageDriver()
+        self.driver = InstrumentedStorageDriver(self.inner, [self.observer], tags=self.tags)
+        self.date = datetime(1983, 9, 5)
+
+    def test_read_and_write(self):
+        """
+        Test reads and writes are passed through and recorded with their size
+        and the task's tags.
+        """
+        self.driver.write('the_dag', 'the_task', self.date, 'some data')
+        self.assertEqual(self.driver.read('the_dag', 'the_task', self.date), 'some data')
+        self.assertEqual(self.driver.get_read_stream('the_dag', 'the_task', self.date).read(), b'some data')
+        self.driver.write_from_stream('the_dag', 'the_task', self.date, io.BytesIO(b'more data'))
+
+        operations = [(e.operation, e.bytes) for e in self.observer.events]
+        self.assertListEqual(operations, [
+            ('write', 9),
+            ('read', 9),
+            ('get_read_stream', 9),
+            ('write_from_stream', 9),
+        ])
+
+        for event in self.observer.events:
+            self.assertEqual(event.tags, self.tags)
+            self.assertEqual((event.dag_id, event.task_id, event.execution_date), ('the_dag', 'the_task', self.date))
+            self.assertIsNotNone(event.duration)
+
+    def test_failed_operation(self):
+        """
+        Test failed operations are recorded with the error before it's raised.
+        """
+        with self.assertRaises(StorageDriverError):
+            self.driver.read('the_dag', 'missing_task', self.date)
+
+        self.assertEqual(self.observer.events[0].error, 'StorageDriverError')
+
+    def test_annotations(self):
+        """
+        Test retries and cache hits noted by the wrapped driver end up on the
+        event, and are ignored outside of a recorded operation.
+        """
+        def read_bytes(dag_id, task_id, execution_date):
+            note_retry()
+            note_retry()
+            note_cache_hit(True)
+            return b'data'
+
+        self.inner.read_bytes = read_bytes
+        self.driver.read('the_dag', 'the_task', self.date)
+
+        self.assertEqual(self.observer.events[0].retries, 2)
+        self.assertTrue(self.observer.events[0].cache_hit)
+
+        # Nothing is being recorded, so these do nothing.
+        note_retry()
+        note_cache_hit(False)
+
+    def test_retries_in_worker_threads(self):
+        """
+        Test retries noted by threads that thread_map hands an operation's work to count against it.
+        """
+        from fileflow.concurrency import thread_map
+
+        def delete_many(task_instances, workers):
+            thread_map(lambda _: note_retry(), range(20), workers=workers)
+
+        self.inner.delete_many = delete_many
+        self.driver.delete_many([], workers=4)
+
+        self.assertEqual(self.observer.events[0].retries, 20)
+
+    def test_read_counts_bytes(self):
+        """
+        Test reads are counted in bytes read, not characters decoded.
+        """
+        self.driver.write('the_dag', 'the_task', self.date, u'caf\xe9')
+
+        self.assertEqual(self.driver.read('the_dag', 'the_task', self.date), u'caf\xe9')
+        self.assertEqual(self.observer.events[-1].bytes, 5)
+
+    def test_list_and_delete(self):
+        """
+        Test listing and deleting are recorded, and other attributes come
+        from the wrapped driver.
+        """
+        self.driver.write('the_dag', 'the_task', self.date, 'some data')
+        self.assertListEqual(self.driver.list_filenames_in_task('the_dag', 'the_task'), ['1983-09-05'])
+        self.driver.clear_task_outputs('the_dag', 'the_task', [self.date])
+
+        operations = [e.operation for e in self.observer.events]
+        # Clearing lists the task's named outputs before deleting.
+        self.assertListEqual(operations, ['write', 'list', 'list', 'delete_many'])
+        self.assertEqual(self.driver.total_bytes, 0)
+
+    def test_task_finished(self):
+        """
+        Test observers are told when the task finishes.
+        """
+        self.driver.task_finished()
+
+        self.assertListEqual(self.observer.finished, [self.tags])
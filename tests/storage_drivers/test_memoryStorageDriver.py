@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase
+from fileflow.storage_drivers import MemoryStorageDriver, StorageDriverError
+from datetime import datetime
+from nose.plugins.attrib import attr
+import io
+
+
+@attr('unittest')
+class TestMemoryStorageDriver(TestCase):
+    def setUp(self):
+        self.driver = MemoryStorageDriver()
+        self.date = datetime(1983, 9, 5)
+
+    def test_get_filename(self):
+        """
+        Test that get_filename returns the expected value.
+        """
+        expected = 'memory://the_dag/the_task/1983-09-05'
+
+        self.assertEqual(self.driver.get_filename('the_dag', 'the_task', self.date), expected)
+
+    def test_write_and_read(self):
+        """
+        Test a round trip of text through the driver, including non-ascii
+        characters.
+        """
+        data = u'this is a test with a � in it.'
+        self.driver.write('the_dag', 'the_task', self.date, data)
+
+        self.assertEqual(self.driver.read('the_dag', 'the_task', self.date, 'utf-8'), data)
+        self.assertEqual(self.driver.get_read_stream('the_dag', 'the_task', self.date).read(), data.encode('utf-8'))
+
+    def test_write_from_stream(self):
+        """
+        Test writing bytes from a stream.
+        """
+        self.driver.write_from_stream('the_dag', 'the_task', self.date, io.BytesIO(b'ab\xe4'))
+
+        self.assertEqual(self.driver.get_read_stream('the_dag', 'the_task', self.date).read(), b'ab\xe4')
+
+    def test_write_and_read_bytes(self):
+        """
+        Test raw bytes round trip without being decoded.
+        """
+        self.driver.write_bytes('the_dag', 'the_task', self.date, b'\x80\x02\xff')
+
+        self.assertEqual(self.driver.read_bytes('the_dag', 'the_task', self.date), b'\x80\x02\xff')
+
+    def test_read_missing(self):
+        """
+        Test reading a file that was never written raises an error.
+        """
+        with self.assertRaises(StorageDriverError):
+            self.driver.read('the_dag', 'the_task', self.date)
+
+    def test_max_bytes(self):
+        """
+        Test the memory cap counts overwritten and deleted files correctly.
+        """
+        driver = MemoryStorageDriver(max_bytes=10)
+        driver.write('the_dag', 'the_task', datetime(2016, 1, 1), '12345')
+        driver.write('the_dag', 'the_task', datetime(2016, 1, 2), '12345')
+
+        with self.assertRaises(StorageDriverError):
+            driver.write('the_dag', 'the_task', datetime(2016, 1, 3), '1')
+
+        # Overwriting with something the same size fits.
+        driver.write('the_dag', 'the_task', datetime(2016, 1, 2), '54321')
+
+        driver.delete('the_dag', 'the_task', datetime(2016, 1, 1))
+        driver.write('the_dag', 'the_task', datetime(2016, 1, 3), '1')
+        self.assertEqual(driver.total_bytes, 6)
+
+    def test_list_filenames_in_path(self):
+        """
+        Test listing only lists files directly in the path.
+        """
+        for day in [3, 1, 2]:
+            self.driver.write('the_dag', 'the_task', datetime(2016, 1, day), 'data')
+        self.driver.write('the_dag', 'the_task_two', datetime(2016, 1, 4), 'data')
+
+        expected = [
+            '2016-01-01',
+            '2016-01-02',
+            '2016-01-03'
+        ]
+
+        self.assertListEqual(self.driver.list_filenames_in_task('the_dag', 'the_task'), expected)
+
+    def test_clear_task_outputs(self):
+        """
+        Test clearing a task's outputs removes its named outputs too, but not another task whose ID starts the same.
+        """
+        driver = MemoryStorageDriver()
+        date = datetime(2016, 1, 1)
+
+        for task_id in ['the_task', 'the_task~summary', 'the_task~summary~partition-00000', 'the_task.summary']:
+            driver.write('the_dag', task_id, date, 'some data')
+
+        self.assertListEqual(driver.list_output_task_ids('the_dag', 'the_task'),
+                             ['the_task~summary', 'the_task~summary~partition-00000'])
+
+        driver.clear_task_outputs('the_dag', 'the_task', [date])
+
+        self.assertListEqual(driver.list_output_task_ids('the_dag', 'the_task'), [])
+        self.assertTrue(driver.exists('the_dag', 'the_task.summary', date))
+        self.assertFalse(driver.exists('the_dag', 'the_task', date))
+
+    def test_shared(self):
+        """
+        Test every caller gets the same shared driver, and asking for it with other settings fails.
+        """
+        self.assertIs(MemoryStorageDriver.shared(), MemoryStorageDriver.shared(max_bytes=0))
+        self.assertEqual(MemoryStorageDriver.shared().max_bytes, None)
+
+        with self.assertRaises(StorageDriverError):
+            MemoryStorageDriver.shared(max_bytes=100)
+
+        with self.assertRaises(StorageDriverError):
+            MemoryStorageDriver.shared(date_granularity='hour')
+
+        self.assertEqual(MemoryStorageDriver.shared().date_granularity, 'day')
@@ -0,0 +1,73 @@
+from unittest import TestCase
+from fileflow.storage_drivers import get_storage_driver, register_storage_driver, MemoryStorageDriver
+from fileflow.storage_drivers import registry
+from fileflow.errors import FileflowError
+from nose.plugins.attrib import attr
+import mock
+
+
+def make_memory_driver(**kwargs):
+    """
+    A factory for the tests below to look up by its import path.
+    """
+    return MemoryStorageDriver()
+
+
+@attr('unittest')
+class TestStorageDriverRegistry(TestCase):
+    def tearDown(self):
+        registry._factories.pop('custom', None)
+
+    def test_register_callable(self):
+        """
+        Test a registered factory is called with the fileflow settings.
+        """
+        factory = mock.MagicMock(return_value='the driver')
+        register_storage_driver('custom', factory)
+
+        driver = get_storage_driver('custom', 'the_prefix', 'test', 'key', 'secret', 'the_bucket')
+
+        self.assertEqual(driver, 'the driver')
+        factory.assert_called_once_with(
+            storage_prefix='the_prefix',
+            environment='test',
+            aws_access_key_id='key',
+            aws_secret_access_key='secret',
+            aws_bucket_name='the_bucket',
+            date_granularity='day'
+        )
+
+    def test_register_import_path(self):
+        """
+        Test a factory registered by import path is imported on first use.
+        """
+        register_storage_driver('custom', 'tests.storage_drivers.test_registry:make_memory_driver')
+
+        driver = get_storage_driver('custom', '', '', '', '', '')
+
+        self.assertIsInstance(driver, MemoryStorageDriver)
+        self.assertIs(registry._factories['custom'], make_memory_driver)
+
+    @mock.patch('pkg_resources.iter_entry_points')
+    def test_entry_point(self, mock_iter_entry_points):
+        """
+        Test unknown storage types are looked up through setuptools entry points.
+        """
+        entry_point = mock.MagicMock()
+        entry_point.load.return_value = make_memory_driver
+        mock_iter_entry_points.return_value = [entry_point]
+
+        driver = get_storage_driver('custom', '', '', '', '', '')
+
+        self.assertIsInstance(driver, MemoryStorageDriver)
+        mock_iter_entry_points.assert_called_once_with('fileflow.storage_drivers', 'custom')
+
+    @mock.patch('pkg_resources.iter_entry_points')
+    def test_unknown_storage_type(self, mock_iter_entry_points):
+        """
+        Test an error is raised when no factory or entry point has the name.
+        """
+        mock_iter_entry_points.return_value = []
+
+        with self.assertRaises(FileflowError):
+            get_storage_driver('custom', '', '', '', '', '')
@@ -1,14 +1,37 @@
 from unittest import TestCase
-from fileflow.storage_drivers import S3StorageDriver
+from fileflow.storage_drivers import S3StorageDriver, StorageDriverError
+from fileflow.storage_drivers.s3_storage_driver import FlatKeyLayout, HashedKeyLayout
 from datetime import datetime
 from mock import MagicMock
+import mock
 from moto import mock_s3
 from nose.plugins.attrib import attr
+from boto.exception import S3ResponseError
+from boto.s3.multipart import MultiPartUpload
 import boto
 
 
+def slow_down():
+    return S3ResponseError(503, 'Slow Down')
+
+
+def fail_first(func, errors):
+    """
+    Wrap func to raise the given errors on its first calls, then work.
+    """
+    errors = list(errors)
+
+    def flaky(*args, **kwargs):
+        if errors:
+            raise errors.pop(0)
+        return func(*args, **kwargs)
+
+    return MagicMock(side_effect=flaky)
+
+
 @attr('unittest')
 @mock_s3
+@mock.patch('fileflow.retry.time', MagicMock())
 class TestS3StorageDriver(TestCase):
     def setUp(self):
         """
@@ -72,6 +95,54 @@ class TestS3StorageDriver(TestCase):
 
         self.assertEqual(actual, expected)
 
+    def test_exists(self):
+        """
+        Test checking whether a key exists, under the key layout or a legacy one.
+        """
+        self.assertTrue(self.driver.exists('the_dag', 'the_task', datetime(1983, 9, 5)))
+        self.assertFalse(self.driver.exists('the_dag', 'the_task', datetime(1983, 9, 6)))
+
+    def test_get_etag(self):
+        """
+        Test the ETag is S3's, without the quotes, and changes with the contents.
+        """
+        import hashlib
+
+        self.driver.write('the_dag', 'the_task', datetime(1983, 9, 7), 'first')
+        self.assertEqual(
+            self.driver.get_etag('the_dag', 'the_task', datetime(1983, 9, 7)),
+            hashlib.md5(b'first').hexdigest()
+        )
+
+        self.driver.write('the_dag', 'the_task', datetime(1983, 9, 7), 'second')
+        self.assertEqual(
+            self.driver.get_etag('the_dag', 'the_task', datetime(1983, 9, 7)),
+            hashlib.md5(b'second').hexdigest()
+        )
+
+        self.assertIsNone(self.driver.get_etag('the_dag', 'the_task', datetime(1983, 9, 8)))
+
+    def test_compute_etag(self):
+        """
+        Test the computed ETag matches S3's for a single upload, and follows S3's format for a multipart one.
+        """
+        import hashlib
+        import io
+        from fileflow.storage_drivers import s3_storage_driver
+
+        self.driver.write('the_dag', 'etag_task', datetime(1983, 9, 7), 'computed')
+        self.assertEqual(
+            self.driver.compute_etag(io.BytesIO(b'computed')),
+            self.driver.get_etag('the_dag', 'etag_task', datetime(1983, 9, 7))
+        )
+
+        with mock.patch.multiple(s3_storage_driver, MULTIPART_THRESHOLD=4, MULTIPART_PART_SIZE=3):
+            parts = hashlib.md5(b'com').digest() + hashlib.md5(b'put').digest() + hashlib.md5(b'ed').digest()
+            self.assertEqual(
+                self.driver.compute_etag(io.BytesIO(b'computed')),
+                hashlib.md5(parts).hexdigest() + '-3'
+            )
+
     def test_get_read_stream(self):
         """
         Test reading a stream from S3
@@ -139,6 +210,48 @@ class TestS3StorageDriver(TestCase):
 
         self.assertEqual(actual, data)
 
+    def test_write_and_read_bytes(self):
+        """
+        Test raw bytes round trip through S3 without being decoded, with the content type given.
+        """
+        data = b'\x89PNG\r\n\x1a\n\x00\xff'
+        self.driver.write_bytes('the_dag', 'the_task', datetime(1983, 9, 5), data, content_type='image/png')
+
+        s3_key = self.bucket.get_key('the_dag/the_task/1983-09-05')
+        self.assertEqual(s3_key.content_type, 'image/png')
+        self.assertEqual(self.driver.read_bytes('the_dag', 'the_task', datetime(1983, 9, 5)), data)
+
+    def test_write_bytes_content_type_and_multipart(self):
+        """
+        Test raw bytes are stored as application/octet-stream by default, and large ones are uploaded in parts.
+        """
+        from fileflow.storage_drivers import s3_storage_driver
+
+        self.driver.write_bytes('the_dag', 'bytes_task', datetime(1983, 9, 5), b'\x00\x01')
+        s3_key = self.bucket.get_key('the_dag/bytes_task/1983-09-05')
+        self.assertEqual(s3_key.content_type, 'application/octet-stream')
+
+        with mock.patch.object(s3_storage_driver, 'MULTIPART_THRESHOLD', 1), \
+                mock.patch.object(self.driver, 'write_multipart') as write_multipart:
+            self.driver.write_bytes('the_dag', 'bytes_task', datetime(1983, 9, 6), b'\x00\x01')
+
+        write_multipart.assert_called_once_with('the_dag/bytes_task/1983-09-06', b'\x00\x01', 'application/octet-stream')
+
+    def test_write_multipart_threshold_in_bytes(self):
+        """
+        Test text is encoded before it's measured against the multipart threshold.
+        """
+        from fileflow.storage_drivers import s3_storage_driver
+
+        # Three characters, six bytes.
+        data = u'\xe4\xf6\xfc'
+
+        with mock.patch.object(s3_storage_driver, 'MULTIPART_THRESHOLD', 4), \
+                mock.patch.object(self.driver, 'write_multipart') as write_multipart:
+            self.driver.write('the_dag', 'text_task', datetime(1983, 9, 5), data)
+
+        write_multipart.assert_called_once_with('the_dag/text_task/1983-09-05', data.encode('utf-8'), 'text/plain')
+
     def test_write_from_stream(self):
         """
         Test writing to S3 from a stream
@@ -227,6 +340,38 @@ class TestS3StorageDriver(TestCase):
 
         self.assertListEqual(filenames, expected)
 
+    def test_delete(self):
+        """
+        Test deleting a single key, and that deleting a missing key does
+        nothing.
+        """
+        self.driver.delete('the_dag', 'the_task', datetime(1983, 9, 5))
+        self.assertIsNone(self.bucket.get_key('the_dag/the_task/1983-09-05'))
+
+        self.driver.delete('the_dag', 'the_task', datetime(1983, 9, 5))
+
+    def test_delete_many(self):
+        """
+        Test deleting many keys batches them into multi-object deletes of at
+        most 1000 keys.
+        """
+        from fileflow.storage_drivers import s3_storage_driver
+
+        dates = [datetime(2016, 1, day) for day in range(1, 6)]
+        for date in dates:
+            self.driver.write('the_dag', 'the_task', date, 'some data')
+
+        self.driver.bucket.delete_keys = MagicMock(wraps=self.driver.bucket.delete_keys)
+
+        with mock.patch.object(s3_storage_driver, 'MAX_KEYS_PER_DELETE', 2):
+            self.driver.clear_task_outputs('the_dag', 'the_task', dates)
+
+        self.assertEqual(self.driver.bucket.delete_keys.call_count, 3)
+        self.assertListEqual(
+            self.driver.list_filenames_in_task('the_dag', 'the_task'),
+            ['1983-09-05']
+        )
+
     def test_get_or_create_key(self):
         """
         Test that we can create and retrieve S3 key data.
@@ -249,3 +394,183 @@ class TestS3StorageDriver(TestCase):
         content = existing_key.get_contents_as_string()
 
         self.assertEqual(content, expected)
+
+    def test_read_retries_transient_errors(self):
+        """
+        Test a throttled or dropped request is retried on its own.
+        """
+        import errno
+        import socket
+
+        self.driver.bucket.get_key = fail_first(self.driver.bucket.get_key, [slow_down(), socket.error(errno.ECONNRESET, 'reset')])
+
+        actual = self.driver.read('the_dag', 'the_task', datetime(1983, 9, 5))
+
+        self.assertEqual(actual, 'this is a test.')
+        self.assertEqual(self.driver.bucket.get_key.call_count, 3)
+
+    def test_read_does_not_retry_other_errors(self):
+        """
+        Test errors that won't go away on their own aren't retried.
+        """
+        self.driver.bucket.get_key = fail_first(self.driver.bucket.get_key, [S3ResponseError(403, 'Forbidden')])
+
+        with self.assertRaises(S3ResponseError):
+            self.driver.read('the_dag', 'the_task', datetime(1983, 9, 5))
+
+        self.assertEqual(self.driver.bucket.get_key.call_count, 1)
+
+    def test_retry_attempts_run_out(self):
+        """
+        Test the last error is raised once every attempt has failed.
+        """
+        self.driver.retry.attempts = 3
+        self.driver.bucket.get_key = fail_first(self.driver.bucket.get_key, [slow_down()] * 5)
+
+        with self.assertRaises(S3ResponseError):
+            self.driver.read('the_dag', 'the_task', datetime(1983, 9, 5))
+
+        self.assertEqual(self.driver.bucket.get_key.call_count, 3)
+
+    def test_get_read_stream_retry_starts_over(self):
+        """
+        Test a download that fails part way through doesn't leave partial
+        data in the stream.
+        """
+        from boto.s3.key import Key
+
+        original_get_file = Key.get_file
+        calls = []
+
+        def get_file(key, fp, *args, **kwargs):
+            calls.append(key.name)
+            if len(calls) == 1:
+                fp.write('partial')
+                raise slow_down()
+            return original_get_file(key, fp, *args, **kwargs)
+
+        with mock.patch.object(Key, 'get_file', autospec=True, side_effect=get_file):
+            stream = self.driver.get_read_stream('the_dag', 'the_task', datetime(1983, 9, 5))
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(stream.read(), 'this is a test.')
+
+    def test_list_filenames_in_path_retries_pages(self):
+        """
+        Test listing fetches a page at a time and only retries the page that
+        failed.
+        """
+        for day in range(1, 6):
+            self.driver.write('the_dag', 'paged_task', datetime(2016, 1, day), 'some data')
+
+        original_get_all_keys = self.driver.bucket.get_all_keys
+        errors = [slow_down()]
+
+        def get_all_keys(**kwargs):
+            # Two keys a page, and fail the second page once.
+            if kwargs['marker'] and errors:
+                raise errors.pop()
+            return original_get_all_keys(max_keys=2, **kwargs)
+
+        self.driver.bucket.get_all_keys = MagicMock(side_effect=get_all_keys)
+
+        filenames = self.driver.list_filenames_in_task('the_dag', 'paged_task')
+
+        self.assertListEqual(filenames, ['2016-01-0{}'.format(day) for day in range(1, 6)])
+        # Three pages plus one retry.
+        self.assertEqual(self.driver.bucket.get_all_keys.call_count, 4)
+
+    def test_write_multipart_retries_failed_part(self):
+        """
+        Test large writes are uploaded in parts and a failed part is retried
+        without repeating the others.
+        """
+        from fileflow.storage_drivers import s3_storage_driver
+
+        part_size = 5 * 1024 * 1024
+        data = 'a' * part_size + 'b' * part_size + 'c' * 10
+
+        original_upload_part = MultiPartUpload.upload_part_from_file
+        part_numbers = []
+
+        def upload_part(upload, fp, part_num, *args, **kwargs):
+            part_numbers.append(part_num)
+            if part_numbers.count(2) == 1 and part_num == 2:
+                raise slow_down()
+            return original_upload_part(upload, fp, part_num, *args, **kwargs)
+
+        with mock.patch.object(s3_storage_driver, 'MULTIPART_THRESHOLD', part_size), \
+                mock.patch.object(s3_storage_driver, 'MULTIPART_PART_SIZE', part_size), \
+                mock.patch.object(MultiPartUpload, 'upload_part_from_file', autospec=True, side_effect=upload_part):
+            self.driver.write_multipart('the_dag/the_task/2016-02-01', data, 'text/plain', workers=1)
+
+        self.assertListEqual(sorted(part_numbers), [1, 2, 2, 3])
+
+        key = self.bucket.get_key('the_dag/the_task/2016-02-01')
+        self.assertEqual(key.get_contents_as_string(), data)
+
+    def test_hashed_key_layout(self):
+        """
+        Test the hashed layout puts a stable shard of the DAG and task IDs
+        before the usual key name.
+        """
+        driver = S3StorageDriver('', '', self.bucket_name, key_layout=HashedKeyLayout())
+
+        key_name = driver.get_key_name('the_dag', 'the_task', datetime(1983, 9, 5))
+        shard, rest = key_name.split('/', 1)
+
+        self.assertEqual(len(shard), 4)
+        self.assertEqual(rest, 'the_dag/the_task/1983-09-05')
+        self.assertEqual(driver.get_path('the_dag', 'the_task'), 's3://{}/{}/the_dag/the_task'.format(
+            self.bucket_name, shard
+        ))
+        self.assertNotEqual(driver.get_key_name('the_dag', 'other_task', datetime(1983, 9, 5)).split('/')[0], shard)
+
+    def test_legacy_key_layout(self):
+        """
+        Test a driver writing the hashed layout still reads, lists and
+        deletes keys written with the flat layout.
+        """
+        driver = S3StorageDriver('', '', self.bucket_name, key_layout=HashedKeyLayout(),
+                                 legacy_key_layouts=[FlatKeyLayout()])
+        driver.write('the_dag', 'the_task', datetime(1983, 9, 6), 'new data')
+
+        # Written with the flat layout in setUp.
+        self.assertEqual(driver.read('the_dag', 'the_task', datetime(1983, 9, 5)), 'this is a test.')
+        self.assertEqual(driver.get_read_stream('the_dag', 'the_task', datetime(1983, 9, 5)).read(),
+                         'this is a test.')
+        self.assertEqual(driver.read('the_dag', 'the_task', datetime(1983, 9, 6)), 'new data')
+        self.assertIsNone(self.bucket.get_key('the_dag/the_task/1983-09-06'))
+
+        self.assertListEqual(driver.list_filenames_in_task('the_dag', 'the_task')[:2], ['1983-09-05', '1983-09-06'])
+
+        driver.delete('the_dag', 'the_task', datetime(1983, 9, 5))
+        self.assertIsNone(self.bucket.get_key('the_dag/the_task/1983-09-05'))
+
+    def test_list_output_task_ids(self):
+        """
+        Test a task's named outputs are listed, in either layout, but not other tasks whose IDs start the same.
+        """
+        driver = S3StorageDriver('', '', self.bucket_name, key_layout=HashedKeyLayout(),
+                                 legacy_key_layouts=[FlatKeyLayout()])
+        flat_driver = S3StorageDriver('', '', self.bucket_name)
+        date = datetime(1983, 9, 5)
+
+        driver.write('output_dag', 'the_task~summary', date, 'hashed')
+        flat_driver.write('output_dag', 'the_task~counts', date, 'flat')
+        driver.write('output_dag', 'the_task.summary', date, 'another task')
+
+        # Named outputs are in their task's shard.
+        self.assertEqual(driver.get_key_name('output_dag', 'the_task~summary', date).split('/')[0],
+                         driver.get_key_name('output_dag', 'the_task', date).split('/')[0])
+
+        self.assertListEqual(driver.list_output_task_ids('output_dag', 'the_task'), ['the_task~counts', 'the_task~summary'])
+
+    def test_no_legacy_key_layout(self):
+        """
+        Test keys in other layouts aren't found unless asked for.
+        """
+        driver = S3StorageDriver('', '', self.bucket_name, key_layout=HashedKeyLayout())
+
+        with self.assertRaises(StorageDriverError):
+            driver.read('the_dag', 'the_task', datetime(1983, 9, 5))
@@ -0,0 +1,135 @@
+from unittest import TestCase
+from fileflow.storage_drivers import StorageDriver, StorageDriverError, MemoryStorageDriver
+from datetime import datetime, timedelta, tzinfo
+from nose.plugins.attrib import attr
+from mock import MagicMock
+
+
+class FixedOffset(tzinfo):
+    def __init__(self, hours):
+        self.offset = timedelta(hours=hours)
+
+    def utcoffset(self, dt):
+        return self.offset
+
+    def dst(self, dt):
+        return timedelta(0)
+
+
+@attr('unittest')
+class TestStorageDriver(TestCase):
+    def setUp(self):
+        self.date = datetime(2016, 1, 2, 3, 4, 5, 6)
+
+    def test_execution_date_string_default(self):
+        """
+        Test execution dates are named by day by default.
+        """
+        self.assertEqual(StorageDriver().execution_date_string(self.date), '2016-01-02')
+
+    def test_execution_date_string_granularity(self):
+        """
+        Test each granularity's naming.
+        """
+        expected = {
+            'day': '2016-01-02',
+            'hour': '2016-01-02T03',
+            'minute': '2016-01-02T0304',
+            'second': '2016-01-02T030405',
+            'microsecond': '2016-01-02T030405.000006',
+        }
+
+        for granularity, name in expected.items():
+            driver = StorageDriver(date_granularity=granularity)
+            self.assertEqual(driver.execution_date_string(self.date), name)
+
+    def test_parse_execution_date_string(self):
+        """
+        Test each granularity's names parse back to the date, truncated to the granularity.
+        """
+        expected = {
+            'day': datetime(2016, 1, 2),
+            'hour': datetime(2016, 1, 2, 3),
+            'minute': datetime(2016, 1, 2, 3, 4),
+            'second': datetime(2016, 1, 2, 3, 4, 5),
+            'microsecond': self.date,
+        }
+
+        for granularity, date in expected.items():
+            driver = StorageDriver(date_granularity=granularity)
+            self.assertEqual(driver.parse_execution_date_string(driver.execution_date_string(self.date)), date)
+
+        with self.assertRaises(ValueError):
+            StorageDriver().parse_execution_date_string('2016-01-02T03')
+
+    def test_execution_date_string_sorts_in_time_order(self):
+        """
+        Test sorting names as strings sorts them in time order.
+        """
+        driver = StorageDriver(date_granularity='microsecond')
+        dates = [
+            datetime(2016, 1, 2, 3, 4, 5, 6),
+            datetime(2016, 1, 2, 3, 4, 5, 10),
+            datetime(2016, 1, 2, 3, 4, 50),
+            datetime(2016, 1, 2, 13),
+            datetime(2016, 1, 10),
+            datetime(2016, 10, 1),
+        ]
+
+        names = [driver.execution_date_string(date) for date in reversed(dates)]
+
+        self.assertListEqual(sorted(names), [driver.execution_date_string(date) for date in dates])
+
+    def test_execution_date_string_timezone(self):
+        """
+        Test dates with a timezone are named in UTC.
+        """
+        driver = StorageDriver(date_granularity='hour')
+        date = datetime(2016, 1, 2, 1, tzinfo=FixedOffset(5))
+
+        self.assertEqual(driver.execution_date_string(date), '2016-01-01T20')
+
+    def test_bad_granularity(self):
+        """
+        Test an unknown granularity is an error.
+        """
+        with self.assertRaises(StorageDriverError):
+            StorageDriver(date_granularity='fortnight')
+
+    def test_list_filenames_in_task_between(self):
+        """
+        Test listing a range of a task's outputs.
+        """
+        driver = MemoryStorageDriver(date_granularity='hour')
+        for hour in [9, 2, 23, 0, 13]:
+            driver.write('the_dag', 'the_task', datetime(2016, 1, 1, hour), 'data')
+
+        self.assertListEqual(
+            driver.list_filenames_in_task_between('the_dag', 'the_task', datetime(2016, 1, 1, 2), datetime(2016, 1, 1, 13)),
+            ['2016-01-01T02', '2016-01-01T09', '2016-01-01T13']
+        )
+        self.assertListEqual(
+            driver.list_filenames_in_task_between('the_dag', 'the_task', start=datetime(2016, 1, 1, 10)),
+            ['2016-01-01T13', '2016-01-01T23']
+        )
+        self.assertEqual(driver.list_filenames_in_task_between('the_dag', 'the_task')[-1], '2016-01-01T23')
+        self.assertListEqual(
+            driver.list_filenames_in_task_between('the_dag', 'the_task', end=datetime(2015, 12, 31)),
+            []
+        )
+
+    def test_exists_many(self):
+        """
+        Test checking many outputs at once, listing a task's outputs once when it's asked about for several dates.
+        """
+        driver = MemoryStorageDriver()
+        for day in [1, 2, 3, 5]:
+            driver.write('the_dag', 'busy_task', datetime(2016, 1, day), 'data')
+        driver.write('the_dag', 'other_task', datetime(2016, 1, 1), 'data')
+        driver.list_filenames_in_task = MagicMock(wraps=driver.list_filenames_in_task)
+
+        task_instances = [('the_dag', 'busy_task', datetime(2016, 1, day)) for day in range(1, 6)]
+        task_instances += [('the_dag', 'other_task', datetime(2016, 1, 1)), ('the_dag', 'other_task', datetime(2016, 1, 2))]
+
+        self.assertListEqual(driver.exists_many(task_instances), [True, True, True, False, True, True, False])
+        driver.list_filenames_in_task.assert_called_once_with('the_dag', 'busy_task')
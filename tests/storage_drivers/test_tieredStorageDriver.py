@@ -0,0 +1,178 @@
+from unittest import TestCase
+from fileflow.storage_drivers import FileStorageDriver, S3StorageDriver, TieredStorageDriver, StorageDriverError
+from datetime import datetime
+from mock import MagicMock
+from moto import mock_s3
+from nose.plugins.attrib import attr
+import boto
+import os
+import shutil
+
+
+@attr('unittest')
+@mock_s3
+class TestTieredStorageDriver(TestCase):
+    def setUp(self):
+        """
+        Set up a local hot tier and a moto backed S3 cold tier.
+        """
+        self.prefix = 'tests/test-output/tiered'
+        self.bucket_name = 'tieredstoragedrivertest'
+        conn = boto.connect_s3()
+        conn.create_bucket(self.bucket_name)
+        self.bucket = conn.get_bucket(self.bucket_name)
+
+        self.hot = FileStorageDriver(self.prefix)
+        self.cold = S3StorageDriver('', '', self.bucket_name)
+        self.driver = TieredStorageDriver(self.hot, self.cold)
+        self.date = datetime(1983, 9, 5)
+
+    def tearDown(self):
+        shutil.rmtree(self.prefix, ignore_errors=True)
+
+    def test_get_filename(self):
+        """
+        Test that filenames come from the cold tier.
+        """
+        expected = 's3://' + self.bucket_name + '/the_dag/the_task/1983-09-05'
+
+        self.assertEqual(self.driver.get_filename('the_dag', 'the_task', self.date), expected)
+
+    def test_write_then_flush(self):
+        """
+        Test that a write lands locally and is in the cold tier after a flush.
+        """
+        self.driver.write('the_dag', 'the_task', self.date, 'this is a test write.')
+
+        self.assertTrue(os.path.exists(self.hot.get_filename('the_dag', 'the_task', self.date)))
+
+        self.driver.flush()
+
+        actual = self.bucket.get_key('the_dag/the_task/1983-09-05').get_contents_as_string()
+        self.assertEqual(actual, 'this is a test write.')
+
+    def test_write_and_read_bytes(self):
+        """
+        Test raw bytes are written locally, uploaded with their content type, and read back from the cold tier when
+        the local copy is gone.
+        """
+        data = b'\x80\x02\xff'
+        self.driver.write_bytes('the_dag', 'the_task', self.date, data, content_type='application/octet-stream')
+        self.driver.flush()
+
+        key = self.bucket.get_key('the_dag/the_task/1983-09-05')
+        self.assertEqual(key.get_contents_as_string(), data)
+        self.assertEqual(key.content_type, 'application/octet-stream')
+
+        os.remove(self.hot.get_filename('the_dag', 'the_task', self.date))
+        self.assertEqual(self.driver.read_bytes('the_dag', 'the_task', self.date), data)
+
+    def test_flush_raises_on_failed_upload(self):
+        """
+        Test that a failed background upload is reported by flush.
+        """
+        self.cold.write_from_stream = MagicMock(side_effect=IOError('connection reset'))
+
+        self.driver.write('the_dag', 'the_task', self.date, 'this upload fails.')
+
+        with self.assertRaises(StorageDriverError):
+            self.driver.flush()
+
+        # The failure is only reported once.
+        self.driver.flush()
+
+    def test_read_prefers_hot_tier(self):
+        """
+        Test that reads of a local copy matching the cold tier never download it.
+        """
+        self.driver.write('the_dag', 'the_task', self.date, 'local data')
+        self.driver.flush()
+        self.cold.read = MagicMock()
+        self.cold.get_read_stream = MagicMock()
+
+        self.assertEqual(self.driver.read('the_dag', 'the_task', self.date), 'local data')
+        self.assertEqual(self.driver.get_read_stream('the_dag', 'the_task', self.date).read(), 'local data')
+
+        self.assertFalse(self.cold.read.called)
+        self.assertFalse(self.cold.get_read_stream.called)
+
+    def test_read_falls_back_to_cold_tier(self):
+        """
+        Test that a file missing locally is read from the cold tier and kept
+        locally for later reads.
+        """
+        self.cold.write('the_dag', 'the_task', self.date, 'remote data')
+
+        self.assertEqual(self.driver.read('the_dag', 'the_task', self.date), 'remote data')
+        self.assertTrue(os.path.exists(self.hot.get_filename('the_dag', 'the_task', self.date)))
+
+    def test_read_replaces_stale_local_copy(self):
+        """
+        Test a local copy that no longer matches the cold tier, eg. after the upstream task reran elsewhere, is
+        downloaded again.
+        """
+        self.driver.write('the_dag', 'stale_task', self.date, 'old data')
+        self.driver.flush()
+        self.assertEqual(self.driver.read('the_dag', 'stale_task', self.date), 'old data')
+
+        self.cold.write('the_dag', 'stale_task', self.date, 'new data')
+
+        self.assertEqual(self.driver.read('the_dag', 'stale_task', self.date), 'new data')
+
+    def test_failed_download_keeps_no_copy(self):
+        """
+        Test an interrupted download leaves neither a partial copy nor its temporary file behind.
+        """
+        self.cold.write('the_dag', 'failed_task', self.date, 'remote data')
+
+        stream = MagicMock()
+        stream.read.side_effect = IOError('connection reset')
+        self.cold.get_read_stream = MagicMock(return_value=stream)
+
+        with self.assertRaises(IOError):
+            self.driver.read('the_dag', 'failed_task', self.date)
+
+        self.assertListEqual(os.listdir(os.path.dirname(self.hot.get_filename('the_dag', 'failed_task', self.date))), [])
+        self.assertTrue(stream.close.called)
+
+    def test_flush_closes_upload_pool(self):
+        """
+        Test flush shuts down the upload threads, and later writes start new ones.
+        """
+        self.driver.write('the_dag', 'pool_task', self.date, 'first')
+        pool = self.driver._pool
+        self.driver.flush()
+
+        self.assertIsNone(self.driver._pool)
+        with self.assertRaises((AssertionError, ValueError)):
+            # A closed pool refuses new work.
+            pool.apply_async(len, ('',))
+
+        self.driver.write('the_dag', 'pool_task', self.date, 'second')
+        self.driver.flush()
+        self.assertEqual(self.bucket.get_key('the_dag/pool_task/1983-09-05').get_contents_as_string(), 'second')
+
+    def test_delete(self):
+        """
+        Test that a delete removes the file from both tiers.
+        """
+        self.driver.write('the_dag', 'the_task', self.date, 'delete me')
+        self.driver.delete('the_dag', 'the_task', self.date)
+
+        self.assertFalse(os.path.exists(self.hot.get_filename('the_dag', 'the_task', self.date)))
+        self.assertIsNone(self.bucket.get_key('the_dag/the_task/1983-09-05'))
+
+    def test_list_filenames_in_task(self):
+        """
+        Test that listing includes files whose upload was still pending.
+        """
+        for day in range(1, 4):
+            self.driver.write('the_dag', 'the_task', datetime(2016, 1, day), 'some data')
+
+        expected = [
+            '2016-01-01',
+            '2016-01-02',
+            '2016-01-03'
+        ]
+
+        self.assertListEqual(self.driver.list_filenames_in_task('the_dag', 'the_task'), expected)
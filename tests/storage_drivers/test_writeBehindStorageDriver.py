@@ -0,0 +1,158 @@
+from unittest import TestCase
+from fileflow.storage_drivers import MemoryStorageDriver, WriteBehindStorageDriver, StorageDriverError
+from datetime import datetime
+from nose.plugins.attrib import attr
+import io
+import threading
+
+
+class GatedMemoryStorageDriver(MemoryStorageDriver):
+    """
+    An in-memory driver whose writes wait for the gate to open.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(GatedMemoryStorageDriver, self).__init__(*args, **kwargs)
+        self.gate = threading.Event()
+
+    def write(self, *args, **kwargs):
+        self.gate.wait()
+        super(GatedMemoryStorageDriver, self).write(*args, **kwargs)
+
+    def write_bytes(self, *args, **kwargs):
+        self.gate.wait()
+        super(GatedMemoryStorageDriver, self).write_bytes(*args, **kwargs)
+
+
+@attr('unittest')
+class TestWriteBehindStorageDriver(TestCase):
+    def setUp(self):
+        self.inner = GatedMemoryStorageDriver()
+        self.driver = WriteBehindStorageDriver(self.inner, workers=4, max_pending_bytes=10, max_pending_writes=3)
+        self.date = datetime(2016, 1, 2)
+
+    def test_writes_return_before_they_land(self):
+        """
+        Test writes are queued and return at once, and land once the background threads get to them.
+        """
+        self.driver.write('the_dag', 'the_task', self.date, 'one')
+        self.driver.write_bytes('the_dag', 'other_task', self.date, b'\x80\x02')
+
+        self.assertFalse(self.inner.exists('the_dag', 'the_task', self.date))
+
+        self.inner.gate.set()
+        self.driver.flush()
+
+        self.assertEqual(self.inner.read('the_dag', 'the_task', self.date), 'one')
+        self.assertEqual(self.inner.read_bytes('the_dag', 'other_task', self.date), b'\x80\x02')
+
+    def test_reads_see_queued_writes(self):
+        """
+        Test reading, checking or listing waits for the writes they depend on, and writes to one task instance
+        land in order.
+        """
+        self.inner.gate.set()
+
+        for value in ['a', 'b', 'c', 'd']:
+            self.driver.write('the_dag', 'the_task', self.date, value)
+
+        self.assertEqual(self.driver.read('the_dag', 'the_task', self.date), 'd')
+        self.assertTrue(self.driver.exists('the_dag', 'the_task', self.date))
+
+        stream = io.BytesIO(b'from a stream')
+        self.driver.write_from_stream('the_dag', 'the_task', datetime(2016, 1, 3), stream)
+        stream.close()
+
+        self.assertListEqual(self.driver.list_filenames_in_task('the_dag', 'the_task'), ['2016-01-02', '2016-01-03'])
+        self.assertEqual(self.driver.read_bytes('the_dag', 'the_task', datetime(2016, 1, 3)), b'from a stream')
+
+    def test_budget_blocks_writes(self):
+        """
+        Test a write blocks while the queued writes fill the memory budget, and is queued once they land.
+        """
+        self.driver.write('the_dag', 'one', self.date, '12345')
+        self.driver.write('the_dag', 'two', self.date, '12345')
+
+        queued = threading.Event()
+
+        def write_third():
+            self.driver.write('the_dag', 'three', self.date, '1')
+            queued.set()
+
+        thread = threading.Thread(target=write_third)
+        thread.start()
+
+        self.assertFalse(queued.wait(0.2))
+
+        self.inner.gate.set()
+        thread.join(5)
+        self.assertTrue(queued.is_set())
+
+        self.driver.flush()
+        self.assertEqual(self.inner.read('the_dag', 'three', self.date), '1')
+
+    def test_budget_counts_encoded_bytes(self):
+        """
+        Test text is charged to the budget by its UTF-8 size, not its number of characters.
+        """
+        self.driver.write('the_dag', 'one', self.date, u'\xe9\xe9\xe9\xe9\xe9')
+
+        queued = threading.Event()
+
+        def write_second():
+            self.driver.write('the_dag', 'two', self.date, u'\xe9')
+            queued.set()
+
+        thread = threading.Thread(target=write_second)
+        thread.start()
+
+        # The first write's 5 characters take 10 bytes, which fills the budget.
+        self.assertFalse(queued.wait(0.2))
+
+        self.inner.gate.set()
+        thread.join(5)
+        self.assertTrue(queued.is_set())
+
+        self.driver.flush()
+        self.assertEqual(self.inner.read('the_dag', 'two', self.date), u'\xe9')
+
+    def test_flush_closes_upload_pool(self):
+        """
+        Test flush shuts down the upload threads, and later writes start new ones.
+        """
+        self.inner.gate.set()
+
+        self.driver.write('the_dag', 'the_task', self.date, 'first')
+        pool = self.driver._pool
+        self.driver.flush()
+
+        self.assertIsNone(self.driver._pool)
+        with self.assertRaises((AssertionError, ValueError)):
+            # A closed pool refuses new work.
+            pool.apply_async(len, ('',))
+
+        self.driver.write('the_dag', 'the_task', self.date, 'second')
+        self.driver.flush()
+        self.assertEqual(self.inner.read('the_dag', 'the_task', self.date), 'second')
+
+    def test_flush_raises_on_failed_write(self):
+        """
+        Test a failed background write is reported once by flush, without stopping the other writes.
+        """
+        self.inner.gate.set()
+
+        def fail(*args, **kwargs):
+            raise IOError('connection reset')
+
+        self.inner.write_bytes = fail
+
+        self.driver.write_bytes('the_dag', 'the_task', self.date, b'fails')
+        self.driver.write('the_dag', 'other_task', self.date, 'lands')
+
+        with self.assertRaises(StorageDriverError):
+            self.driver.flush()
+
+        self.assertEqual(self.inner.read('the_dag', 'other_task', self.date), 'lands')
+
+        # The failure is only reported once.
+        self.driver.flush()
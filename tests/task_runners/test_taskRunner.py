@@ -8,6 +8,13 @@ import tempfile
 from fileflow.task_runners import TaskRunner
 
 
+def total(values):
+    """
+    Sum a list; module level so map_upstreams can send it to worker processes.
+    """
+    return sum(values)
+
+
 @attr('unittest')
 class TestTaskRunner(TestCase):
     """
@@ -236,11 +243,17 @@ class TestTaskRunner(TestCase):
 
         # Test once with the default arguments
         self.task_runner_instance.read_upstream_pandas_csv('dep_one')
-        mock_get_stream.assert_called_once_with('dep_one', None)
+        mock_get_stream.assert_called_once_with('dep_one', None, name=None)
         print 'assert called onse a'
         mock_csv_reader.assert_called_once_with(
             filename_or_stream=fake_stream,
-            encoding='utf-8'
+            encoding='utf-8',
+            usecols=None,
+            dtype=None,
+            filters=None,
+            chunksize=None,
+            compact=False,
+            downcast=False
         )
         mock_get_stream.reset_mock()
         mock_csv_reader.reset_mock()
@@ -248,81 +261,315 @@ class TestTaskRunner(TestCase):
         # Test with a different dag id
         new_dag_id = 'another_fake_dag_id'
         self.task_runner_instance.read_upstream_pandas_csv('dep_one', new_dag_id)
-        mock_get_stream.assert_called_once_with('dep_one', new_dag_id)
+        mock_get_stream.assert_called_once_with('dep_one', new_dag_id, name=None)
         mock_csv_reader.assert_called_once_with(
             filename_or_stream=fake_stream,
-            encoding='utf-8'
+            encoding='utf-8',
+            usecols=None,
+            dtype=None,
+            filters=None,
+            chunksize=None,
+            compact=False,
+            downcast=False
         )
         mock_get_stream.reset_mock()
         mock_csv_reader.reset_mock()
 
         # Test with a different encoding
         self.task_runner_instance.read_upstream_pandas_csv('dep_one', encoding='not-a-real-encoding')
-        mock_get_stream.assert_called_once_with('dep_one', None)
+        mock_get_stream.assert_called_once_with('dep_one', None, name=None)
         mock_csv_reader.assert_called_once_with(
             filename_or_stream=fake_stream,
-            encoding='not-a-real-encoding'
+            encoding='not-a-real-encoding',
+            usecols=None,
+            dtype=None,
+            filters=None,
+            chunksize=None,
+            compact=False,
+            downcast=False
+        )
+        mock_get_stream.reset_mock()
+        mock_csv_reader.reset_mock()
+
+        # Test with a projection and filters
+        self.task_runner_instance.read_upstream_pandas_csv(
+            'dep_one', usecols=['a'], dtype={'a': int}, filters=[('a', '>', 1)], chunksize=10, compact=True,
+            downcast=True
+        )
+        mock_get_stream.assert_called_once_with('dep_one', None, name=None)
+        mock_csv_reader.assert_called_once_with(
+            filename_or_stream=fake_stream,
+            encoding='utf-8',
+            usecols=['a'],
+            dtype={'a': int},
+            filters=[('a', '>', 1)],
+            chunksize=10,
+            compact=True,
+            downcast=True
         )
         mock_get_stream.reset_mock()
         mock_csv_reader.reset_mock()
 
         # And once with a different dag AND a weird encoding
         self.task_runner_instance.read_upstream_pandas_csv('dep_one', new_dag_id, 'bad-encoding')
-        mock_get_stream.assert_called_once_with('dep_one', new_dag_id)
+        mock_get_stream.assert_called_once_with('dep_one', new_dag_id, name=None)
         mock_csv_reader.assert_called_once_with(
             filename_or_stream=fake_stream,
-            encoding='bad-encoding'
+            encoding='bad-encoding',
+            usecols=None,
+            dtype=None,
+            filters=None,
+            chunksize=None,
+            compact=False,
+            downcast=False
         )
         mock_get_stream.reset_mock()
         mock_csv_reader.reset_mock()
 
-    @mock.patch('fileflow.task_runners.task_runner.json.loads')
+    @mock.patch('fileflow.task_runners.task_runner.json_utils.loads')
     def test_read_upstream_json(self, mock_json_loads):
         """
         Assert convenience method read_upstream_json signature by sending it varying arguments we expect it can take.
 
-        We assume read_upstream_file works correctly (because we are testing it separately in test_read_upstream_file)
-        so we do not need to follow the api contract all the way to the storage driver. We just have to make sure the
-        read_upstream_json arguments are being passed through to read_upstream_file correctly. We also test that the
-        standard json.loads is getting called, not some hacky attempt at parsing json.
+        We assume read_upstream_bytes works correctly (because we are testing it separately in
+        test_read_upstream_bytes) so we do not need to follow the api contract all the way to the storage driver. We
+        just have to make sure the read_upstream_json arguments are being passed through correctly, and that the raw
+        bytes are handed to the json decoder with the encoding.
 
         :param mock_json_loads: Mock object preventing actual loads since we pass our own fake data here
         """
-        # Want to make sure we're really calling json.loads
-        # Not doing anything weird
         fake_result = 'fake result that is not json'
-        mock_read_upstream = mock.MagicMock(return_value=fake_result)
-        self.task_runner_instance.read_upstream_file = mock_read_upstream
+        mock_read_bytes = mock.MagicMock(return_value=fake_result)
+        self.task_runner_instance.read_upstream_bytes = mock_read_bytes
 
         # Test once with the default arguments
         self.task_runner_instance.read_upstream_json('dep_one')
-        mock_read_upstream.assert_called_once_with('dep_one', None, encoding='utf-8')
-        mock_json_loads.assert_called_once_with(fake_result)
-        mock_read_upstream.reset_mock()
+        mock_read_bytes.assert_called_once_with('dep_one', None, name=None)
+        mock_json_loads.assert_called_once_with(fake_result, encoding='utf-8')
+        mock_read_bytes.reset_mock()
         mock_json_loads.reset_mock()
 
         # Test with a different dag id
         new_dag_id = 'another_fake_dag_id'
         self.task_runner_instance.read_upstream_json('dep_one', new_dag_id)
-        mock_read_upstream.assert_called_once_with('dep_one', new_dag_id, encoding='utf-8')
-        mock_json_loads.assert_called_once_with(fake_result)
-        mock_read_upstream.reset_mock()
+        mock_read_bytes.assert_called_once_with('dep_one', new_dag_id, name=None)
+        mock_json_loads.assert_called_once_with(fake_result, encoding='utf-8')
+        mock_read_bytes.reset_mock()
         mock_json_loads.reset_mock()
 
         # Test with a different encoding
         self.task_runner_instance.read_upstream_json('dep_one', encoding='not-a-real-encoding')
-        mock_read_upstream.assert_called_once_with('dep_one', None, encoding='not-a-real-encoding')
-        mock_json_loads.assert_called_once_with(fake_result)
-        mock_read_upstream.reset_mock()
+        mock_read_bytes.assert_called_once_with('dep_one', None, name=None)
+        mock_json_loads.assert_called_once_with(fake_result, encoding='not-a-real-encoding')
+        mock_read_bytes.reset_mock()
         mock_json_loads.reset_mock()
 
         # And once with a different dag AND a weird encoding
         self.task_runner_instance.read_upstream_json('dep_one', new_dag_id, 'bad-encoding')
-        mock_read_upstream.assert_called_once_with('dep_one', new_dag_id, encoding='bad-encoding')
-        mock_json_loads.assert_called_once_with(fake_result)
-        mock_read_upstream.reset_mock()
+        mock_read_bytes.assert_called_once_with('dep_one', new_dag_id, name=None)
+        mock_json_loads.assert_called_once_with(fake_result, encoding='bad-encoding')
+        mock_read_bytes.reset_mock()
         mock_json_loads.reset_mock()
 
+    def test_read_upstream_bytes(self):
+        """
+        Assert read_upstream_bytes finds the upstream task instance like read_upstream_file, and reads its raw bytes.
+        """
+        mock_read_bytes = mock.MagicMock(return_value=b'\x80\x02')
+        self.task_runner_instance.storage.read_bytes = mock_read_bytes
+
+        self.assertEqual(self.task_runner_instance.read_upstream_bytes('dep_one'), b'\x80\x02')
+        mock_read_bytes.assert_called_once_with(self.dag_id, 'task_one', self.execution_date)
+        mock_read_bytes.reset_mock()
+
+        self.task_runner_instance.read_upstream_bytes('dep_two', 'another_fake_dag_id', name='images')
+        mock_read_bytes.assert_called_once_with('another_fake_dag_id', 'task_two~images', self.execution_date)
+
+    def test_write_bytes(self):
+        """
+        Assert write_bytes passes the raw bytes to the storage driver's write_bytes method.
+        """
+        self.task_runner_instance.write_bytes(b'\x89PNG', content_type='image/png', name='chart')
+
+        self.task_runner_instance.storage.write_bytes.assert_called_once_with(
+            self.dag_id,
+            self.task_id + '~chart',
+            self.execution_date,
+            b'\x89PNG',
+            content_type='image/png'
+        )
+
+    def test_pandas_native(self):
+        """
+        Assert a dataframe written with write_pandas_native reads back unchanged, both memory mapped from local disk
+        and read from storage that isn't local.
+        """
+        import shutil
+        import pandas as pd
+        from fileflow.storage_drivers import FileStorageDriver, MemoryStorageDriver
+
+        data = pd.DataFrame({'id': [1, 2, 3], 'name': ['a', None, 'c']}, columns=['id', 'name'])
+        self.task_runner_instance.data_dependencies['upstream'] = self.task_id
+
+        prefix = 'tests/test-output/native'
+        for storage in [FileStorageDriver(prefix), MemoryStorageDriver()]:
+            self.task_runner_instance.storage = storage
+            self.task_runner_instance.write_pandas_native(data, name='frame')
+
+            self.assertTrue(self.task_runner_instance.read_upstream_pandas_native('upstream', name='frame').equals(data))
+
+        shutil.rmtree(prefix, ignore_errors=True)
+
+    def test_map_upstreams(self):
+        """
+        Assert map_upstreams reads each upstream output in the format asked for, applies the function and yields
+        the results in order, or writes them as named outputs.
+        """
+        from fileflow.errors import FileflowError
+        from fileflow.storage_drivers import MemoryStorageDriver
+
+        storage = MemoryStorageDriver()
+        self.task_runner_instance.storage = storage
+        storage.write(self.dag_id, 'task_one', self.execution_date, '[1, 2, 3]')
+        storage.write(self.dag_id, 'task_two', self.execution_date, '[10, 20]')
+
+        for workers in [1, 4]:
+            results = self.task_runner_instance.map_upstreams(total, ['dep_two', 'dep_one'], format='json',
+                                                              workers=workers)
+            self.assertListEqual(list(results), [('dep_two', 30), ('dep_one', 6)])
+
+        # The outputs are written before map_upstreams returns, without iterating the results.
+        results = self.task_runner_instance.map_upstreams(len, ['dep_one', 'dep_two'], output='json')
+        self.assertEqual(storage.read(self.dag_id, self.task_id + '~dep_one', self.execution_date), '9')
+        self.assertListEqual(results, [('dep_one', 'dep_one'), ('dep_two', 'dep_two')])
+        self.assertEqual(storage.read(self.dag_id, self.task_id + '~dep_one', self.execution_date), '9')
+        self.assertEqual(storage.read(self.dag_id, self.task_id + '~dep_two', self.execution_date), '8')
+
+        with self.assertRaises(FileflowError):
+            self.task_runner_instance.map_upstreams(len, ['dep_one'], format='parquet')
+
+        with self.assertRaises(FileflowError):
+            self.task_runner_instance.map_upstreams(len, ['dep_one'], output='parquet')
+
+        with self.assertRaises(FileflowError):
+            self.task_runner_instance.map_upstreams(len, ['dep_one'], executor='cluster')
+
+        # Worker processes can't see this process's memory.
+        with self.assertRaises(FileflowError):
+            self.task_runner_instance.map_upstreams(len, ['dep_one'], executor='process')
+
+    def test_map_upstreams_processes(self):
+        """
+        Assert map_upstreams with the process executor reads and writes through drivers the worker processes build
+        from this process's settings.
+        """
+        import shutil
+        from fileflow import configuration
+        from fileflow.errors import FileflowError
+        from fileflow.storage_drivers import FileStorageDriver, MemoryStorageDriver
+
+        prefix = 'tests/test-output/map_upstreams'
+        storage = FileStorageDriver(prefix)
+        storage.write(self.dag_id, 'task_one', self.execution_date, '[1, 2, 3]')
+        storage.write(self.dag_id, 'task_two', self.execution_date, '[10, 20]')
+
+        settings = configuration.get_settings()._replace(storage_type='file', storage_prefix=prefix)
+        dependencies = {'dep_one': 'task_one', 'dep_two': 'task_two'}
+        task_runner = TaskRunner(dict(self.context, data_dependencies=dependencies))
+
+        try:
+            with mock.patch.object(configuration, 'get_settings', return_value=settings):
+                results = list(task_runner.map_upstreams(
+                    total, ['dep_one', 'dep_two'], format='json', executor='process', workers=2
+                ))
+                self.assertListEqual(results, [('dep_one', 6), ('dep_two', 30)])
+
+                results = list(task_runner.map_upstreams(
+                    total, ['dep_one', 'dep_two'], format='json', executor='process', output='json'
+                ))
+                self.assertListEqual(results, [('dep_one', 'dep_one'), ('dep_two', 'dep_two')])
+
+            self.assertEqual(storage.read(self.dag_id, self.task_id + '~dep_two', self.execution_date), '30')
+
+            # The workers wouldn't use a driver set on or given to the runner.
+            self.task_runner_instance.storage = storage
+            with self.assertRaises(FileflowError):
+                self.task_runner_instance.map_upstreams(total, ['dep_one'], format='json', executor='process')
+
+            task_runner = TaskRunner(dict(self.context, data_dependencies=dependencies, storage=storage))
+            with self.assertRaises(FileflowError):
+                task_runner.map_upstreams(total, ['dep_one'], format='json', executor='process')
+
+            # Nor memory storage, even from a factory that hasn't been called yet.
+            task_runner = TaskRunner(dict(self.context, data_dependencies=dependencies, storage_factory=MemoryStorageDriver))
+            with mock.patch.object(configuration, 'get_settings', return_value=settings):
+                with self.assertRaises(FileflowError):
+                    task_runner.map_upstreams(total, ['dep_one'], format='json', executor='process')
+        finally:
+            shutil.rmtree(prefix, ignore_errors=True)
+
+    def test_read_upstream_range(self):
+        """
+        Assert read_upstream_range finds the upstream outputs between two dates with one listing, and concatenates
+        them or yields them per date, oldest first.
+        """
+        import pandas as pd
+        from fileflow.errors import FileflowError
+        from fileflow.storage_drivers import MemoryStorageDriver
+
+        storage = MemoryStorageDriver()
+        storage.list_filenames_in_path = mock.MagicMock(wraps=storage.list_filenames_in_path)
+        self.task_runner_instance.storage = storage
+
+        # No output for the 3rd.
+        for day in [1, 2, 4, 5]:
+            storage.write(self.dag_id, 'task_one', datetime(2015, 1, day), 'day,value\n{0},{0}0\n'.format(day))
+
+        data = self.task_runner_instance.read_upstream_range('dep_one', datetime(2015, 1, 2), datetime(2015, 1, 4),
+                                                             date_column='date')
+        self.assertListEqual(list(data['day']), ['2', '4'])
+        self.assertListEqual(list(data['value']), ['20', '40'])
+        self.assertListEqual(list(data['date']), [datetime(2015, 1, 2), datetime(2015, 1, 4)])
+        self.assertEqual(storage.list_filenames_in_path.call_count, 1)
+
+        outputs = self.task_runner_instance.read_upstream_range('dep_one', datetime(2015, 1, 1), datetime(2015, 1, 31),
+                                                                format='file', concat=False, workers=3)
+        self.assertListEqual(list(outputs), [
+            (datetime(2015, 1, day), 'day,value\n{0},{0}0\n'.format(day)) for day in [1, 2, 4, 5]
+        ])
+
+        # The runner's own date isn't changed by reading other dates.
+        self.assertEqual(self.task_runner_instance.date, self.execution_date)
+
+        empty = self.task_runner_instance.read_upstream_range('dep_one', datetime(2016, 1, 1), datetime(2016, 1, 2))
+        self.assertIsInstance(empty, pd.DataFrame)
+        self.assertEqual(len(empty), 0)
+
+        with self.assertRaises(FileflowError):
+            self.task_runner_instance.read_upstream_range('dep_one', None, None, format='json')
+
+        with self.assertRaises(FileflowError):
+            self.task_runner_instance.read_upstream_range('dep_one', None, None, format='parquet', concat=False)
+
+    def test_json_lines(self):
+        """
+        Assert records written with write_json_lines are read back one at a time by read_upstream_json_lines.
+        """
+        from fileflow.storage_drivers import MemoryStorageDriver
+
+        self.task_runner_instance.storage = MemoryStorageDriver()
+        self.task_runner_instance.data_dependencies['upstream'] = self.task_id
+
+        records = [{'id': 1, 'name': u'caf\xe9'}, {'id': 2, 'name': None}]
+        count = self.task_runner_instance.write_json_lines(iter(records), name='events')
+
+        self.assertEqual(count, 2)
+        lines = self.task_runner_instance.read_upstream_file('upstream', name='events').splitlines()
+        self.assertEqual(len(lines), 2)
+
+        read_back = self.task_runner_instance.read_upstream_json_lines('upstream', name='events')
+        self.assertListEqual(list(read_back), records)
+
     def test_write_file(self):
         """
         Assert we forward convenience method write_file and its args to the storage driver's write method.
@@ -402,15 +649,15 @@ class TestTaskRunner(TestCase):
 
         self.task_runner_instance.write_pandas_csv('fake data')
         mock_csv_writer.assert_called_once_with(data='fake data', filename=None)
-        mock_writer.assert_called_once_with(fake_csv, content_type='text/csv')
+        mock_writer.assert_called_once_with(fake_csv, content_type='text/csv', name=None)
 
-    @mock.patch('json.dumps')
+    @mock.patch('fileflow.task_runners.task_runner.json_utils.dumps')
     def test_write_json(self, mock_json_dumps):
         """
         Assert we forward from convenience method write_json and its args to the storage driver's write_file method. Also
-        test that the standard json.dumps is called.
+        test that json_utils.dumps is called.
 
-        :param mock_json_dumps: mock for when this convenience method calls json.dumps to serialize the json
+        :param mock_json_dumps: mock for when this convenience method calls json_utils.dumps to serialize the json
         """
         mock_json_dumps.return_value = "fake"
         mock_writer = mock.MagicMock()
@@ -419,4 +666,184 @@ class TestTaskRunner(TestCase):
         fake_data = {'val': 'key', 'val2': [1, 2]}
         self.task_runner_instance.write_json(fake_data)
         mock_json_dumps.assert_called_once_with(fake_data)
-        mock_writer.assert_called_once_with("fake", content_type='application/json')
+        mock_writer.assert_called_once_with("fake", content_type='application/json', name=None)
+
+    def test_named_outputs(self):
+        """
+        Assert named outputs are written and read under the task ID and the name, and the main output under the
+        task ID alone.
+        """
+        from fileflow.errors import FileflowError
+        from fileflow.storage_drivers import MemoryStorageDriver
+
+        storage = MemoryStorageDriver()
+        self.task_runner_instance.storage = storage
+
+        self.task_runner_instance.write_file('main output')
+        self.task_runner_instance.write_json({'rows': 10}, name='summary')
+
+        self.assertEqual(storage.read(self.dag_id, self.task_id, self.execution_date), 'main output')
+        self.assertEqual(storage.read(self.dag_id, self.task_id + '~summary', self.execution_date), '{"rows": 10}')
+        self.assertEqual(
+            self.task_runner_instance.get_output_filename(name='summary'),
+            storage.get_filename(self.dag_id, self.task_id + '~summary', self.execution_date)
+        )
+
+        self.task_runner_instance.data_dependencies['upstream'] = self.task_id
+        self.assertEqual(self.task_runner_instance.read_upstream_file('upstream'), 'main output')
+        self.assertDictEqual(self.task_runner_instance.read_upstream_json('upstream', name='summary'), {'rows': 10})
+        self.assertEqual(self.task_runner_instance.get_upstream_stream('upstream', name='summary').read(), b'{"rows": 10}')
+
+        for bad_name in ['', 'a/b']:
+            with self.assertRaises(FileflowError):
+                self.task_runner_instance.write_file('data', name=bad_name)
+
+    def test_partitioned_pandas(self):
+        """
+        Assert a partitioned dataframe is written as an index plus one output per partition, and that reads only fetch
+        the partitions matching the filters.
+        """
+        import pandas as pd
+        from fileflow.errors import FileflowError
+        from fileflow.storage_drivers import MemoryStorageDriver
+
+        storage = MemoryStorageDriver()
+        self.task_runner_instance.storage = storage
+        self.task_runner_instance.data_dependencies['upstream'] = self.task_id
+
+        data = pd.DataFrame({
+            'id': ['1', '2', '3', '4', '5'],
+            'region': ['east', 'west', 'east', 'north', None],
+            'value': ['a', 'b', 'c', 'd', 'e'],
+        }, columns=['id', 'region', 'value'])
+
+        self.task_runner_instance.write_pandas_partitioned(data, ['region'])
+
+        index = self.task_runner_instance.read_upstream_json('upstream')
+        self.assertListEqual([p['values']['region'] for p in index['partitions']], [None, 'east', 'north', 'west'])
+        self.assertListEqual([p['rows'] for p in index['partitions']], [1, 2, 1, 1])
+
+        everything = self.task_runner_instance.read_upstream_pandas('upstream')
+        self.assertListEqual(list(everything.columns), ['id', 'region', 'value'])
+        self.assertListEqual(sorted(everything['id']), ['1', '2', '3', '4', '5'])
+
+        storage.get_read_stream = mock.MagicMock(wraps=storage.get_read_stream)
+        some = self.task_runner_instance.read_upstream_pandas('upstream', filters={'region': ['east', None]})
+        self.assertEqual(storage.get_read_stream.call_count, 2)
+        self.assertListEqual(
+            some.sort_values('id').to_dict(orient='records'),
+            [
+                {'id': '1', 'region': 'east', 'value': 'a'},
+                {'id': '3', 'region': 'east', 'value': 'c'},
+                {'id': '5', 'region': None, 'value': 'e'},
+            ]
+        )
+
+        nothing = self.task_runner_instance.read_upstream_pandas('upstream', filters={'region': 'south'})
+        self.assertEqual(len(nothing), 0)
+        self.assertListEqual(list(nothing.columns), ['id', 'region', 'value'])
+
+        with self.assertRaises(FileflowError):
+            self.task_runner_instance.read_upstream_pandas('upstream', filters={'value': 'a'})
+
+        self.task_runner_instance.write_json(['not', 'an', 'index'], name='plain')
+        with self.assertRaises(FileflowError):
+            self.task_runner_instance.read_upstream_pandas('upstream', name='plain')
+
+    def test_flush(self):
+        """
+        Assert flush blocks on the storage driver's flush.
+        """
+        self.task_runner_instance.flush()
+        self.task_runner_instance.storage.flush.assert_called_once_with()
+
+    @mock.patch('fileflow.task_runners.task_runner.get_storage_driver')
+    def test_lazy_storage(self, mock_get_storage_driver):
+        """
+        Assert the storage driver is only built when it's first used, that a driver passed in the context is used
+        instead, and that a task that never used storage has nothing to flush.
+        """
+        task_runner = TaskRunner(dict(self.context))
+        self.assertFalse(mock_get_storage_driver.called)
+
+        task_runner.finish()
+        self.assertFalse(mock_get_storage_driver.called)
+
+        self.assertIs(task_runner.storage, mock_get_storage_driver.return_value)
+        self.assertIs(task_runner.storage, mock_get_storage_driver.return_value)
+        mock_get_storage_driver.assert_called_once_with()
+
+        mock_get_storage_driver.reset_mock()
+        driver = mock.MagicMock()
+        context = dict(self.context, storage=driver)
+        task_runner = TaskRunner(context)
+        self.assertNotIn('storage', context)
+        self.assertIs(task_runner.storage, driver)
+        self.assertFalse(mock_get_storage_driver.called)
+
+    def test_lazy_storage_threads(self):
+        """
+        Assert threads that first use the storage at the same time share one driver, so every write is flushed.
+        """
+        import time
+        import pandas as pd
+        from fileflow.storage_drivers import MemoryStorageDriver, WriteBehindStorageDriver
+
+        drivers = []
+
+        def slow_factory():
+            time.sleep(0.05)
+            drivers.append(MemoryStorageDriver())
+            return drivers[-1]
+
+        task_runner = TaskRunner(dict(self.context, storage_factory=slow_factory, async_writes=True))
+        data = pd.DataFrame({'region': ['a', 'b', 'c', 'd', 'e', 'f'], 'value': ['1', '2', '3', '4', '5', '6']})
+        task_runner.write_pandas_partitioned(data, ['region'], workers=6)
+        task_runner.finish()
+
+        self.assertEqual(len(drivers), 1)
+        self.assertIsInstance(task_runner.storage, WriteBehindStorageDriver)
+        self.assertEqual(len(drivers[0].list_filenames_in_task(self.dag_id, self.task_id + '~partition-00005')), 1)
+
+    @mock.patch('fileflow.task_runners.task_runner.get_io_observers')
+    def test_instrumentation(self, mock_get_io_observers):
+        """
+        Assert the storage driver is only wrapped when I/O observers are configured, and that observers hear
+        about the end of the task.
+        """
+        from fileflow.storage_drivers import InstrumentedStorageDriver
+        from fileflow.instrumentation import MemoryObserver
+
+        mock_get_io_observers.return_value = []
+        self.assertNotIsInstance(TaskRunner(dict(self.context)).storage, InstrumentedStorageDriver)
+
+        observer = MemoryObserver()
+        mock_get_io_observers.return_value = [observer]
+        task_runner = TaskRunner(dict(self.context))
+        self.assertIsInstance(task_runner.storage, InstrumentedStorageDriver)
+
+        task_runner.finish()
+        self.assertListEqual(observer.finished, [{
+            'dag_id': self.dag_id,
+            'task_id': self.task_id,
+            'execution_date': self.execution_date,
+        }])
+
+    @mock.patch('fileflow.task_runners.task_runner.get_io_observers')
+    def test_instrumentation_async_writes(self, mock_get_io_observers):
+        """
+        Assert that with async writes, background uploads are recorded by the threads that do them, and observers
+        still hear about the end of the task.
+        """
+        from fileflow.storage_drivers import MemoryStorageDriver
+        from fileflow.instrumentation import MemoryObserver
+
+        observer = MemoryObserver()
+        mock_get_io_observers.return_value = [observer]
+
+        task_runner = TaskRunner(dict(self.context, storage=MemoryStorageDriver(), async_writes=True))
+        task_runner.write_json({'written': 'later'})
+        task_runner.finish()
+
+        self.assertListEqual([(event.operation, event.bytes) for event in observer.events], [('write', 20), ('flush', None)])
+        self.assertEqual(len(observer.finished), 1)
@@ -0,0 +1,32 @@
+from unittest import TestCase
+from nose.plugins.attrib import attr
+import subprocess
+import sys
+
+
+@attr('unittest')
+class TestImports(TestCase):
+    """
+    Every Airflow task process and DAG parse imports fileflow, so heavy
+    dependencies must only be imported once they are actually used.
+    """
+
+    def assertNotImported(self, module, heavy_modules):
+        script = 'import sys; import {}; print(",".join(sorted(sys.modules)))'.format(module)
+        output = subprocess.check_output([sys.executable, '-c', script])
+        loaded = output.decode('utf-8').strip().split(',')
+
+        for heavy_module in heavy_modules:
+            self.assertNotIn(heavy_module, loaded, '{} imports {}'.format(module, heavy_module))
+
+    def test_task_runners(self):
+        """
+        Importing the task runners must not import pandas, boto or airflow.
+        """
+        self.assertNotImported('fileflow.task_runners', ['pandas', 'boto', 'airflow'])
+
+    def test_storage_drivers(self):
+        """
+        Importing the storage drivers must not import pandas, boto or airflow.
+        """
+        self.assertNotImported('fileflow.storage_drivers', ['pandas', 'boto', 'airflow'])
@@ -0,0 +1,118 @@
+from unittest import TestCase
+from fileflow.instrumentation import IOEvent, LogSummaryObserver, MemoryObserver, PrometheusTextfileObserver, \
+    StatsdObserver, get_io_observers
+from datetime import datetime
+from nose.plugins.attrib import attr
+import mock
+import os
+import shutil
+import tempfile
+
+
+def make_event(operation, size, retries=0, cache_hit=None):
+    event = IOEvent(operation, 'the_dag', 'upstream_task', datetime(2016, 1, 1), tags={
+        'dag_id': 'the_dag',
+        'task_id': 'the_task',
+        'execution_date': datetime(2016, 1, 1),
+    })
+    event.bytes = size
+    event.duration = 0.5
+    event.retries = retries
+    event.cache_hit = cache_hit
+    return event
+
+
+@attr('unittest')
+class TestObservers(TestCase):
+    def setUp(self):
+        self.tags = {'dag_id': 'the_dag', 'task_id': 'the_task', 'execution_date': datetime(2016, 1, 1)}
+
+    @mock.patch('fileflow.instrumentation.logging')
+    def test_log_summary(self, mock_logging):
+        """
+        Test the log observer logs one summary line per operation at task end.
+        """
+        observer = LogSummaryObserver()
+        observer.record(make_event('read', 10, retries=1))
+        observer.record(make_event('read', 20, cache_hit=True))
+        observer.record(make_event('write', 5))
+
+        self.assertFalse(mock_logging.info.called)
+
+        observer.task_finished(self.tags)
+
+        self.assertEqual(mock_logging.info.call_count, 2)
+        read_args = mock_logging.info.call_args_list[0][0]
+        self.assertEqual(read_args[4:], ('read', 2, 30, 1.0, 1, 1, 0))
+
+    def test_prometheus_textfile(self):
+        """
+        Test the prometheus observer writes per operation totals for the task.
+        """
+        directory = tempfile.mkdtemp()
+        try:
+            observer = PrometheusTextfileObserver(directory)
+            observer.record(make_event('read', 10))
+            observer.record(make_event('read', 20))
+            observer.task_finished(self.tags)
+
+            self.assertListEqual(os.listdir(directory), ['the_dag__the_task.prom'])
+            with open(os.path.join(directory, 'the_dag__the_task.prom')) as f:
+                content = f.read()
+
+            self.assertIn('fileflow_io_bytes_total{dag_id="the_dag",task_id="the_task",operation="read"} 30', content)
+            self.assertIn('fileflow_io_operations_total{dag_id="the_dag",task_id="the_task",operation="read"} 2', content)
+
+            # The collector may run as another user.
+            self.assertEqual(os.stat(os.path.join(directory, 'the_dag__the_task.prom')).st_mode & 0o777, 0o644)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_prometheus_textfile_escapes_labels(self):
+        """
+        Test the prometheus observer escapes backslashes, quotes and newlines in label values.
+        """
+        directory = tempfile.mkdtemp()
+        try:
+            observer = PrometheusTextfileObserver(directory)
+            observer.record(make_event('read', 10))
+            observer.task_finished({'dag_id': 'the_dag', 'task_id': 'a "quoted"\\task\nname'})
+
+            with open(os.path.join(directory, os.listdir(directory)[0])) as f:
+                content = f.read()
+
+            self.assertIn('fileflow_io_bytes_total{dag_id="the_dag",task_id="a \\"quoted\\"\\\\task\\nname",operation="read"} 10',
+                          content)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_statsd(self):
+        """
+        Test the statsd observer sends a timing and counters for each event.
+        """
+        observer = StatsdObserver('statsd.example.com', '8125', 'fileflow')
+        observer._socket = mock.MagicMock()
+
+        observer.record(make_event('read', 10, retries=2, cache_hit=False))
+
+        payload, address = observer._socket.sendto.call_args[0]
+        self.assertEqual(address, ('statsd.example.com', 8125))
+        self.assertListEqual(payload.decode('utf-8').split('\n'), [
+            'fileflow.the_dag.the_task.read.duration:500.000|ms',
+            'fileflow.the_dag.the_task.read.bytes:10|c',
+            'fileflow.the_dag.the_task.read.retries:2|c',
+            'fileflow.the_dag.the_task.read.cache_miss:1|c',
+        ])
+
+    def test_get_io_observers(self):
+        """
+        Test observers are built from their names, including import paths,
+        and that none are built by default.
+        """
+        self.assertListEqual(get_io_observers(''), [])
+
+        observers = get_io_observers('log, fileflow.instrumentation:MemoryObserver')
+
+        self.assertEqual(len(observers), 2)
+        self.assertIsInstance(observers[0], LogSummaryObserver)
+        self.assertIsInstance(observers[1], MemoryObserver)
@@ -0,0 +1,103 @@
+from unittest import TestCase
+from fileflow import profiling
+from fileflow.profiling import TaskProfiler, phase
+from nose.plugins.attrib import attr
+import json
+import mock
+
+
+@attr('unittest')
+class TestTaskProfiler(TestCase):
+    def tearDown(self):
+        profiling._active = None
+
+    def test_phase_without_profiler(self):
+        """
+        Test phases are a no-op when nothing is being profiled.
+        """
+        profiler = TaskProfiler()
+
+        with phase('storage_read'):
+            pass
+
+        self.assertDictEqual(profiler.phases, {})
+
+    @mock.patch('fileflow.profiling.time')
+    def test_nested_phases(self, mock_time):
+        """
+        Test nested phases count towards the total but not the self time of
+        the phase around them.
+        """
+        mock_time.time.side_effect = [0.0, 1.0, 2.0, 5.0, 6.0, 7.0, 10.0, 12.0]
+
+        profiler = TaskProfiler()
+        profiler.start()
+
+        with phase('run'):
+            with phase('storage_read'):
+                pass
+            with phase('storage_read'):
+                pass
+
+        profiler.stop()
+        report = profiler.report({'task_id': 'the_task'})
+
+        self.assertEqual(report['task_id'], 'the_task')
+        self.assertEqual(report['total_seconds'], 12.0)
+        self.assertDictEqual(report['phases']['run'], {'calls': 1, 'seconds': 9.0, 'self_seconds': 5.0})
+        self.assertDictEqual(report['phases']['storage_read'], {'calls': 2, 'seconds': 4.0, 'self_seconds': 4.0})
+
+    def test_stop(self):
+        """
+        Test phases stop reporting to a profiler once it's stopped.
+        """
+        profiler = TaskProfiler()
+        profiler.start()
+        profiler.stop()
+
+        with phase('storage_read'):
+            pass
+
+        self.assertDictEqual(profiler.phases, {})
+
+    def test_phase_records_failures(self):
+        """
+        Test a phase that raises is still timed.
+        """
+        profiler = TaskProfiler()
+        profiler.start()
+
+        with self.assertRaises(ValueError):
+            with phase('csv_parse'):
+                raise ValueError()
+
+        self.assertEqual(profiler.report()['phases']['csv_parse']['calls'], 1)
+
+    def test_profile_call_cprofile(self):
+        """
+        Test profile_call returns the function's result and keeps the cProfile
+        statistics in a JSON serializable report.
+        """
+        profiler = TaskProfiler(cprofile=True)
+        profiler.start()
+
+        result = profiler.profile_call(sorted, [3, 1, 2])
+        profiler.stop()
+
+        self.assertListEqual(result, [1, 2, 3])
+        report = profiler.report()
+        self.assertIn('function calls', report['cprofile'])
+        json.dumps(report)
+
+    def test_profile_call_plain(self):
+        """
+        Test profile_call doesn't add statistics unless asked to.
+        """
+        profiler = TaskProfiler()
+        profiler.start()
+
+        self.assertEqual(profiler.profile_call(len, 'abc'), 3)
+        profiler.stop()
+
+        self.assertNotIn('cprofile', profiler.report())
+        self.assertNotIn('tracemalloc', profiler.report())
@@ -0,0 +1,72 @@
+from unittest import TestCase
+from fileflow.rate_limit import AdaptiveRateLimiter, get_rate_limiter
+from nose.plugins.attrib import attr
+import mock
+
+
+@attr('unittest')
+@mock.patch('fileflow.rate_limit.time')
+class TestAdaptiveRateLimiter(TestCase):
+    def test_acquire_paces_requests(self, mock_time):
+        """
+        Test requests are spaced out evenly at the current rate.
+        """
+        mock_time.time.return_value = 100.0
+        limiter = AdaptiveRateLimiter(initial_rate=4)
+
+        for _ in range(3):
+            limiter.acquire()
+
+        self.assertListEqual([c[0][0] for c in mock_time.sleep.call_args_list], [0.25, 0.5])
+
+    def test_additive_increase(self, mock_time):
+        """
+        Test a second's worth of successes raises the rate by the increase.
+        """
+        limiter = AdaptiveRateLimiter(initial_rate=100, increase=10)
+
+        for _ in range(100):
+            limiter.on_success()
+
+        self.assertAlmostEqual(limiter.rate, 110, delta=0.5)
+
+    def test_multiplicative_decrease(self, mock_time):
+        """
+        Test throttling cuts the rate, once per cooldown, down to the minimum.
+        """
+        mock_time.time.return_value = 100.0
+        limiter = AdaptiveRateLimiter(initial_rate=100, min_rate=20, decrease=0.5, cooldown=1)
+
+        limiter.on_throttle()
+        limiter.on_throttle()
+        self.assertEqual(limiter.rate, 50)
+
+        mock_time.time.return_value = 101.5
+        limiter.on_throttle()
+        self.assertEqual(limiter.rate, 25)
+
+        mock_time.time.return_value = 103.0
+        limiter.on_throttle()
+        self.assertEqual(limiter.rate, 20)
+
+    def test_max_rate(self, mock_time):
+        """
+        Test the rate doesn't rise above the maximum.
+        """
+        limiter = AdaptiveRateLimiter(initial_rate=10, max_rate=10)
+        limiter.on_success()
+
+        self.assertEqual(limiter.rate, 10)
+
+
+@attr('unittest')
+class TestGetRateLimiter(TestCase):
+    def test_shared(self):
+        """
+        Test one limiter is shared per name.
+        """
+        limiter = get_rate_limiter('test_shared', initial_rate=5)
+
+        self.assertIs(get_rate_limiter('test_shared', initial_rate=50), limiter)
+        self.assertEqual(limiter.rate, 5)
+        self.assertIsNot(get_rate_limiter('test_shared_other'), limiter)
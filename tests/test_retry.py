@@ -0,0 +1,127 @@
+from unittest import TestCase
+from fileflow.retry import RetryBudget, RetryPolicy, is_transient
+from nose.plugins.attrib import attr
+from mock import MagicMock
+import mock
+import errno
+import socket
+
+
+class ResponseError(Exception):
+    def __init__(self, status, error_code=None):
+        super(ResponseError, self).__init__(status)
+        self.status = status
+        self.error_code = error_code
+
+
+@attr('unittest')
+@mock.patch('fileflow.retry.time')
+class TestRetryPolicy(TestCase):
+    def test_retries_until_success(self, mock_time):
+        """
+        Test transient failures are retried with a growing, jittered backoff.
+        """
+        func = MagicMock(side_effect=[socket.error(errno.ECONNRESET, 'Connection reset by peer'), ResponseError(503), 'result'])
+        policy = RetryPolicy(attempts=5, base_delay=1, max_delay=3)
+
+        with mock.patch('fileflow.retry.random.uniform', side_effect=lambda low, high: high) as mock_uniform:
+            self.assertEqual(policy.call(func, 'arg'), 'result')
+
+        self.assertEqual(func.call_count, 3)
+        func.assert_called_with('arg')
+        self.assertListEqual([c[0] for c in mock_uniform.call_args_list], [(0, 1), (0, 2)])
+        self.assertListEqual([c[0][0] for c in mock_time.sleep.call_args_list], [1, 2])
+
+    def test_backoff_is_capped(self, mock_time):
+        """
+        Test the backoff never exceeds the max delay.
+        """
+        policy = RetryPolicy(base_delay=1, max_delay=3)
+
+        for retry in range(1, 20):
+            self.assertLessEqual(policy.backoff(retry), 3)
+
+    def test_gives_up_after_attempts(self, mock_time):
+        """
+        Test the last error is raised when attempts run out.
+        """
+        func = MagicMock(side_effect=ResponseError(500))
+
+        with self.assertRaises(ResponseError):
+            RetryPolicy(attempts=3).call(func)
+
+        self.assertEqual(func.call_count, 3)
+
+    def test_permanent_errors_not_retried(self, mock_time):
+        """
+        Test errors that aren't transient are raised straight away.
+        """
+        func = MagicMock(side_effect=ResponseError(404))
+
+        with self.assertRaises(ResponseError):
+            RetryPolicy().call(func)
+
+        self.assertEqual(func.call_count, 1)
+        self.assertFalse(mock_time.sleep.called)
+
+    def test_budget_limits_retries(self, mock_time):
+        """
+        Test retries stop once the shared budget is spent.
+        """
+        budget = RetryBudget(ratio=0, min_retries=2)
+        policy = RetryPolicy(attempts=10, budget=budget)
+        func = MagicMock(side_effect=ResponseError(503))
+
+        with self.assertRaises(ResponseError):
+            policy.call(func)
+        self.assertEqual(func.call_count, 3)
+
+        # The budget is spent, so the next request isn't retried at all.
+        func.reset_mock()
+        with self.assertRaises(ResponseError):
+            policy.call(func)
+        self.assertEqual(func.call_count, 1)
+
+    def test_rate_limiter(self, mock_time):
+        """
+        Test every attempt is paced by the rate limiter, which hears about
+        throttles and successes.
+        """
+        limiter = MagicMock()
+        func = MagicMock(side_effect=[ResponseError(503, 'SlowDown'), ResponseError(500), 'result'])
+
+        RetryPolicy(rate_limiter=limiter).call(func)
+
+        self.assertEqual(limiter.acquire.call_count, 3)
+        self.assertEqual(limiter.on_throttle.call_count, 1)
+        self.assertEqual(limiter.on_success.call_count, 1)
+
+
+@attr('unittest')
+class TestRetryBudget(TestCase):
+    def test_ratio(self):
+        """
+        Test the budget grows with the number of requests made.
+        """
+        budget = RetryBudget(ratio=0.5, min_retries=0)
+        self.assertFalse(budget.try_spend())
+
+        for _ in range(4):
+            budget.record_request()
+
+        self.assertTrue(budget.try_spend())
+        self.assertTrue(budget.try_spend())
+        self.assertFalse(budget.try_spend())
+
+
+@attr('unittest')
+class TestIsTransient(TestCase):
+    def test_is_transient(self):
+        self.assertTrue(is_transient(socket.timeout()))
+        self.assertTrue(is_transient(socket.error(errno.ECONNRESET, 'Connection reset by peer')))
+        self.assertFalse(is_transient(IOError(errno.ENOSPC, 'No space left on device')))
+        self.assertFalse(is_transient(OSError(errno.EACCES, 'Permission denied')))
+        self.assertTrue(is_transient(ResponseError(503)))
+        self.assertTrue(is_transient(ResponseError(400, 'RequestTimeout')))
+        self.assertFalse(is_transient(ResponseError(403, 'AccessDenied')))
+        self.assertFalse(is_transient(ValueError()))
@@ -0,0 +1,89 @@
+from unittest import TestCase
+from fileflow.utils import json_utils
+from nose.plugins.attrib import attr
+import io
+import json
+import math
+import mock
+
+
+@attr('unittest')
+class TestJsonUtils(TestCase):
+    def test_dumps_and_loads(self):
+        """
+        Test objects round trip through dumps and loads, and that dumps gives UTF-8 bytes.
+        """
+        data = {'name': u'caf\xe9', 'values': [1, 2.5, None, True]}
+
+        output = json_utils.dumps(data)
+
+        self.assertIsInstance(output, bytes)
+        self.assertDictEqual(json_utils.loads(output), data)
+        self.assertDictEqual(json_utils.loads(output.decode('utf-8')), data)
+
+    def test_loads_other_encoding(self):
+        """
+        Test bytes in encodings other than UTF-8 are decoded first.
+        """
+        self.assertEqual(json_utils.loads(u'"caf\xe9"'.encode('latin-1'), encoding='latin-1'), u'caf\xe9')
+
+    def test_orjson_fallback(self):
+        """
+        Test anything orjson can't encode is encoded with the standard library.
+        """
+        fake_orjson = mock.MagicMock()
+        fake_orjson.dumps.side_effect = TypeError('Integer exceeds 64-bit range')
+
+        with mock.patch.object(json_utils, 'orjson', fake_orjson):
+            self.assertEqual(json_utils.dumps(2 ** 70), str(2 ** 70).encode('utf-8'))
+
+    def test_non_finite_floats(self):
+        """
+        Test NaN and infinities round trip with and without orjson, which won't write or read them itself.
+        """
+        class FakeOrjson(object):
+            """
+            Mimics orjson: NaN is written as null, and refused when read.
+            """
+            OPT_NON_STR_KEYS = 0
+            JSONDecodeError = ValueError
+
+            @staticmethod
+            def dumps(data, option=None):
+                return json.dumps(data, separators=(',', ':')).replace('NaN', 'null').encode('utf-8')
+
+            @staticmethod
+            def loads(data):
+                def refuse(constant):
+                    raise ValueError('unexpected ' + constant)
+
+                return json.loads(data, parse_constant=refuse)
+
+        data = {'values': [1.5, float('inf'), float('-inf')], 'missing': None}
+
+        for backend in [FakeOrjson, None]:
+            with mock.patch.object(json_utils, 'orjson', backend):
+                output = json_utils.dumps(dict(data, nan=float('nan')))
+                result = json_utils.loads(output)
+
+                self.assertTrue(math.isnan(result.pop('nan')))
+                self.assertDictEqual(result, data)
+
+        # Without non-finite floats, orjson's output is used as is.
+        with mock.patch.object(json_utils, 'orjson', FakeOrjson):
+            self.assertEqual(json_utils.dumps({'missing': None}), b'{"missing":null}')
+
+    def test_json_lines(self):
+        """
+        Test records written as JSON Lines are read back one at a time, skipping blank lines.
+        """
+        records = [{'id': 1}, {'id': 2, 'tags': ['a', 'b']}, []]
+
+        output, count = json_utils.write_json_lines_to_file(iter(records))
+
+        self.assertEqual(count, 3)
+        data = output.read()
+        output.close()
+        self.assertEqual(data.count(b'\n'), 3)
+
+        self.assertListEqual(list(json_utils.iter_json_lines(io.BytesIO(data + b'\n'))), records)
@@ -0,0 +1,85 @@
+from unittest import TestCase
+from fileflow.errors import FileflowError
+from fileflow.utils import native_utils
+from nose.plugins.attrib import attr
+import io
+import mock
+import numpy as np
+import os
+import pandas as pd
+
+
+@attr('unittest')
+class TestNativeUtils(TestCase):
+    def setUp(self):
+        self.data = pd.DataFrame({
+            'id': np.arange(5),
+            'name': ['a', 'b', None, 'd', 'e'],
+            'value': [1.5, np.nan, 2.0, 3.0, 4.0],
+        }, columns=['id', 'name', 'value'])
+        self.output_filename = 'tests/test-output/native'
+
+        if not os.path.exists('tests/test-output'):
+            os.makedirs('tests/test-output')
+
+    def tearDown(self):
+        try:
+            os.remove(self.output_filename)
+        except OSError:
+            # file was not written in this test
+            pass
+
+    def test_round_trip(self):
+        """
+        Test a dataframe round trips through bytes, a stream and a memory mapped file with its dtypes intact.
+        """
+        output = native_utils.dumps_native(self.data)
+
+        self.assertTrue(native_utils.loads_native(output).equals(self.data))
+        self.assertTrue(native_utils.load_native_stream(io.BytesIO(output)).equals(self.data))
+
+        with open(self.output_filename, 'wb') as f:
+            f.write(output)
+
+        loaded = native_utils.load_native_file(self.output_filename)
+        self.assertTrue(loaded.equals(self.data))
+        self.assertListEqual(list(loaded.dtypes), list(self.data.dtypes))
+
+    def test_sections_are_aligned(self):
+        """
+        Test every section starts on an aligned offset, so out-of-band buffers can back numpy arrays.
+        """
+        header = native_utils.read_native_header(native_utils.dumps_native(self.data))
+
+        self.assertEqual(header['format_version'], native_utils.NATIVE_FORMAT_VERSION)
+        for offset, length in header['sections']:
+            self.assertEqual(offset % native_utils.ALIGNMENT, 0)
+
+    def test_not_native(self):
+        """
+        Test data in another format is rejected.
+        """
+        with self.assertRaises(FileflowError):
+            native_utils.loads_native(b'"id","name"\n')
+
+    def test_version_mismatch(self):
+        """
+        Test data written with another pandas version fails fast.
+        """
+        output = native_utils.dumps_native(self.data)
+
+        with mock.patch('fileflow.utils.native_utils._versions') as mock_versions:
+            mock_versions.return_value = {'python': native_utils._versions()['python'], 'pandas': '0.0.1'}
+
+            with self.assertRaises(FileflowError):
+                native_utils.loads_native(output)
+
+    def test_newer_format_version(self):
+        """
+        Test data written in a newer format version fails fast.
+        """
+        with mock.patch.object(native_utils, 'NATIVE_FORMAT_VERSION', native_utils.NATIVE_FORMAT_VERSION + 1):
+            output = native_utils.dumps_native(self.data)
+
+        with self.assertRaises(FileflowError):
+            native_utils.loads_native(output)
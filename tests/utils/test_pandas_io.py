@@ -6,10 +6,12 @@
 
 
 from unittest import TestCase
-from fileflow.utils import read_and_clean_csv_to_dataframe, clean_and_write_dataframe_to_csv
+from fileflow.utils import read_and_clean_csv_to_dataframe, clean_and_write_dataframe_to_csv, partition_dataframe, \
+    compact_dataframe
 import numpy as np
 import pandas as pd
 import codecs
+import io
 import os
 import os.path
 from moto import mock_s3
@@ -163,6 +165,88 @@ class TestPandasCsv(TestCase):
 
         # no errors! yay! that means we got around bug from https://github.com/pydata/pandas/issues/12048
 
+    def test_read_projection_and_filters(self):
+        """
+        Test read_and_clean_csv_to_dataframe only keeps the columns asked for, parses them with the dtypes given and
+        drops rows that don't match every filter, a chunk at a time.
+        """
+        csv = u'id,region,revenue,note\n1,east,10.5,a\n2,west,3.0,\n3,east,,c\n4,north,20.0,None\n5,east,7.25,e\n'
+
+        data = read_and_clean_csv_to_dataframe(
+            io.StringIO(csv),
+            usecols=['id', 'revenue', 'note'],
+            dtype={'revenue': float},
+            filters=[('region', 'in', ['east', 'north']), ('revenue', '>', 5)],
+            chunksize=2
+        )
+
+        self.assertListEqual(list(data.columns), ['id', 'revenue', 'note'])
+        self.assertListEqual(list(data['id']), ['1', '4', '5'])
+        self.assertListEqual(list(data['revenue']), [10.5, 20.0, 7.25])
+        self.assertListEqual(list(data['note']), ['a', None, 'e'])
+        self.assertListEqual(list(data.index), [0, 1, 2])
+
+    def test_read_filter_nulls(self):
+        """
+        Test filters compare against cleaned values, so None matches nulls.
+        """
+        csv = u'id,note\n1,a\n2,\n3,None\n'
+
+        data = read_and_clean_csv_to_dataframe(io.StringIO(csv), filters=[('note', '!=', None)])
+
+        self.assertListEqual(list(data['id']), ['1'])
+
+    def test_read_unknown_filter_operator(self):
+        """
+        Test an unknown filter operator is rejected before anything is read.
+        """
+        with self.assertRaises(ValueError):
+            read_and_clean_csv_to_dataframe(self.input_filename, filters=[('a', 'like', 'b')])
+
+    def test_read_filters_with_empty_content(self):
+        """
+        Test filtering a CSV with no content still gives the columns asked for.
+        """
+        data = read_and_clean_csv_to_dataframe(
+            "tests/fixtures/utils/empty_dataframelike_csv.csv",
+            usecols=['column2'],
+            filters=[('column1', '==', 'x')]
+        )
+
+        self.assertListEqual(list(data.columns), ['column2'])
+        self.assertEqual(len(data), 0)
+
+    def test_read_compact(self):
+        """
+        Test compact reads make low cardinality columns categoricals and numeric columns numbers, but leave columns
+        with nulls, and numbers that wouldn't read back the same, as strings.
+        """
+        csv = u'id,status,amount,zip,note\n1,ok,1.5,007,\n2,ok,2,010,x\n3,bad,3,011,y\n4,ok,4,012,z\n'
+
+        data = read_and_clean_csv_to_dataframe(io.StringIO(csv), compact=True, downcast=True)
+
+        self.assertEqual(data['id'].dtype, np.int8)
+        self.assertEqual(data['status'].dtype.name, 'category')
+        self.assertEqual(data['amount'].dtype, np.float64)
+        self.assertListEqual(list(data['zip']), ['007', '010', '011', '012'])
+        self.assertListEqual(list(data['note']), [None, 'x', 'y', 'z'])
+
+        # and they still write out like any other dataframe
+        written = clean_and_write_dataframe_to_csv(data, None).splitlines()
+        self.assertEqual(written[1], '"1","ok","1.5","007","None"')
+
+    def test_compact_dataframe_categories_only(self):
+        """
+        Test compact_dataframe leaves numbers alone unless asked to downcast, and only makes columns with few
+        distinct values categoricals.
+        """
+        data = pd.DataFrame({'id': ['1', '2', '3', '4'], 'status': ['ok', 'ok', 'ok', 'bad']})
+
+        compact_dataframe(data)
+
+        self.assertEqual(data['id'].dtype, object)
+        self.assertEqual(data['status'].dtype.name, 'category')
+
     def test_write_convert_to_none(self):
         """
         Test that clean_and_write_dataframe_to_csv method handles np.NaN's as expected
@@ -192,6 +276,28 @@ class TestPandasCsv(TestCase):
         # we expect a quoted csv field with a \n line terminator at the end
         self.assertEqual(data[1], u'"\ufffd"\n')
 
+    def test_partition_dataframe(self):
+        """
+        Test a dataframe is split by the string values of its partition columns, with nulls in a partition of their
+        own and the partition columns dropped from each part.
+        """
+        df = pd.DataFrame({
+            'region': ['east', 'west', 'east', np.nan],
+            'year': [2016, 2016, 2017, 2016],
+            'value': ['a', 'b', 'c', 'd'],
+        })
+
+        partitions = partition_dataframe(df, ['region', 'year'])
+
+        self.assertListEqual([values for values, rows in partitions], [
+            {'region': None, 'year': '2016'},
+            {'region': 'east', 'year': '2016'},
+            {'region': 'east', 'year': '2017'},
+            {'region': 'west', 'year': '2016'},
+        ])
+        self.assertListEqual([list(rows['value']) for values, rows in partitions], [['d'], ['a'], ['c'], ['b']])
+        self.assertListEqual(list(partitions[0][1].columns), ['value'])
+
     def tearDown(self):
         try:
             os.remove(self.output_filename)